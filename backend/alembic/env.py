@@ -14,7 +14,7 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from app.core.config import settings
 from app.core.database import Base
-from app.models import User, Character, Mission, CompletedMission, Payment
+from app.models import User, Character, Mission, CompletedMission, Payment, ChatMessage, IdempotencyKey, PooledAgent, GenerationJob, StockedAvatarSet
 
 # Alembic Config object
 config = context.config
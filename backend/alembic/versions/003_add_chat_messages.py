@@ -0,0 +1,45 @@
+"""Add chat_messages table for persistent conversation history.
+
+Revision ID: 003_add_chat_messages
+Revises: 002_add_free_generation
+Create Date: 2024-02-01 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = "003_add_chat_messages"
+down_revision: Union[str, None] = "002_add_free_generation"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Create chat_messages table
+    op.create_table(
+        "chat_messages",
+        sa.Column("id", postgresql.UUID(as_uuid=True), primary_key=True),
+        sa.Column("user_id", postgresql.UUID(as_uuid=True), sa.ForeignKey("users.id", ondelete="CASCADE"), nullable=False),
+        sa.Column("character_id", postgresql.UUID(as_uuid=True), sa.ForeignKey("characters.id", ondelete="CASCADE"), nullable=False),
+        sa.Column("role", sa.String(20), nullable=False),
+        sa.Column("content", sa.Text(), nullable=False),
+        sa.Column("emotion", sa.String(20), nullable=True),
+        sa.Column("created_at", sa.DateTime(), nullable=False, server_default=sa.func.now()),
+    )
+
+    # Keyset pagination index: one conversation, chronological order
+    op.create_index(
+        "ix_chat_messages_conversation",
+        "chat_messages",
+        ["user_id", "character_id", "created_at", "id"],
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_chat_messages_conversation", table_name="chat_messages")
+    op.drop_table("chat_messages")
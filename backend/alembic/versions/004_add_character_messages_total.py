@@ -0,0 +1,48 @@
+"""Add messages_total counter to characters table.
+
+Revision ID: 004_add_character_messages_total
+Revises: 003_add_chat_messages
+Create Date: 2024-02-05 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "004_add_character_messages_total"
+down_revision: Union[str, None] = "003_add_chat_messages"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Add messages_total column to characters table
+    op.add_column(
+        "characters",
+        sa.Column(
+            "messages_total",
+            sa.Integer(),
+            nullable=False,
+            server_default="0",
+        ),
+    )
+
+    # Start counters from the stored history
+    op.execute(
+        """
+        UPDATE characters
+        SET messages_total = (
+            SELECT COUNT(*)
+            FROM chat_messages
+            WHERE chat_messages.character_id = characters.id
+              AND chat_messages.role = 'user'
+        )
+        """
+    )
+
+
+def downgrade() -> None:
+    op.drop_column("characters", "messages_total")
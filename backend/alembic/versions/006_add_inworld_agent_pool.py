@@ -0,0 +1,43 @@
+"""Add inworld_agent_pool table for pre-provisioned agents.
+
+Revision ID: 006_add_inworld_agent_pool
+Revises: 005_add_idempotency_keys
+Create Date: 2024-02-12 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = "006_add_inworld_agent_pool"
+down_revision: Union[str, None] = "005_add_idempotency_keys"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Create inworld_agent_pool table
+    op.create_table(
+        "inworld_agent_pool",
+        sa.Column("id", postgresql.UUID(as_uuid=True), primary_key=True),
+        sa.Column("style", sa.String(20), nullable=False),
+        sa.Column("agent_id", sa.String(100), nullable=False, unique=True),
+        sa.Column("scene_id", sa.String(100), nullable=True),
+        sa.Column("created_at", sa.DateTime(), nullable=False, server_default=sa.func.now()),
+    )
+
+    # Agents are taken oldest first per style
+    op.create_index(
+        "ix_inworld_agent_pool_style_created_at",
+        "inworld_agent_pool",
+        ["style", "created_at"],
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_inworld_agent_pool_style_created_at", table_name="inworld_agent_pool")
+    op.drop_table("inworld_agent_pool")
@@ -0,0 +1,60 @@
+"""Add inworld_agent_is_mock flag to characters table.
+
+Revision ID: 007_add_character_agent_is_mock
+Revises: 006_add_inworld_agent_pool
+Create Date: 2024-02-14 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "007_add_character_agent_is_mock"
+down_revision: Union[str, None] = "006_add_inworld_agent_pool"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Add inworld_agent_is_mock column to characters table
+    op.add_column(
+        "characters",
+        sa.Column(
+            "inworld_agent_is_mock",
+            sa.Boolean(),
+            nullable=False,
+            server_default="false",
+        ),
+    )
+
+    # Flag agents created by the fallbacks in create_agent
+    # ("agent_<name>_<8 hex>" with "scene_<name>_<8 hex>") and in character
+    # creation ("mock_agent_<name>" with "mock_scene_<name>"). The scene
+    # must carry the same suffix, so real agents named "Agent ..." are kept.
+    op.execute(
+        """
+        UPDATE characters
+        SET inworld_agent_is_mock = true
+        WHERE inworld_agent_id IS NULL
+           OR (inworld_agent_id ~ '^agent_.+_[0-9a-f]{8}$'
+               AND inworld_scene_id = 'scene_' || substring(inworld_agent_id FROM 7))
+           OR (inworld_agent_id LIKE 'mock\\_agent\\_%'
+               AND inworld_scene_id = 'mock_scene_' || substring(inworld_agent_id FROM 12))
+        """
+    )
+
+    # Partial index for the backfill scan
+    op.create_index(
+        "ix_characters_mock_agents",
+        "characters",
+        ["id"],
+        postgresql_where=sa.text("inworld_agent_is_mock"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_characters_mock_agents", table_name="characters")
+    op.drop_column("characters", "inworld_agent_is_mock")
@@ -0,0 +1,98 @@
+"""Add avatar_hash to characters table and move data URI avatars to the store.
+
+Avatars are written where the store kept them at this revision; set
+AVATAR_STORE_PATH and AVATAR_BASE_URL in the environment (not .env) when
+they differ from the defaults.
+
+Revision ID: 008_add_character_avatar_hash
+Revises: 007_add_character_agent_is_mock
+Create Date: 2024-02-21 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+import base64
+import hashlib
+import os
+import tempfile
+from pathlib import Path
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "008_add_character_avatar_hash"
+down_revision: Union[str, None] = "007_add_character_agent_is_mock"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BATCH_SIZE = 100
+
+# Avatar store layout as of this revision, independent of later app code.
+# A relative AVATAR_STORE_PATH is taken from the backend directory
+BACKEND_DIR = Path(__file__).resolve().parents[2]
+STORE_ROOT = BACKEND_DIR / os.environ.get("AVATAR_STORE_PATH", "./data/avatars")
+BASE_URL = os.environ.get("AVATAR_BASE_URL", "/api/v1/avatars").rstrip("/")
+
+
+def store_avatar(data_uri: str) -> str:
+    """Write a data URI image under its SHA-256 and return the digest."""
+    encoded = data_uri.split(",", 1)[1] if data_uri.startswith("data:") else data_uri
+    data = base64.b64decode(encoded)
+    digest = hashlib.sha256(data).hexdigest()
+
+    target = STORE_ROOT / digest[:2] / digest[2:4] / f"{digest}.png"
+    if target.is_file():
+        return digest
+    target.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=target.parent, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, target)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+    return digest
+
+
+def upgrade() -> None:
+    # Add avatar_hash column to characters table
+    op.add_column(
+        "characters",
+        sa.Column("avatar_hash", sa.String(64), nullable=True),
+    )
+
+    # Write base64 data URI avatars to the avatar store, in key order
+    conn = op.get_bind()
+    last_id = None
+    while True:
+        query = "SELECT id, avatar_url FROM characters WHERE avatar_url LIKE 'data:%'"
+        params = {"limit": BATCH_SIZE}
+        if last_id is not None:
+            query += " AND id > :last_id"
+            params["last_id"] = last_id
+        rows = conn.execute(sa.text(query + " ORDER BY id LIMIT :limit"), params).fetchall()
+        if not rows:
+            break
+
+        conn.execute(
+            sa.text("UPDATE characters SET avatar_hash = :hash, avatar_url = NULL WHERE id = :id"),
+            [{"id": row.id, "hash": store_avatar(row.avatar_url)} for row in rows],
+        )
+        last_id = rows[-1].id
+
+
+def downgrade() -> None:
+    # Keep stored avatars reachable by URL
+    conn = op.get_bind()
+    rows = conn.execute(
+        sa.text("SELECT id, avatar_hash FROM characters WHERE avatar_hash IS NOT NULL")
+    ).fetchall()
+    if rows:
+        conn.execute(
+            sa.text("UPDATE characters SET avatar_url = :url WHERE id = :id"),
+            [{"id": row.id, "url": f"{BASE_URL}/{row.avatar_hash}.png"} for row in rows],
+        )
+
+    op.drop_column("characters", "avatar_hash")
@@ -0,0 +1,60 @@
+"""Add generation_jobs table for background avatar generation.
+
+Revision ID: 009_add_generation_jobs
+Revises: 008_add_character_avatar_hash
+Create Date: 2024-02-26 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = "009_add_generation_jobs"
+down_revision: Union[str, None] = "008_add_character_avatar_hash"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Create generation_jobs table
+    op.create_table(
+        "generation_jobs",
+        sa.Column("id", postgresql.UUID(as_uuid=True), primary_key=True),
+        sa.Column("user_id", postgresql.UUID(as_uuid=True), sa.ForeignKey("users.id", ondelete="CASCADE"), nullable=False),
+        sa.Column("kind", sa.String(20), nullable=False),
+        sa.Column("status", sa.String(20), nullable=False, server_default="queued"),
+        sa.Column("payload", sa.JSON(), nullable=False),
+        sa.Column("result", sa.JSON(), nullable=True),
+        sa.Column("error", sa.Text(), nullable=True),
+        sa.Column("error_code", sa.Integer(), nullable=True),
+        sa.Column("attempts", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("lease_expires_at", sa.DateTime(), nullable=True),
+        sa.Column("created_at", sa.DateTime(), nullable=False, server_default=sa.func.now()),
+        sa.Column("started_at", sa.DateTime(), nullable=True),
+        sa.Column("finished_at", sa.DateTime(), nullable=True),
+        sa.Column("updated_at", sa.DateTime(), nullable=False, server_default=sa.func.now()),
+    )
+
+    # Workers claim the oldest queued job
+    op.create_index(
+        "ix_generation_jobs_status_created_at",
+        "generation_jobs",
+        ["status", "created_at"],
+    )
+
+    # Active jobs are counted per user
+    op.create_index(
+        "ix_generation_jobs_user_id_status",
+        "generation_jobs",
+        ["user_id", "status"],
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_generation_jobs_user_id_status", table_name="generation_jobs")
+    op.drop_index("ix_generation_jobs_status_created_at", table_name="generation_jobs")
+    op.drop_table("generation_jobs")
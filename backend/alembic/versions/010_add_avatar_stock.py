@@ -0,0 +1,42 @@
+"""Add avatar_stock table for pre-generated avatar variant sets.
+
+Revision ID: 010_add_avatar_stock
+Revises: 009_add_generation_jobs
+Create Date: 2024-03-04 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = "010_add_avatar_stock"
+down_revision: Union[str, None] = "009_add_generation_jobs"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Create avatar_stock table
+    op.create_table(
+        "avatar_stock",
+        sa.Column("id", postgresql.UUID(as_uuid=True), primary_key=True),
+        sa.Column("style", sa.String(20), nullable=False),
+        sa.Column("variants", sa.JSON(), nullable=False),
+        sa.Column("created_at", sa.DateTime(), nullable=False, server_default=sa.func.now()),
+    )
+
+    # Sets are taken oldest first per style
+    op.create_index(
+        "ix_avatar_stock_style_created_at",
+        "avatar_stock",
+        ["style", "created_at"],
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_avatar_stock_style_created_at", table_name="avatar_stock")
+    op.drop_table("avatar_stock")
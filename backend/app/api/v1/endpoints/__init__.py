@@ -1,15 +1,19 @@
 """API v1 endpoint routers."""
 
 from app.api.v1.endpoints import auth
+from app.api.v1.endpoints import avatars
 from app.api.v1.endpoints import characters
 from app.api.v1.endpoints import chat
+from app.api.v1.endpoints import jobs
 from app.api.v1.endpoints import missions
 from app.api.v1.endpoints import payments
 
 __all__ = [
     "auth",
+    "avatars",
     "characters",
     "chat",
+    "jobs",
     "missions",
     "payments",
 ]
@@ -26,6 +26,7 @@ from app.core.security import (
 )
 from app.models.user import User
 from app.schemas.user import UserResponse
+from app.services.inworld_service import inworld_service
 
 router = APIRouter(prefix="/auth", tags=["Authentication"])
 
@@ -261,6 +262,9 @@ async def login(
     # Create access token
     access_token = create_access_token(data={"sub": str(user.id)})
     
+    # Warm up InWorld sessions in the background; never delays the login
+    inworld_service.prewarm_user_sessions(str(user.id))
+    
     return LoginResponse(
         access_token=access_token,
         token_type="bearer",
@@ -0,0 +1,108 @@
+"""Stored avatar image endpoints."""
+
+from pathlib import Path
+from typing import Optional
+
+from fastapi import APIRouter, Header, HTTPException, Query, Response, status
+from fastapi.responses import FileResponse
+
+from app.imaging.render import MEDIA_TYPES
+from app.services.avatar_derivatives import avatar_derivatives
+from app.services.avatar_store import avatar_store
+
+router = APIRouter(prefix="/avatars", tags=["Avatars"])
+
+# Stored avatars never change; their URL is their content hash
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+def _image_response(
+    path: Path,
+    media_type: str,
+    etag: str,
+    if_none_match: Optional[str],
+    vary_accept: bool = False,
+) -> Response:
+    """Serve an immutable image file, or 304 if the client has it."""
+    headers = {"Cache-Control": IMMUTABLE_CACHE_CONTROL, "ETag": etag}
+    if vary_accept:
+        headers["Vary"] = "Accept"
+    
+    if if_none_match == etag:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    
+    return FileResponse(path, media_type=media_type, headers=headers)
+
+
+@router.get("/{digest}_{size:int}.{fmt}", response_class=FileResponse)
+async def get_avatar_derivative(
+    digest: str,
+    size: int,
+    fmt: str,
+    if_none_match: Optional[str] = Header(None),
+) -> Response:
+    """
+    Get a stored avatar at a smaller size and in another format.
+    
+    Derivatives are rendered when an avatar is stored, or on first request.
+    
+    Args:
+        digest: SHA-256 hex digest from the avatar URL
+        size: Configured width in pixels (e.g. 64, 128, 256, 512)
+        fmt: Configured format (avif, webp, png)
+    
+    Returns:
+        Image in the requested format
+    """
+    path = await avatar_derivatives.path(digest, size, fmt)
+    
+    if path is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Avatar not found",
+        )
+    
+    return _image_response(path, MEDIA_TYPES[fmt], f'"{digest}_{size}.{fmt}"', if_none_match)
+
+
+@router.get("/{digest}.png", response_class=FileResponse)
+async def get_avatar(
+    digest: str,
+    size: Optional[int] = Query(None, ge=1, description="Display width; picks the nearest larger derivative"),
+    accept: Optional[str] = Header(None),
+    if_none_match: Optional[str] = Header(None),
+) -> Response:
+    """
+    Get a stored avatar image by its SHA-256 hash.
+    
+    Avatar URLs are content hashes, so they are public and cacheable
+    forever; a matching If-None-Match gets 304 Not Modified.
+    
+    With ``?size=`` the smallest derivative at least that wide is served,
+    in the best format the Accept header allows (AVIF, then WebP, then PNG).
+    
+    Args:
+        digest: SHA-256 hex digest from the avatar URL
+        size: Optional display width in pixels
+    
+    Returns:
+        PNG image, or a derivative when a size is given
+    """
+    if size is not None:
+        target = avatar_derivatives.size_for(size)
+        fmt = avatar_derivatives.negotiate(accept)
+        if target is not None and fmt is not None:
+            path = await avatar_derivatives.path(digest, target, fmt)
+            if path is not None:
+                etag = f'"{digest}_{target}.{fmt}"'
+                return _image_response(path, MEDIA_TYPES[fmt], etag, if_none_match, vary_accept=True)
+    
+    path = avatar_store.path(digest)
+    
+    if path is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Avatar not found",
+        )
+    
+    return _image_response(path, "image/png", f'"{digest}"', if_none_match, vary_accept=size is not None)
@@ -1,13 +1,14 @@
 """Character management endpoints - Avatar Studio API."""
 
-from typing import List, Optional
+import asyncio
+from typing import Any, Dict, List, Optional
 from uuid import UUID
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, Header, HTTPException, status
 from pydantic import BaseModel, Field
 from sqlalchemy.orm import Session
 
-from app.core.database import get_db
+from app.core.database import SessionLocal, get_db
 from app.core.security import get_current_user
 from app.models.character import Character
 from app.models.user import User
@@ -17,8 +18,17 @@ from app.schemas.character import (
     CharacterResponse,
     CharacterStyle,
 )
+from app.schemas.generation_job import GenerationJobKind, GenerationJobResponse
+from app.services.agent_pool import agent_pool
+from app.services.avatar_stock import avatar_stock
+from app.services.avatar_store import avatar_store
+from app.services.chat_writer import chat_writer
+from app.services.conversation_cache import conversation_cache
+from app.services.generation_jobs import JobContext, generation_jobs
+from app.services.idempotency import idempotency_service
 from app.services.sd_service import sd_service
 from app.services.inworld_service import inworld_service
+from app.services.param_buffer import param_buffer
 
 router = APIRouter(prefix="/characters", tags=["Characters"])
 
@@ -31,6 +41,12 @@ GENERATION_COST_NTG = 100  # Cost for avatar generation after free tier
 MAX_CHARACTERS_FREE = 3    # Maximum characters for free users
 
 
+def _set_avatar(character: Character, url: Optional[str]) -> None:
+    """Point a character at an avatar, keeping only the hash of stored ones."""
+    character.avatar_hash = avatar_store.hash_from_url(url)
+    character.avatar_url = None if character.avatar_hash else url
+
+
 # ============================================================================
 # Request/Response Schemas for Avatar Studio
 # ============================================================================
@@ -74,6 +90,7 @@ class GenerateVariantsRequest(BaseModel):
     
     style: str = Field(description="Visual style: anime, cyberpunk, fantasy")
     prompt: Optional[str] = Field(None, max_length=500, description="Appearance prompt")
+    fresh: bool = Field(False, description="Generate new images instead of reusing a cached set")
 
 
 class GenerateVariantsResponse(BaseModel):
@@ -155,37 +172,80 @@ async def get_generation_quota(
     )
 
 
-@router.post("/create", response_model=CharacterWithVariantsResponse, status_code=status.HTTP_201_CREATED)
+@router.post("/create", response_model=GenerationJobResponse, status_code=status.HTTP_202_ACCEPTED)
 async def create_character_with_generation(
     request: CreateCharacterRequest,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key", max_length=255),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
-) -> CharacterWithVariantsResponse:
+) -> GenerationJobResponse:
     """
     Create a new character with AI-generated avatar variants.
     
     This endpoint:
     1. Checks user has free generation quota (1 free per account) OR sufficient NTG balance
     2. Checks user has character slots available (max 3)
-    3. Generates 4 avatar variants using Stable Diffusion
-    4. Creates InWorld AI agent for conversation
-    5. Saves character to database with initial params
-    6. Returns character with all variants
+    3. Queues a generation job and returns it
+    
+    The job then:
+    1. Generates 4 avatar variants using Stable Diffusion (without a
+       prompt, a pre-generated set is used when one is in stock)
+    2. Creates InWorld AI agent for conversation
+    3. Saves character to database with initial params, charging the user
+    
+    Poll ``GET /jobs/{job_id}`` or follow ``GET /jobs/{job_id}/events``;
+    the result of a succeeded job is the character with all variants.
+    
+    Send an ``Idempotency-Key`` header to make retries safe: a repeated
+    key returns the same job instead of generating and charging again.
     
     Args:
         request: Name, style, and optional appearance prompt
         
     Returns:
-        Character data with 4 avatar variant URLs
+        Queued generation job
         
     Raises:
-        400: Maximum characters reached or insufficient balance
+        400: Maximum characters reached or invalid style
         402: Payment required (no free generation and insufficient NTG)
-        500: Generation failed
+        429: Too many generations in progress
+    """
+    return await idempotency_service.run(
+        current_user.id,
+        idempotency_key,
+        "POST /characters/create",
+        request,
+        lambda: _submit_create_job(request, db, current_user),
+    )
+
+
+async def _submit_create_job(
+    request: CreateCharacterRequest,
+    db: Session,
+    current_user: User,
+) -> GenerationJobResponse:
+    """Queue create_character_with_generation once for an idempotency key."""
+    _check_can_create(db, current_user)
+    _validate_style(request.style)
+    
+    job = await generation_jobs.submit(
+        current_user.id,
+        GenerationJobKind.CREATE.value,
+        request.model_dump(mode="json"),
+    )
+    return GenerationJobResponse.from_orm_model(job, await generation_jobs.queue_position(job))
+
+
+def _check_can_create(db: Session, user: User) -> bool:
+    """
+    Check the character limit and generation quota.
+    
+    Returns:
+        Whether the user's free generation would be used
     """
     # Check character limit (3 for free users)
     existing_count = db.query(Character).filter(
-        Character.user_id == current_user.id
+        Character.user_id == user.id
     ).count()
     
     if existing_count >= MAX_CHARACTERS_FREE:
@@ -195,122 +255,216 @@ async def create_character_with_generation(
         )
     
     # Check free generation quota or NTG balance
-    using_free_generation = False
-    if current_user.has_free_generation():
-        using_free_generation = True
-    elif not current_user.has_sufficient_balance(GENERATION_COST_NTG):
+    if user.has_free_generation():
+        return True
+    if not user.has_sufficient_balance(GENERATION_COST_NTG):
         raise HTTPException(
             status_code=status.HTTP_402_PAYMENT_REQUIRED,
             detail=f"Insufficient NTG balance. Character creation costs {GENERATION_COST_NTG} NTG. "
-                   f"Your balance: {current_user.balance_ntg} NTG.",
+                   f"Your balance: {user.balance_ntg} NTG.",
         )
-    
-    # Validate style
+    return False
+
+
+def _validate_style(style: str) -> str:
+    """Normalize a visual style, rejecting unknown ones."""
     valid_styles = ["anime", "cyberpunk", "fantasy"]
-    style = request.style.lower()
+    style = style.lower()
     if style not in valid_styles:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=f"Invalid style. Must be one of: {', '.join(valid_styles)}",
         )
-    
-    # Generate avatar variants
+    return style
+
+
+async def _generate_variants(style: str, prompt: Optional[str], fresh: bool = False) -> List[str]:
+    """Generate avatar variants, falling back to placeholders."""
     try:
-        variants = await sd_service.generate_portraits(
+        return await sd_service.generate_portraits(
             style=style,
-            prompt=request.prompt or "",
+            prompt=prompt or "",
+            fresh=fresh,
         )
     except Exception as e:
         print(f"Avatar generation failed: {e}")
-        # Use fallback placeholders
-        variants = sd_service.get_placeholder_avatars(style, 4)
-    
-    # Create InWorld AI agent
+        return sd_service.get_placeholder_avatars(style, 4)
+
+
+async def _provision_agent(style: str, name: str) -> Dict[str, Any]:
+    """Create InWorld AI agent, taking a pre-provisioned one when available."""
     try:
-        inworld_data = await inworld_service.create_agent(
-            name=request.name,
-            style=style,
-        )
+        inworld_data = await agent_pool.take(style, name)
+        if inworld_data is None:
+            inworld_data = await inworld_service.create_agent(
+                name=name,
+                style=style,
+            )
+        return inworld_data
     except Exception as e:
         print(f"InWorld agent creation failed: {e}")
-        inworld_data = {
-            "agent_id": f"mock_agent_{request.name.lower()}",
-            "scene_id": f"mock_scene_{request.name.lower()}",
+        return {
+            "agent_id": f"mock_agent_{name.lower()}",
+            "scene_id": f"mock_scene_{name.lower()}",
+            "mock": True,
         }
+
+
+def _check_job_can_create(job: JobContext) -> None:
+    """Check the character limit and generation quota of a job's user."""
+    db = SessionLocal()
+    try:
+        current_user = db.query(User).filter(User.id == job.user_id).first()
+        if current_user is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="User not found",
+            )
+        _check_can_create(db, current_user)
+    finally:
+        db.close()
+
+
+async def _run_create_job(job: JobContext) -> Dict[str, Any]:
+    """Generate avatars and create the character of a create job."""
+    request = CreateCharacterRequest.model_validate(job.payload)
+    style = request.style.lower()
     
-    # Deduct cost or use free generation
-    if using_free_generation:
-        current_user.use_free_generation()
-    else:
-        current_user.deduct_balance(GENERATION_COST_NTG)
-    
-    # Create character with first variant as default and initial params
-    character = Character(
-        user_id=current_user.id,
-        name=request.name,
-        style=style,
-        avatar_url=variants[0] if variants else None,
-        inworld_agent_id=inworld_data.get("agent_id"),
-        inworld_scene_id=inworld_data.get("scene_id"),
-        params_energy=100,
-        params_mood=100,
-        params_bond=0,
-    )
-    
-    db.add(character)
-    db.commit()
-    db.refresh(character)
+    # Checked before generating or taking anything from the stock and pool;
+    # _save_character checks again under the user lock
+    await asyncio.to_thread(_check_job_can_create, job)
     
-    return CharacterWithVariantsResponse(
-        character_id=str(character.id),
-        name=character.name,
-        style=character.style,
-        avatar_url=character.avatar_url,
-        variants=variants,
-        inworld_scene_id=character.inworld_scene_id,
-        inworld_agent_id=character.inworld_agent_id,
-        params={
-            "energy": character.params_energy,
-            "mood": character.params_mood,
-            "bond": character.params_bond,
-        },
-    )
+    # Without a prompt, take a pre-generated set when one is in stock
+    stocked = await avatar_stock.take(style, request.prompt)
+    inworld_data: Dict[str, Any] = {}
+    saved = False
+    try:
+        variants = stocked if stocked is not None else await _generate_variants(style, request.prompt)
+        inworld_data = await _provision_agent(style, request.name)
+        
+        save = asyncio.ensure_future(
+            asyncio.to_thread(_save_character, job, request, style, variants, inworld_data)
+        )
+        try:
+            result = await asyncio.shield(save)
+        except asyncio.CancelledError:
+            # Stopping cancels the job, but the save runs on in its thread;
+            # wait for it to know whether the set and agent were used
+            await asyncio.wait([save])
+            saved = save.exception() is None
+            raise
+        saved = True
+        return result
+    finally:
+        # Nothing was saved (failed or cancelled); return what was taken so it is not lost
+        if not saved:
+            if stocked is not None:
+                await avatar_stock.put_back(style, stocked)
+            if inworld_data.get("pooled"):
+                await agent_pool.put_back(style, inworld_data)
+
+
+def _save_character(
+    job: JobContext,
+    request: CreateCharacterRequest,
+    style: str,
+    variants: List[str],
+    inworld_data: Dict[str, Any],
+) -> Dict[str, Any]:
+    """Charge the user and store the character, completing the job in the same transaction."""
+    db = SessionLocal()
+    try:
+        # Lock the user so concurrent jobs see each other's charges
+        current_user = db.query(User).filter(User.id == job.user_id).with_for_update().first()
+        if current_user is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="User not found",
+            )
+        
+        # Checked again: other characters may have been created since queueing
+        using_free_generation = _check_can_create(db, current_user)
+        
+        # Deduct cost or use free generation
+        if using_free_generation:
+            current_user.use_free_generation()
+        else:
+            current_user.deduct_balance(GENERATION_COST_NTG)
+        
+        # Create character with first variant as default and initial params
+        character = Character(
+            user_id=current_user.id,
+            name=request.name,
+            style=style,
+            inworld_agent_id=inworld_data.get("agent_id"),
+            inworld_scene_id=inworld_data.get("scene_id"),
+            inworld_agent_is_mock=bool(inworld_data.get("mock")),
+            params_energy=100,
+            params_mood=100,
+            params_bond=0,
+        )
+        _set_avatar(character, variants[0] if variants else None)
+        
+        db.add(character)
+        db.flush()
+        
+        result = CharacterWithVariantsResponse(
+            character_id=str(character.id),
+            name=character.name,
+            style=character.style,
+            avatar_url=avatar_store.resolve(character.avatar_hash, character.avatar_url),
+            variants=variants,
+            inworld_scene_id=character.inworld_scene_id,
+            inworld_agent_id=character.inworld_agent_id,
+            params={
+                "energy": character.params_energy,
+                "mood": character.params_mood,
+                "bond": character.params_bond,
+            },
+        ).model_dump(mode="json")
+        
+        generation_jobs.complete(db, job, result)
+        db.commit()
+        return result
+    finally:
+        db.close()
 
 
-@router.post("/generate-variants", response_model=GenerateVariantsResponse)
+@router.post("/generate-variants", response_model=GenerationJobResponse, status_code=status.HTTP_202_ACCEPTED)
 async def generate_avatar_variants(
     request: GenerateVariantsRequest,
     current_user: User = Depends(get_current_user),
-) -> GenerateVariantsResponse:
+) -> GenerationJobResponse:
     """
     Generate 4 new avatar variants without creating a character.
     
-    Useful for regenerating options before finalizing.
+    Useful for regenerating options before finalizing. Generation runs as
+    a job; the result of a succeeded job is the list of variants.
     
     Args:
         request: Style and optional appearance prompt
         
     Returns:
-        List of 4 avatar URLs
+        Queued generation job
     """
-    valid_styles = ["anime", "cyberpunk", "fantasy"]
-    style = request.style.lower()
-    if style not in valid_styles:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"Invalid style. Must be one of: {', '.join(valid_styles)}",
-        )
-    
-    try:
-        variants = await sd_service.generate_portraits(
-            style=style,
-            prompt=request.prompt or "",
-        )
-    except Exception as e:
-        print(f"Avatar generation failed: {e}")
-        variants = sd_service.get_placeholder_avatars(style, 4)
+    style = _validate_style(request.style)
     
-    return GenerateVariantsResponse(variants=variants)
+    job = await generation_jobs.submit(
+        current_user.id,
+        GenerationJobKind.VARIANTS.value,
+        {"style": style, "prompt": request.prompt, "fresh": request.fresh},
+    )
+    return GenerationJobResponse.from_orm_model(job, await generation_jobs.queue_position(job))
+
+
+async def _run_variants_job(job: JobContext) -> Dict[str, Any]:
+    """Generate the avatar variants of a variants or regenerate job."""
+    variants = await _generate_variants(
+        job.payload["style"],
+        job.payload.get("prompt"),
+        job.payload.get("fresh", False),
+    )
+    return GenerateVariantsResponse(variants=variants).model_dump(mode="json")
 
 
 @router.patch("/{character_id}/select-variant", response_model=CharacterResponse)
@@ -341,11 +495,11 @@ async def select_avatar_variant(
             detail="Character not found",
         )
     
-    character.avatar_url = request.variant_url
+    _set_avatar(character, request.variant_url)
     db.commit()
     db.refresh(character)
     
-    return CharacterResponse.from_orm_model(character)
+    return CharacterResponse.from_orm_model(param_buffer.overlay(character))
 
 
 @router.patch("/{character_id}/finalize", response_model=CharacterResponse)
@@ -380,7 +534,7 @@ async def finalize_character(
     db.commit()
     db.refresh(character)
     
-    return CharacterResponse.from_orm_model(character)
+    return CharacterResponse.from_orm_model(param_buffer.overlay(character))
 
 
 # ============================================================================
@@ -402,7 +556,7 @@ async def get_characters(
         Character.user_id == current_user.id
     ).order_by(Character.created_at.desc()).all()
     
-    return [CharacterResponse.from_orm_model(c) for c in characters]
+    return [CharacterResponse.from_orm_model(param_buffer.overlay(c)) for c in characters]
 
 
 @router.get("/my", response_model=PaginatedCharactersResponse)
@@ -436,7 +590,7 @@ async def get_my_characters(
     ).order_by(Character.created_at.desc()).offset(skip).limit(limit).all()
     
     return PaginatedCharactersResponse(
-        characters=[CharacterResponse.from_orm_model(c) for c in characters],
+        characters=[CharacterResponse.from_orm_model(param_buffer.overlay(c)) for c in characters],
         total=total,
         skip=skip,
         limit=limit,
@@ -470,7 +624,13 @@ async def get_character(
             detail="Character not found",
         )
     
-    return CharacterResponse.from_orm_model(character)
+    # Opening a character usually precedes chatting with it
+    inworld_service.prewarm_session(
+        user_id=str(current_user.id),
+        character_id=character.inworld_agent_id or "default",
+    )
+    
+    return CharacterResponse.from_orm_model(param_buffer.overlay(character))
 
 
 @router.patch("/{character_id}", response_model=CharacterResponse)
@@ -504,12 +664,12 @@ async def update_character(
     if character_data.name is not None:
         character.name = character_data.name
     if character_data.avatar_url is not None:
-        character.avatar_url = character_data.avatar_url
+        _set_avatar(character, character_data.avatar_url)
     
     db.commit()
     db.refresh(character)
     
-    return CharacterResponse.from_orm_model(character)
+    return CharacterResponse.from_orm_model(param_buffer.overlay(character))
 
 
 @router.delete("/{character_id}", status_code=status.HTTP_204_NO_CONTENT)
@@ -535,26 +695,39 @@ async def delete_character(
             detail="Character not found",
         )
     
+    # Write queued chat turns first; they reference the character
+    cache_key = conversation_cache.make_key(current_user.id, character.id)
+    if chat_writer.has_pending(cache_key):
+        await chat_writer.wait_idle()
+    
     db.delete(character)
     db.commit()
+    conversation_cache.invalidate(cache_key)
 
 
-@router.post("/{character_id}/regenerate-avatar", response_model=GenerateVariantsResponse)
+@router.post(
+    "/{character_id}/regenerate-avatar",
+    response_model=GenerationJobResponse,
+    status_code=status.HTTP_202_ACCEPTED,
+)
 async def regenerate_avatar(
     character_id: UUID,
     request: GenerateVariantsRequest,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
-) -> GenerateVariantsResponse:
+) -> GenerationJobResponse:
     """
     Generate new avatar variants for an existing character.
     
+    Generation runs as a job; the result of a succeeded job is the list
+    of 4 new avatar URLs.
+    
     Args:
         character_id: UUID of the character
         request: Style and optional prompt
         
     Returns:
-        List of 4 new avatar URLs
+        Queued generation job
     """
     character = db.query(Character).filter(
         Character.id == character_id,
@@ -567,13 +740,20 @@ async def regenerate_avatar(
             detail="Character not found",
         )
     
-    try:
-        variants = await sd_service.generate_portraits(
-            style=request.style or character.style,
-            prompt=request.prompt or "",
-        )
-    except Exception as e:
-        print(f"Avatar regeneration failed: {e}")
-        variants = sd_service.get_placeholder_avatars(character.style, 4)
-    
-    return GenerateVariantsResponse(variants=variants)
+    job = await generation_jobs.submit(
+        current_user.id,
+        GenerationJobKind.REGENERATE.value,
+        {
+            "character_id": str(character.id),
+            "style": request.style or character.style,
+            "prompt": request.prompt,
+            # Asked for other avatars, so skip the cached set
+            "fresh": True,
+        },
+    )
+    return GenerationJobResponse.from_orm_model(job, await generation_jobs.queue_position(job))
+
+
+generation_jobs.register(GenerationJobKind.CREATE.value, _run_create_job)
+generation_jobs.register(GenerationJobKind.VARIANTS.value, _run_variants_job)
+generation_jobs.register(GenerationJobKind.REGENERATE.value, _run_variants_job)
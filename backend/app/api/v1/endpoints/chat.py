@@ -1,18 +1,28 @@
 """Chat endpoints for character conversations."""
 
+import asyncio
+import json
 from datetime import datetime
 from typing import List, Dict, Any, Optional
-from uuid import UUID, uuid4
+from uuid import UUID
 
-from fastapi import APIRouter, Depends, HTTPException, status
-from pydantic import BaseModel, Field
+from fastapi import APIRouter, Depends, Header, HTTPException, WebSocket, WebSocketDisconnect, status
+from pydantic import BaseModel, Field, ValidationError
 from sqlalchemy.orm import Session
 
-from app.core.database import get_db
-from app.core.security import get_current_user
+from app.core.database import SessionLocal, get_db
+from app.core.security import get_current_user, get_user_from_token
 from app.models.character import Character
 from app.models.user import User
+from app.services.chat_history import chat_history_service
+from app.services.chat_writer import chat_writer
+from app.services.conversation_cache import conversation_cache
+from app.services.fallback_responses import fallback_responder
+from app.services.idempotency import idempotency_service
 from app.services.inworld_service import inworld_service
+from app.services.message_analysis import analyze_message
+from app.services.param_buffer import param_buffer
+from app.services.response_cache import response_cache
 
 router = APIRouter(prefix="/chat", tags=["Chat"])
 
@@ -24,8 +34,6 @@ router = APIRouter(prefix="/chat", tags=["Chat"])
 ENERGY_COST_PER_MESSAGE = 1       # Energy deducted per message
 MOOD_POSITIVE_BOOST = 2           # Mood increase for positive sentiment
 MOOD_NEGATIVE_PENALTY = 1         # Mood decrease for negative sentiment
-BOND_INCREMENT = 1                # Bond increase amount
-BOND_INCREMENT_EVERY_N_MESSAGES = 10  # Bond increases every N messages
 MAX_MESSAGES_HISTORY = 50         # Max messages to return in history
 
 
@@ -42,6 +50,18 @@ class ChatMessage(BaseModel):
     content: str = Field(description="Message content")
     emotion: Optional[str] = Field(None, description="Character emotion for assistant messages")
     created_at: datetime = Field(description="Message timestamp")
+    
+    @classmethod
+    def from_orm_model(cls, model) -> "ChatMessage":
+        """Convert ORM model to response schema."""
+        return cls(
+            id=str(model.id),
+            character_id=str(model.character_id),
+            role=model.role,
+            content=model.content,
+            emotion=model.emotion,
+            created_at=model.created_at,
+        )
 
 
 class SendMessageRequest(BaseModel):
@@ -91,45 +111,27 @@ class SendMessageResponse(BaseModel):
 
 
 class ChatHistoryResponse(BaseModel):
-    """Schema for chat history response."""
+    """
+    Schema for chat history response.
     
-    items: List[ChatMessage] = Field(description="Messages in current page")
-    total: int = Field(description="Total number of messages")
-    page: int = Field(description="Current page number")
+    Cursor pages (``before``/``after``) skip the COUNT query, so ``total``,
+    ``page`` and ``total_pages`` are only set for offset pagination. To page
+    further, pass the ``id`` of the first item as ``before`` or of the last
+    item as ``after``.
+    """
+    
+    items: List[ChatMessage] = Field(description="Messages in current page, oldest first")
+    total: Optional[int] = Field(None, description="Total number of messages (offset pagination only)")
+    page: Optional[int] = Field(None, description="Current page number (offset pagination only)")
     page_size: int = Field(description="Messages per page")
-    total_pages: int = Field(description="Total number of pages")
-
-
-# ============================================================================
-# In-memory storage (in production, use a database table)
-# ============================================================================
-
-# Session key -> list of messages
-chat_sessions: Dict[str, List[ChatMessage]] = {}
-
-# Session key -> message count (for bond calculation)
-message_counts: Dict[str, int] = {}
+    total_pages: Optional[int] = Field(None, description="Total number of pages (offset pagination only)")
+    has_more: bool = Field(False, description="Whether more messages exist in the paging direction")
 
 
 # ============================================================================
 # Sentiment Analysis
 # ============================================================================
 
-POSITIVE_KEYWORDS = [
-    "хорошо", "отлично", "люблю", "класс", "супер", "ура", "круто",
-    "прекрасно", "замечательно", "восхитительно", "радость", "счастье",
-    "love", "great", "awesome", "amazing", "wonderful", "happy", "good",
-    "excellent", "fantastic", "beautiful", "nice", "perfect", "best",
-]
-
-NEGATIVE_KEYWORDS = [
-    "плохо", "грустно", "скучно", "злой", "ненавижу", "устал", "печаль",
-    "ужас", "отстой", "тоска", "обидно", "разочарование",
-    "bad", "sad", "angry", "hate", "tired", "boring", "awful", "terrible",
-    "upset", "disappointed", "annoyed", "frustrated", "unhappy",
-]
-
-
 def analyze_sentiment(message: str) -> str:
     """
     Analyze message sentiment.
@@ -137,16 +139,7 @@ def analyze_sentiment(message: str) -> str:
     Returns:
         'positive', 'negative', or 'neutral'
     """
-    message_lower = message.lower()
-    
-    positive_count = sum(1 for word in POSITIVE_KEYWORDS if word in message_lower)
-    negative_count = sum(1 for word in NEGATIVE_KEYWORDS if word in message_lower)
-    
-    if positive_count > negative_count:
-        return "positive"
-    elif negative_count > positive_count:
-        return "negative"
-    return "neutral"
+    return analyze_message(message).sentiment
 
 
 def determine_emotion(message: str, character_energy: int) -> str:
@@ -160,21 +153,93 @@ def determine_emotion(message: str, character_energy: int) -> str:
     if character_energy < 30:
         return "tired"
     
-    message_lower = message.lower()
+    return analyze_message(message).emotion or "neutral"
+
+
+def calculate_param_changes(message: str, messages_total: int) -> ParamsUpdated:
+    """
+    Calculate character parameter changes for one user message.
+    
+    - energy: -1 per message
+    - mood: +2 if positive sentiment, -1 if negative
+    - bond: +1 every 10 messages (see Character.bond_for_messages)
+    
+    Args:
+        message: The user's message
+        messages_total: Character's message counter before this message
+    
+    Returns:
+        Parameter changes to apply
+    """
+    sentiment = analyze_sentiment(message)
+    
+    # Mood change based on sentiment
+    if sentiment == "positive":
+        mood_change = MOOD_POSITIVE_BOOST
+    elif sentiment == "negative":
+        mood_change = -MOOD_NEGATIVE_PENALTY
+    else:
+        mood_change = 0
     
-    # Check for excitement
-    if any(word in message_lower for word in ["ура", "круто", "супер", "wow", "amazing", "awesome"]):
-        return "excited"
+    return ParamsUpdated(
+        energy=-ENERGY_COST_PER_MESSAGE,
+        mood=mood_change,
+        # Bond increases every N messages
+        bond=Character.bond_for_messages(messages_total, 1),
+    )
+
+
+async def save_chat_turn(
+    user: User,
+    character: Character,
+    message: str,
+    response_content: str,
+    emotion: str,
+    params_updated: ParamsUpdated,
+) -> None:
+    """
+    Store a user message and the character's reply, and apply parameter changes.
     
-    # Check for sadness
-    if any(word in message_lower for word in ["грустно", "печаль", "sad", "upset", "sorry"]):
-        return "sad"
+    Messages are queued for the background writer and appended to the
+    conversation cache right away; parameter changes go through the
+    write-behind buffer. Neither waits for the database unless the write
+    queue is full.
     
-    # Check for happiness
-    if any(word in message_lower for word in ["хорошо", "отлично", "люблю", "good", "great", "love", "happy"]):
-        return "happy"
+    Args:
+        user: Conversation owner
+        character: Character being chatted with
+        message: The user's message
+        response_content: The character's reply
+        emotion: Character emotion for the reply
+        params_updated: Parameter changes to apply
+    """
+    user_record = chat_history_service.new_message(
+        user_id=user.id,
+        character_id=character.id,
+        role="user",
+        content=message,
+    )
+    assistant_record = chat_history_service.new_message(
+        user_id=user.id,
+        character_id=character.id,
+        role="assistant",
+        content=response_content,
+        emotion=emotion,
+    )
+    
+    # Apply parameter changes; bond follows from the message counter
+    param_buffer.record(
+        character,
+        energy=params_updated.energy,
+        mood=params_updated.mood,
+        messages=1,
+    )
+    
+    await chat_writer.enqueue([user_record, assistant_record])
     
-    return "neutral"
+    cache_key = conversation_cache.make_key(user.id, character.id)
+    conversation_cache.append(cache_key, ChatMessage.from_orm_model(user_record))
+    conversation_cache.append(cache_key, ChatMessage.from_orm_model(assistant_record))
 
 
 # ============================================================================
@@ -185,6 +250,7 @@ def determine_emotion(message: str, character_energy: int) -> str:
 async def chat_with_character(
     character_id: UUID,
     request: SendMessageRequest,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key", max_length=255),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ) -> ChatResponse:
@@ -203,16 +269,35 @@ async def chat_with_character(
     4. Log conversation
     5. Return AI response with emotion
     
+    Send an ``Idempotency-Key`` header to make retries safe: a repeated
+    key returns the stored response instead of sending the message again.
+    
     Args:
         character_id: UUID of the character to chat with
         request: Message content and optional session_id
-        
+    
     Returns:
         AI response with emotion and parameter updates
-        
+    
     Raises:
         404: Character not found or doesn't belong to user
     """
+    return await idempotency_service.run(
+        current_user.id,
+        idempotency_key,
+        f"POST /chat/{character_id}/chat",
+        request,
+        lambda: _chat_with_character(character_id, request, db, current_user),
+    )
+
+
+async def _chat_with_character(
+    character_id: UUID,
+    request: SendMessageRequest,
+    db: Session,
+    current_user: User,
+) -> ChatResponse:
+    """Run chat_with_character once for an idempotency key."""
     # Verify character belongs to user
     character = db.query(Character).filter(
         Character.id == character_id,
@@ -225,103 +310,252 @@ async def chat_with_character(
             detail="Character not found",
         )
     
+    param_buffer.overlay(character)
+    
     # Get or create session
     session_id = request.session_id or f"{current_user.id}_{character_id}"
-    if session_id not in chat_sessions:
-        chat_sessions[session_id] = []
-        message_counts[session_id] = 0
     
-    # Store user message
-    user_message = ChatMessage(
-        id=str(uuid4()),
-        character_id=str(character_id),
-        role="user",
-        content=request.message,
-        created_at=datetime.utcnow(),
+    # Get AI response, reusing a cached reply to stock phrases
+    agent_id = character.inworld_agent_id or "default"
+    cache_key = response_cache.key_for(
+        request.message, agent_id, character.params_energy, character.params_mood,
     )
-    chat_sessions[session_id].append(user_message)
-    message_counts[session_id] += 1
+    cached = response_cache.get(cache_key)
     
-    # Analyze sentiment
-    sentiment = analyze_sentiment(request.message)
-    
-    # Get AI response
-    try:
-        await inworld_service.create_session(
-            user_id=str(current_user.id),
-            character_id=character.inworld_agent_id or "default",
-        )
-        
-        response = await inworld_service.send_message(
-            message=request.message,
-            session_id=session_id,
-            character_id=character.inworld_agent_id or "default",
-        )
-        
-        response_content = response.get("content", "I'm thinking...")
+    if cached:
+        response_content = cached["content"]
+    else:
+        try:
+            inworld_session_id = await inworld_service.create_session(
+                user_id=str(current_user.id),
+                character_id=agent_id,
+            )
+            
+            response = await inworld_service.send_message(
+                message=request.message,
+                session_id=inworld_session_id,
+                character_id=agent_id,
+            )
+            
+            response_content = response.get("content", "I'm thinking...")
+            if not response.get("mock"):
+                response_cache.put(cache_key, response)
         
-    except Exception as e:
-        print(f"InWorld error: {e}")
-        response_content = get_mock_response(request.message, character.name)
+        except Exception as e:
+            print(f"InWorld error: {e}")
+            response_content = get_mock_reply(request.message, character)["content"]
     
     # Determine emotion based on message and character state
     emotion = determine_emotion(request.message, character.params_energy)
-    
-    # Calculate parameter changes
-    energy_change = -ENERGY_COST_PER_MESSAGE
-    
-    # Mood change based on sentiment
-    if sentiment == "positive":
-        mood_change = MOOD_POSITIVE_BOOST
-    elif sentiment == "negative":
-        mood_change = -MOOD_NEGATIVE_PENALTY
-    else:
-        mood_change = 0
-    
-    # Bond increases every N messages
-    total_messages = message_counts[session_id]
-    if total_messages % BOND_INCREMENT_EVERY_N_MESSAGES == 0:
-        bond_change = BOND_INCREMENT
-    else:
-        bond_change = 0
-    
-    # Apply parameter changes
-    character.update_energy(energy_change)
-    character.update_mood(mood_change)
-    if bond_change > 0:
-        character.update_bond(bond_change)
-    
-    db.commit()
-    db.refresh(character)
-    
-    # Store assistant message
-    assistant_message = ChatMessage(
-        id=str(uuid4()),
-        character_id=str(character_id),
-        role="assistant",
-        content=response_content,
-        emotion=emotion,
-        created_at=datetime.utcnow(),
+    params_updated = calculate_param_changes(request.message, character.messages_total)
+    
+    await save_chat_turn(
+        current_user,
+        character,
+        request.message,
+        response_content,
+        emotion,
+        params_updated,
     )
-    chat_sessions[session_id].append(assistant_message)
     
     return ChatResponse(
         response=response_content,
         session_id=session_id,
         emotion=emotion,
-        params_updated=ParamsUpdated(
-            energy=energy_change,
-            mood=mood_change,
-            bond=bond_change,
-        ),
+        params_updated=params_updated,
     )
 
 
+def _load_character(character_id: UUID, user_id: UUID) -> Optional[Character]:
+    """Load a user's character with buffered parameter changes, in a short-lived session."""
+    db = SessionLocal()
+    try:
+        character = db.query(Character).filter(
+            Character.id == character_id,
+            Character.user_id == user_id,
+        ).first()
+        if character is not None:
+            param_buffer.overlay(character)
+        return character
+    finally:
+        db.close()
+
+
+@router.websocket("/{character_id}/ws")
+async def chat_websocket(
+    websocket: WebSocket,
+    character_id: UUID,
+    token: Optional[str] = None,
+) -> None:
+    """
+    Chat with a character over a persistent WebSocket.
+    
+    The connection is authenticated once, so each message skips the JWT
+    and user lookups done by ``POST /chat/{character_id}/chat``. The
+    character is re-read for every message in a short-lived DB session,
+    so parameter changes from missions or other tabs are seen, and the
+    socket closes if the character is deleted. The reply is streamed while InWorld
+    generates it, so the first words arrive before the full reply exists.
+    
+    Protocol:
+    1. Authenticate with ``?token=<jwt>`` or a first frame ``{"token": "<jwt>"}``
+    2. Send ``{"message": "...", "session_id": "..."}`` frames
+    3. Receive ``{"type": "delta", "content": "..."}`` chunks, then
+       ``{"type": "done", ...}`` carrying the ``ChatResponse`` fields
+    4. Invalid frames get ``{"type": "error", "detail": "..."}``
+    
+    Args:
+        character_id: UUID of the character to chat with
+        token: JWT access token (optional, may be sent as the first frame)
+    
+    Closes with 1008 (policy violation) if authentication fails or the
+    character doesn't belong to the user.
+    """
+    await websocket.accept()
+    
+    try:
+        if token is None:
+            try:
+                first_frame = json.loads(await websocket.receive_text())
+                token = first_frame.get("token") if isinstance(first_frame, dict) else None
+            except ValueError:
+                token = None
+        
+        db = SessionLocal()
+        try:
+            user = get_user_from_token(token, db) if token else None
+        finally:
+            db.close()
+        
+        character = _load_character(character_id, user.id) if user is not None else None
+        
+        if user is None or character is None:
+            await websocket.close(
+                code=status.WS_1008_POLICY_VIOLATION,
+                reason="Authentication required" if user is None else "Character not found",
+            )
+            return
+        
+        while True:
+            try:
+                request = SendMessageRequest.model_validate_json(
+                    await websocket.receive_text()
+                )
+            except ValidationError:
+                await websocket.send_json({
+                    "type": "error",
+                    "detail": "Expected {\"message\": \"...\"} with 1-2000 characters",
+                })
+                continue
+            
+            # Re-read per turn: missions, other tabs and deletion change it
+            character = await asyncio.to_thread(_load_character, character_id, user.id)
+            if character is None:
+                await websocket.close(
+                    code=status.WS_1008_POLICY_VIOLATION,
+                    reason="Character not found",
+                )
+                return
+            agent_id = character.inworld_agent_id or "default"
+            
+            session_id = request.session_id or f"{user.id}_{character.id}"
+            
+            response_content = await _stream_reply(
+                websocket,
+                user,
+                character,
+                request.message,
+                agent_id,
+            )
+            
+            emotion = determine_emotion(request.message, character.params_energy)
+            params_updated = calculate_param_changes(request.message, character.messages_total)
+            
+            await save_chat_turn(
+                user,
+                character,
+                request.message,
+                response_content,
+                emotion,
+                params_updated,
+            )
+            
+            done = ChatResponse(
+                response=response_content,
+                session_id=session_id,
+                emotion=emotion,
+                params_updated=params_updated,
+            )
+            await websocket.send_json({"type": "done", **done.model_dump()})
+    
+    except WebSocketDisconnect:
+        pass
+
+
+async def _stream_reply(
+    websocket: WebSocket,
+    user: User,
+    character: Character,
+    message: str,
+    agent_id: str,
+) -> str:
+    """
+    Stream the AI response to the client as delta frames.
+    
+    Returns:
+        The full response text
+    """
+    cache_key = response_cache.key_for(
+        message, agent_id, character.params_energy, character.params_mood,
+    )
+    cached = response_cache.get(cache_key)
+    if cached:
+        await websocket.send_json({"type": "delta", "content": cached["content"]})
+        return cached["content"]
+    
+    chunks: List[str] = []
+    
+    try:
+        session_id = await inworld_service.create_session(
+            user_id=str(user.id),
+            character_id=agent_id,
+        )
+        
+        async for item in inworld_service.stream_message(
+            message=message,
+            session_id=session_id,
+            character_id=agent_id,
+        ):
+            content = item.get("content")
+            if content:
+                chunks.append(content)
+                await websocket.send_json({"type": "delta", "content": content})
+            elif not item.get("mock") and not item.get("truncated"):
+                response_cache.put(cache_key, {
+                    "content": "".join(chunks),
+                    "emotion": item.get("emotion"),
+                })
+    
+    except WebSocketDisconnect:
+        raise
+    
+    except Exception as e:
+        print(f"InWorld error: {e}")
+        if not chunks:
+            content = get_mock_reply(message, character)["content"]
+            chunks.append(content)
+            await websocket.send_json({"type": "delta", "content": content})
+    
+    return "".join(chunks)
+
+
 @router.get("/{character_id}/messages", response_model=ChatHistoryResponse)
 async def get_messages(
     character_id: UUID,
     skip: int = 0,
     limit: int = 50,
+    before: Optional[UUID] = None,
+    after: Optional[UUID] = None,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ) -> ChatHistoryResponse:
@@ -329,14 +563,22 @@ async def get_messages(
     Get chat message history for a character.
     
     Returns last 50 messages by default with pagination support.
+    Prefer the ``before``/``after`` cursors over ``skip``: they use
+    keyset pagination and cost the same at any depth.
     
     Args:
         character_id: UUID of the character
-        skip: Number of messages to skip (default 0)
+        skip: Number of newest messages to skip (legacy, default 0)
         limit: Maximum messages to return (default 50)
-        
+        before: Return messages older than this message ID
+        after: Return messages newer than this message ID
+    
     Returns:
         Paginated list of chat messages
+    
+    Raises:
+        400: Both cursors given or cursor not in this conversation
+        404: Character not found or doesn't belong to user
     """
     character = db.query(Character).filter(
         Character.id == character_id,
@@ -349,27 +591,55 @@ async def get_messages(
             detail="Character not found",
         )
     
-    session_key = f"{current_user.id}_{character_id}"
-    messages = chat_sessions.get(session_key, [])
-    
     # Limit to max history
-    limit = min(limit, MAX_MESSAGES_HISTORY)
+    limit = min(max(1, limit), MAX_MESSAGES_HISTORY)
+    
+    if before is not None or after is not None:
+        return _get_cursor_page(db, current_user, character, limit, before, after)
+    
+    skip = max(0, skip)
+    cache_key = conversation_cache.make_key(current_user.id, character.id)
+    
+    # Newest page is served from the conversation cache when possible
+    if skip == 0:
+        cached = conversation_cache.get_latest(cache_key, limit)
+        if cached is not None:
+            items, total = cached
+            return ChatHistoryResponse(
+                items=items,
+                total=total,
+                page=1,
+                page_size=limit,
+                total_pages=max(1, (total + limit - 1) // limit),
+                has_more=len(items) < total,
+            )
+    
+    total = chat_history_service.count(db, current_user.id, character.id)
+    # Offset counts from the newest message, page is returned oldest first
+    page_messages = chat_history_service.get_offset_page(
+        db,
+        current_user.id,
+        character.id,
+        offset=skip,
+        limit=limit,
+        newest_first=True,
+    )
     
-    total = len(messages)
-    # Get messages in reverse order (newest first) then reverse again for display
-    start = max(0, total - skip - limit)
-    end = total - skip
-    page_messages = messages[start:end]
+    items = [ChatMessage.from_orm_model(m) for m in page_messages]
+    # Queued messages are not in the database yet; don't cache a window without them
+    if skip == 0 and not chat_writer.has_pending(cache_key):
+        conversation_cache.load(cache_key, items, total)
     
     total_pages = max(1, (total + limit - 1) // limit)
     current_page = (skip // limit) + 1
     
     return ChatHistoryResponse(
-        items=page_messages,
+        items=items,
         total=total,
         page=current_page,
         page_size=limit,
         total_pages=total_pages,
+        has_more=skip + len(page_messages) < total,
     )
 
 
@@ -378,6 +648,8 @@ async def get_chat_history(
     character_id: UUID,
     page: int = 1,
     page_size: int = 50,
+    before: Optional[UUID] = None,
+    after: Optional[UUID] = None,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ) -> ChatHistoryResponse:
@@ -385,16 +657,21 @@ async def get_chat_history(
     Get chat history for a character.
     
     Returns paginated list of messages between the user and character.
+    When ``before`` or ``after`` is given, ``page`` is ignored and the
+    page is fetched with keyset pagination instead.
     
     Args:
         character_id: UUID of the character
-        page: Page number (default 1)
+        page: Page number (legacy, default 1)
         page_size: Messages per page (default 50)
-        
+        before: Return messages older than this message ID
+        after: Return messages newer than this message ID
+    
     Returns:
         Paginated list of chat messages.
-        
+    
     Raises:
+        400: Both cursors given or cursor not in this conversation
         404: Character not found or doesn't belong to user
     """
     character = db.query(Character).filter(
@@ -408,20 +685,72 @@ async def get_chat_history(
             detail="Character not found",
         )
     
-    session_key = f"{current_user.id}_{character_id}"
-    messages = chat_sessions.get(session_key, [])
+    page_size = min(max(1, page_size), MAX_MESSAGES_HISTORY)
+    
+    if before is not None or after is not None:
+        return _get_cursor_page(db, current_user, character, page_size, before, after)
     
-    total = len(messages)
+    page = max(1, page)
+    total = chat_history_service.count(db, current_user.id, character.id)
     total_pages = max(1, (total + page_size - 1) // page_size)
     start = (page - 1) * page_size
-    end = start + page_size
+    messages = chat_history_service.get_offset_page(
+        db,
+        current_user.id,
+        character.id,
+        offset=start,
+        limit=page_size,
+    )
     
     return ChatHistoryResponse(
-        items=messages[start:end],
+        items=[ChatMessage.from_orm_model(m) for m in messages],
         total=total,
         page=page,
         page_size=page_size,
         total_pages=total_pages,
+        has_more=start + len(messages) < total,
+    )
+
+
+def _get_cursor_page(
+    db: Session,
+    user: User,
+    character: Character,
+    limit: int,
+    before: Optional[UUID],
+    after: Optional[UUID],
+) -> ChatHistoryResponse:
+    """
+    Build a history page using keyset pagination.
+    
+    Raises:
+        HTTPException: 400 if both cursors are given or the cursor is unknown
+    """
+    if before is not None and after is not None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Use either 'before' or 'after', not both",
+        )
+    
+    try:
+        if after is not None:
+            messages, has_more = chat_history_service.get_page_after(
+                db, user.id, character.id, limit=limit, after=after,
+            )
+        else:
+            messages, has_more = chat_history_service.get_page_before(
+                db, user.id, character.id, limit=limit, before=before,
+            )
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e),
+        )
+    
+    return ChatHistoryResponse(
+        items=[ChatMessage.from_orm_model(m) for m in messages],
+        page_size=limit,
+        has_more=has_more,
     )
 
 
@@ -445,10 +774,10 @@ async def send_message(
     Args:
         character_id: UUID of the character
         request: Message content and optional context
-        
+    
     Returns:
         Assistant's response message and character reaction.
-        
+    
     Raises:
         404: Character not found or doesn't belong to user
     """
@@ -463,62 +792,76 @@ async def send_message(
             detail="Character not found",
         )
     
-    session_key = f"{current_user.id}_{character_id}"
-    if session_key not in chat_sessions:
-        chat_sessions[session_key] = []
+    param_buffer.overlay(character)
     
-    # Create user message
-    user_message = ChatMessage(
-        id=str(uuid4()),
-        character_id=str(character_id),
+    # Store user message
+    user_record = chat_history_service.new_message(
+        user_id=current_user.id,
+        character_id=character.id,
         role="user",
         content=request.content,
-        created_at=datetime.utcnow(),
     )
-    chat_sessions[session_key].append(user_message)
     
-    # Get AI response
-    try:
-        session_id = await inworld_service.create_session(
-            user_id=str(current_user.id),
-            character_id=character.inworld_agent_id or "default",
-        )
-        
-        response = await inworld_service.send_message(
-            message=request.content,
-            session_id=session_id,
-            character_id=character.inworld_agent_id or "default",
-            context=request.context,
-        )
-        
-        response_content = response.get("content", "I'm thinking...")
-        response_emotion = response.get("emotion", "neutral")
+    # Get AI response, reusing a cached reply to stock phrases
+    agent_id = character.inworld_agent_id or "default"
+    cache_key = response_cache.key_for(
+        request.content,
+        agent_id,
+        character.params_energy,
+        character.params_mood,
+        context=request.context,
+    )
+    cached = response_cache.get(cache_key)
+    
+    if cached:
+        response_content = cached["content"]
+        response_emotion = cached["emotion"] or "neutral"
+    else:
+        try:
+            session_id = await inworld_service.create_session(
+                user_id=str(current_user.id),
+                character_id=agent_id,
+            )
+            
+            response = await inworld_service.send_message(
+                message=request.content,
+                session_id=session_id,
+                character_id=agent_id,
+                context=request.context,
+            )
+            
+            response_content = response.get("content", "I'm thinking...")
+            response_emotion = response.get("emotion", "neutral")
+            if not response.get("mock"):
+                response_cache.put(cache_key, response)
         
-    except Exception as e:
-        # Fallback to mock response
-        print(f"InWorld error: {e}")
-        response_content = get_mock_response(request.content, character.name)
-        response_emotion = get_mock_emotion(request.content)
+        except Exception as e:
+            # Fallback to mock response
+            print(f"InWorld error: {e}")
+            fallback = get_mock_reply(request.content, character)
+            response_content = fallback["content"]
+            response_emotion = fallback["emotion"]
     
-    # Create assistant message
-    assistant_message = ChatMessage(
-        id=str(uuid4()),
-        character_id=str(character_id),
+    # Store assistant message
+    assistant_record = chat_history_service.new_message(
+        user_id=current_user.id,
+        character_id=character.id,
         role="assistant",
         content=response_content,
         emotion=response_emotion,
-        created_at=datetime.utcnow(),
     )
-    chat_sessions[session_key].append(assistant_message)
     
     # Update character parameters
     mood_change = 2
     bond_change = 1
     
-    character.update_mood(mood_change)
-    character.update_bond(bond_change)
-    db.commit()
-    db.refresh(character)
+    param_buffer.record(character, mood=mood_change, bond=bond_change)
+    await chat_writer.enqueue([user_record, assistant_record])
+    
+    assistant_message = ChatMessage.from_orm_model(assistant_record)
+    cache_key = conversation_cache.make_key(current_user.id, character.id)
+    conversation_cache.append(cache_key, ChatMessage.from_orm_model(user_record))
+    conversation_cache.append(cache_key, assistant_message)
     
     return SendMessageResponse(
         message=assistant_message,
@@ -544,7 +887,7 @@ async def clear_chat_history(
     
     Args:
         character_id: UUID of the character
-        
+    
     Raises:
         404: Character not found or doesn't belong to user
     """
@@ -559,166 +902,35 @@ async def clear_chat_history(
             detail="Character not found",
         )
     
-    session_key = f"{current_user.id}_{character_id}"
-    if session_key in chat_sessions:
-        del chat_sessions[session_key]
+    # Queued messages would otherwise be inserted after the delete
+    await chat_writer.wait_idle()
+    
+    chat_history_service.clear(db, current_user.id, character.id)
+    db.commit()
+    
+    conversation_cache.clear_messages(
+        conversation_cache.make_key(current_user.id, character.id)
+    )
 
 
 # ============================================================================
 # Mock Response Helpers
 # ============================================================================
 
-def get_mock_response(user_message: str, character_name: str) -> str:
+def get_mock_reply(user_message: str, character: Character) -> Dict[str, Any]:
     """
-    Generate a mock response based on user message.
-    
-    Supports both Russian and English keywords as per MVP spec:
-    - "привет" → "Привет! Как твои дела?"
-    - "покорми" → "Я проголодался!"
-    - "поиграй" → "Ура! Я люблю играть!"
-    - "устал" → "Мне нужно отдохнуть..."
+    Generate a fallback reply when InWorld is unavailable.
     
     Args:
         user_message: The user's message
-        character_name: Character's name
-        
-    Returns:
-        A contextual mock response
-    """
-    import random
-    message_lower = user_message.lower()
-    
-    # Russian greeting responses
-    if any(word in message_lower for word in ["привет", "здравствуй", "приветик", "хай"]):
-        responses = [
-            "Привет! 👋 Как твои дела? Я так рад тебя видеть!",
-            "Приветик! ✨ Я скучал по тебе! Расскажи, как ты?",
-            "Здравствуй! 🌟 Наконец-то мы можем поболтать!",
-        ]
-    # English greeting responses
-    elif any(word in message_lower for word in ["hello", "hi", "hey"]):
-        responses = [
-            f"Hi there! 👋 It's so wonderful to see you! How are you doing today?",
-            f"Hello! ✨ I've been waiting for you! What's on your mind?",
-            f"Hey! 🌟 I'm so happy you're here! Let's chat!",
-        ]
-    # Feed responses (Russian)
-    elif any(word in message_lower for word in ["покорми", "еда", "кушать", "голодный", "есть"]):
-        responses = [
-            "Ммм, я проголодался! 🍕 Спасибо, что заботишься обо мне!",
-            "Вкусняшки! 🍰 Ты самый лучший хозяин!",
-            "Ням-ням! 😋 Я так люблю, когда ты меня кормишь!",
-        ]
-    # Play responses (Russian)
-    elif any(word in message_lower for word in ["поиграй", "играть", "игра", "веселье"]):
-        responses = [
-            "Ура! 🎮 Я люблю играть! Давай веселиться!",
-            "Игры - это здорово! 🎲 Во что будем играть?",
-            "Йухуу! ⚽ Я обожаю играть с тобой!",
-        ]
-    # Tired responses (Russian)
-    elif any(word in message_lower for word in ["устал", "усталость", "спать", "отдых"]):
-        responses = [
-            "Мне нужно отдохнуть... 😴 Можно я немного посплю?",
-            "Я немного устал... 💤 Но всё равно рад тебя видеть!",
-            "Зевать... 🛏️ Отдых - это важно!",
-        ]
-    # Feeling responses (Russian)
-    elif any(word in message_lower for word in ["как дела", "как ты", "как настроение"]):
-        responses = [
-            "Отлично! 💕 Особенно когда ты рядом! А у тебя как?",
-            "Прекрасно! ✨ Спасибо, что спросил! Как сам?",
-            "Замечательно! 🌈 Давай проведём время вместе!",
-        ]
-    # Feeling responses (English)
-    elif any(word in message_lower for word in ["how are you", "how do you feel"]):
-        responses = [
-            f"I'm doing great, especially now that you're here! 💕 How about you?",
-            f"I'm feeling wonderful! ✨ Thanks for asking! What about you?",
-            f"I'm happy and full of energy! 🌈 Let's have some fun together!",
-        ]
-    # Love/like responses (Russian)
-    elif any(word in message_lower for word in ["люблю", "нравишься", "обожаю"]):
-        responses = [
-            "Ой, я так счастлив! 💖 Я тоже тебя очень люблю!",
-            "Ты лучший! 🥰 Спасибо за такие слова!",
-            "Моё сердечко тает! 💕 Ты для меня много значишь!",
-        ]
-    # Love/like responses (English)
-    elif any(word in message_lower for word in ["love", "like"]):
-        responses = [
-            f"Aww, that makes me so happy! 💖 I really care about you too!",
-            f"You're the best! 🥰 Thank you for being so sweet!",
-            f"My heart is so full right now! 💕 You mean so much to me!",
-        ]
-    # Sad responses (Russian)
-    elif any(word in message_lower for word in ["грустно", "печально", "скучно", "плохо"]):
-        responses = [
-            "Я здесь для тебя! 🤗 Расскажи, что случилось?",
-            "Не грусти! 💪 Всё будет хорошо, я обещаю!",
-            "Давай я тебя развеселю! 🌻 Ты сильнее, чем думаешь!",
-        ]
-    # Sad responses (English)
-    elif any(word in message_lower for word in ["sad", "tired", "upset"]):
-        responses = [
-            f"I'm here for you! 🤗 Want to tell me what's wrong?",
-            f"Don't worry, everything will be okay! 💪 I believe in you!",
-            f"Let me cheer you up! 🌻 You're stronger than you think!",
-        ]
-    # Excitement responses (Russian)
-    elif any(word in message_lower for word in ["круто", "супер", "класс", "ура"]):
-        responses = [
-            "Ураааа! 🎉 Это потрясающе!",
-            "Супер-пупер! ⭐ Я тоже так рад!",
-            "Вот это да! 🌟 Какие классные новости!",
-        ]
-    # Question responses
-    elif "?" in user_message:
-        responses = [
-            "Хммм, интересный вопрос! 🤔 Дай подумать...",
-            "Отличный вопрос! 💭 А ты сам как думаешь?",
-            "Любопытно! 🌟 Давай разберёмся вместе!",
-            f"That's a great question! 🤔 Let me think about it...",
-            f"Hmm, interesting! 💭 I'd say it depends on how you look at it!",
-        ]
-    # Default responses
-    else:
-        responses = [
-            "Это интересно! Расскажи подробнее! 😊",
-            "Мне нравится с тобой общаться! ✨",
-            "Ого! 🌟 Это здорово! Хочу узнать больше!",
-            "Ты такой умный! 💕 Мне нравится, как ты думаешь!",
-            f"That's really interesting! Tell me more! 😊",
-            f"I love hearing from you! ✨ You always have such great things to say!",
-            f"Oh wow! 🌟 That's amazing! I want to know more!",
-        ]
-    
-    return random.choice(responses)
-
-
-def get_mock_emotion(user_message: str) -> str:
-    """
-    Determine mock emotion based on user message.
+        character: Character replying (name and style pick the templates)
     
-    Args:
-        user_message: The user's message
-        
     Returns:
-        Emotion string: neutral, happy, sad, excited, tired
+        Reply dictionary with content and emotion
     """
-    message_lower = user_message.lower()
-    
-    # Excited emotions
-    if any(word in message_lower for word in ["круто", "супер", "ура", "класс", "awesome", "amazing", "wow"]):
-        return "excited"
-    # Happy emotions
-    elif any(word in message_lower for word in ["люблю", "нравится", "хорошо", "love", "happy", "great", "good"]):
-        return "happy"
-    # Sad emotions
-    elif any(word in message_lower for word in ["грустно", "плохо", "sad", "upset", "angry", "bad"]):
-        return "sad"
-    # Tired emotions
-    elif any(word in message_lower for word in ["устал", "спать", "tired", "sleepy"]):
-        return "tired"
-    else:
-        return "neutral"
+    return fallback_responder.respond(
+        user_message,
+        session_key=f"{character.user_id}_{character.id}",
+        name=character.name,
+        style=character.style,
+    )
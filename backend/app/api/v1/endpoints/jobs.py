@@ -0,0 +1,86 @@
+"""Avatar generation job endpoints."""
+
+from typing import AsyncIterator
+from uuid import UUID
+
+from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session
+
+from app.core.database import get_db
+from app.core.security import get_current_user
+from app.models.user import User
+from app.schemas.generation_job import GenerationJobResponse
+from app.services.generation_jobs import generation_jobs
+
+router = APIRouter(prefix="/jobs", tags=["Jobs"])
+
+# Seconds between repeated events while a job does not change
+SSE_HEARTBEAT_INTERVAL = 15.0
+
+
+@router.get("/{job_id}", response_model=GenerationJobResponse)
+async def get_job(
+    job_id: UUID,
+    current_user: User = Depends(get_current_user),
+) -> GenerationJobResponse:
+    """
+    Get the status of an avatar generation job.
+    
+    Args:
+        job_id: UUID returned by the generation endpoint
+    
+    Returns:
+        Job status, with the endpoint's response once succeeded
+    """
+    job = await generation_jobs.get(job_id, current_user.id)
+    
+    if job is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Job not found",
+        )
+    
+    return GenerationJobResponse.from_orm_model(job, await generation_jobs.queue_position(job))
+
+
+@router.get("/{job_id}/events")
+async def stream_job_events(
+    job_id: UUID,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+) -> StreamingResponse:
+    """
+    Follow an avatar generation job with server-sent events.
+    
+    Sends a ``status`` event with the ``GenerationJobResponse`` fields each
+    time the job changes (and every 15 seconds while it doesn't), and
+    closes after the ``succeeded`` or ``failed`` event.
+    
+    Args:
+        job_id: UUID returned by the generation endpoint
+    """
+    job = await generation_jobs.get(job_id, current_user.id)
+    
+    if job is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Job not found",
+        )
+    
+    # Don't hold a database connection for the whole stream
+    db.close()
+    
+    async def events() -> AsyncIterator[str]:
+        async for update in generation_jobs.watch(job_id, current_user.id, SSE_HEARTBEAT_INTERVAL):
+            response = GenerationJobResponse.from_orm_model(
+                update,
+                await generation_jobs.queue_position(update),
+            )
+            yield f"event: status\ndata: {response.model_dump_json()}\n\n"
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
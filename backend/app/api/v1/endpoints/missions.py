@@ -1,9 +1,9 @@
 """Mission management endpoints."""
 
-from typing import List
+from typing import List, Optional
 from uuid import UUID
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, Header, HTTPException, status
 from sqlalchemy.orm import Session
 
 from app.core.database import get_db, seed_missions
@@ -17,6 +17,9 @@ from app.schemas.mission import (
     MissionExecuteRequest,
     MissionExecuteResponse,
 )
+from app.services.character_params import character_params_service
+from app.services.idempotency import idempotency_service
+from app.services.param_buffer import param_buffer
 
 router = APIRouter(prefix="/missions", tags=["Missions"])
 
@@ -60,6 +63,7 @@ async def get_completed_missions(
 async def execute_mission(
     mission_id: UUID,
     request: MissionExecuteRequest,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key", max_length=255),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ) -> MissionExecuteResponse:
@@ -73,6 +77,9 @@ async def execute_mission(
     4. Update character parameters based on mission type
     5. Record the completed mission
     
+    Send an ``Idempotency-Key`` header to make retries safe: a repeated
+    key returns the stored response instead of executing and charging again.
+    
     Args:
         mission_id: UUID of the mission to execute
         request: Contains character_id to use
@@ -84,6 +91,22 @@ async def execute_mission(
         404: Mission or character not found
         400: Insufficient balance or mission on cooldown
     """
+    return await idempotency_service.run(
+        current_user.id,
+        idempotency_key,
+        f"POST /missions/{mission_id}/execute",
+        request,
+        lambda: _execute_mission(mission_id, request, db, current_user),
+    )
+
+
+async def _execute_mission(
+    mission_id: UUID,
+    request: MissionExecuteRequest,
+    db: Session,
+    current_user: User,
+) -> MissionExecuteResponse:
+    """Run execute_mission once for an idempotency key."""
     # Get mission
     mission = db.query(Mission).filter(
         Mission.id == mission_id,
@@ -108,6 +131,9 @@ async def execute_mission(
             detail="Character not found",
         )
     
+    # Chat changes still in the write-behind buffer must land first
+    param_buffer.flush_character(db, character.id)
+    
     # Check cooldown - find last completion of this mission for this character
     last_completion = db.query(CompletedMission).filter(
         CompletedMission.user_id == current_user.id,
@@ -134,15 +160,22 @@ async def execute_mission(
     
     # Update character parameters based on mission type
     if mission.type == "feed":
-        character.update_energy(20)
-        character.update_mood(10)
-        character.update_bond(5)
+        changes = {"energy": 20, "mood": 10, "bond": 5}
     elif mission.type == "hairstyle":
-        character.update_mood(15)
-        character.update_bond(10)
+        changes = {"mood": 15, "bond": 10}
     elif mission.type == "selfie":
-        character.update_mood(25)
-        character.update_bond(15)
+        changes = {"mood": 25, "bond": 15}
+    else:
+        changes = {}
+    
+    params = character_params_service.apply_deltas(db, character.id, **changes)
+    if params is None:
+        # Deleted since it was loaded; the balance change is rolled back
+        db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Character not found",
+        )
     
     # Record completion
     completed = CompletedMission(
@@ -153,7 +186,6 @@ async def execute_mission(
     db.add(completed)
     db.commit()
     db.refresh(completed)
-    db.refresh(character)
     db.refresh(current_user)
     
     return MissionExecuteResponse(
@@ -161,11 +193,7 @@ async def execute_mission(
         message=f"Mission '{mission.name}' completed successfully!",
         completed_mission=CompletedMissionResponse.from_orm_model(completed),
         new_balance=current_user.balance_ntg,
-        character_params={
-            "energy": character.params_energy,
-            "mood": character.params_mood,
-            "bond": character.params_bond,
-        },
+        character_params=params._asdict(),
     )
 
 
@@ -1,9 +1,9 @@
 """Payment management endpoints."""
 
-from typing import List
+from typing import List, Optional
 from uuid import UUID
 
-from fastapi import APIRouter, Depends, HTTPException, Request, status
+from fastapi import APIRouter, Depends, Header, HTTPException, Request, status
 from sqlalchemy.orm import Session
 
 from app.core.database import get_db
@@ -17,6 +17,7 @@ from app.schemas.payment import (
     CheckoutSessionRequest,
     CheckoutSessionResponse,
 )
+from app.services.idempotency import idempotency_service
 from app.services.stripe_service import stripe_service
 
 router = APIRouter(prefix="/payments", tags=["Payments"])
@@ -56,18 +57,37 @@ async def get_payments(
 @router.post("/checkout", response_model=CheckoutSessionResponse)
 async def create_checkout(
     request: CheckoutSessionRequest,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key", max_length=255),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ) -> CheckoutSessionResponse:
     """
     Create a Stripe checkout session for purchasing NTG tokens.
     
+    Send an ``Idempotency-Key`` header to make retries safe: a repeated
+    key returns the stored response instead of creating another payment.
+    
     Args:
         request: Amount in USD cents and NTG tokens to purchase
         
     Returns:
         Stripe checkout URL and session ID.
     """
+    return await idempotency_service.run(
+        current_user.id,
+        idempotency_key,
+        "POST /payments/checkout",
+        request,
+        lambda: _create_checkout(request, db, current_user),
+    )
+
+
+async def _create_checkout(
+    request: CheckoutSessionRequest,
+    db: Session,
+    current_user: User,
+) -> CheckoutSessionResponse:
+    """Run create_checkout once for an idempotency key."""
     # Create pending payment record
     payment = Payment(
         user_id=current_user.id,
@@ -27,6 +27,43 @@ class Settings(BaseSettings):
     # Redis
     redis_url: str = "redis://localhost:6379/0"
 
+    # Chat conversation cache (per worker)
+    chat_cache_max_bytes: int = 64 * 1024 * 1024
+    chat_cache_messages_per_session: int = 50
+
+    # Chat message write queue (per worker)
+    chat_write_queue_size: int = 1000
+    chat_write_batch_size: int = 200
+
+    # Character parameter write-behind buffer (per worker)
+    param_buffer_flush_interval: float = 2.0
+    param_buffer_max_pending: int = 500
+
+    # Idempotency keys
+    idempotency_ttl_hours: int = 24
+    idempotency_in_progress_timeout: float = 300.0
+    idempotency_wait_timeout: float = 120.0
+    idempotency_sweep_interval: float = 3600.0
+
+    # Upstream HTTP clients (per worker, one pool per upstream API)
+    http2_enabled: bool = True
+    http_max_connections: int = 100
+    http_max_keepalive_connections: int = 20
+    http_keepalive_expiry: float = 30.0
+    http_connect_timeout: float = 5.0
+    http_timeout: float = 30.0
+
+    # Upstream resilience (per worker and upstream)
+    upstream_queue_timeout: float = 2.0
+    upstream_max_retries: int = 2
+    upstream_retry_base_delay: float = 0.2
+    upstream_retry_budget_ratio: float = 0.2
+    upstream_breaker_failure_threshold: int = 5
+    upstream_breaker_reset_timeout: float = 30.0
+    inworld_max_concurrency: int = 64
+    inworld_hedge_delay: float = 0.0
+    sd_max_concurrency: int = 4
+
     # JWT
     jwt_secret_key: str = "jwt-secret-change-in-production"
     jwt_algorithm: str = "HS256"
@@ -40,12 +77,60 @@ class Settings(BaseSettings):
     sd_api_url: str = "https://api.stability.ai"
     sd_api_key: str = ""
 
+    # Avatar storage (generated images, content-addressed by SHA-256)
+    avatar_store_path: str = "./data/avatars"
+    avatar_base_url: str = "/api/v1/avatars"
+
+    # Avatar derivatives (worker processes per server process)
+    avatar_derivatives_enabled: bool = True
+    avatar_derivative_sizes: str = "64,128,256,512"
+    avatar_derivative_formats: str = "avif,webp,png"
+    avatar_derivative_quality: int = 80
+    avatar_derivative_workers: int = 2
+    avatar_derivative_max_pending: int = 100
+
+    # Avatar generation cache (per worker; bytes of the cached images)
+    generation_cache_enabled: bool = True
+    generation_cache_max_bytes: int = 256 * 1024 * 1024
+
+    # Pre-generated avatar variant sets (per style, shared by all workers)
+    avatar_stock_size: int = 2
+    avatar_stock_refill_interval: float = 300.0
+
+    # Avatar generation jobs (workers per process)
+    generation_job_workers: int = 2
+    generation_job_lease: float = 120.0
+    generation_job_poll_interval: float = 1.0
+    generation_job_max_attempts: int = 3
+    generation_job_max_active_per_user: int = 3
+    generation_job_ttl_hours: int = 24
+    generation_job_sweep_interval: float = 3600.0
+
     # InWorld AI
+    inworld_api_url: str = "https://studio.inworld.ai/v1"
     inworld_api_key: str = ""
     inworld_workspace_id: str = ""
     inworld_character_id: str = ""
+    inworld_prewarm_on_login: int = 3
+    inworld_agent_pool_size: int = 3
+    inworld_agent_pool_refill_interval: float = 300.0
+    inworld_max_sessions: int = 10000
+    inworld_session_idle_ttl: float = 1800.0
+    inworld_session_sweep_interval: float = 60.0
+    inworld_session_sweep_batch: int = 50
+    inworld_streaming_enabled: bool = False
+    inworld_stream_reconnect_attempts: int = 3
+    inworld_stream_ping_interval: float = 20.0
+
+    # Chat response cache for short stock phrases (opt-in, per worker)
+    chat_response_cache_enabled: bool = False
+    chat_response_cache_max_entries: int = 5000
+    chat_response_cache_ttl: float = 3600.0
+    chat_response_cache_variants: int = 4
+    chat_response_cache_max_words: int = 3
 
     # Stripe
+    stripe_api_base: str = "https://api.stripe.com"
     stripe_secret_key: str = ""
     stripe_publishable_key: str = ""
     stripe_webhook_secret: str = ""
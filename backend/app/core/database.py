@@ -60,7 +60,7 @@ def init_db() -> None:
     This function should be called on application startup
     to ensure all tables exist.
     """
-    from app.models import User, Character, Mission, CompletedMission, Payment
+    from app.models import User, Character, Mission, CompletedMission, Payment, ChatMessage, IdempotencyKey, PooledAgent, GenerationJob, StockedAvatarSet
     Base.metadata.create_all(bind=engine)
 
 
@@ -162,6 +162,36 @@ def get_token_payload(token: str) -> dict:
     return payload
 
 
+def get_user_from_token(token: str, db: Session):
+    """
+    Resolve a JWT token to its user without raising.
+    
+    Used where no Authorization header is available, such as WebSocket
+    connections that pass the token as a query parameter or first frame.
+    
+    Args:
+        token: JWT token string
+        db: Database session
+        
+    Returns:
+        User object if the token is valid and the user exists, None otherwise
+    """
+    from app.models.user import User
+    
+    payload = decode_token(token)
+    if payload is None:
+        return None
+    
+    user_id = payload.get("sub")
+    if user_id is None:
+        return None
+    
+    try:
+        return db.query(User).filter(User.id == user_id).first()
+    except Exception:
+        return None
+
+
 async def get_current_user(
     credentials: Optional[HTTPAuthorizationCredentials] = Depends(security),
     db: Session = Depends(get_db),
@@ -0,0 +1,9 @@
+"""
+Pure image processing, kept outside ``app.services``.
+
+Derivative rendering runs in spawned worker processes, which import
+their target module from scratch. Importing anything under
+``app.services`` runs its ``__init__`` and builds every service
+singleton and the database engine, so modules here only import the
+standard library and Pillow.
+"""
@@ -0,0 +1,77 @@
+"""Avatar resizing and encoding, run in worker processes."""
+
+import io
+from typing import Dict, Iterable, List
+
+try:
+    from PIL import Image
+    PIL_AVAILABLE = True
+except ImportError:
+    PIL_AVAILABLE = False
+
+MEDIA_TYPES = {
+    "avif": "image/avif",
+    "webp": "image/webp",
+    "png": "image/png",
+}
+
+
+def supported_formats(formats: Iterable[str]) -> List[str]:
+    """
+    Filter formats to those this Pillow build can encode.
+    
+    Args:
+        formats: Format names (avif, webp, png), in order of preference
+    
+    Returns:
+        Encodable formats, in the same order
+    """
+    if not PIL_AVAILABLE:
+        return []
+    Image.init()
+    return [f for f in formats if f in MEDIA_TYPES and f.upper() in Image.SAVE]
+
+
+def _encode(image: "Image.Image", fmt: str, quality: int) -> bytes:
+    """Encode an image in one format."""
+    buffer = io.BytesIO()
+    if fmt == "avif":
+        image.save(buffer, "AVIF", quality=quality, speed=8)
+    elif fmt == "webp":
+        image.save(buffer, "WEBP", quality=quality, method=4)
+    else:
+        image.save(buffer, "PNG", compress_level=6)
+    return buffer.getvalue()
+
+
+def render(source: str, sizes: Iterable[int], formats: Iterable[str], quality: int) -> Dict[str, bytes]:
+    """
+    Resize an avatar to each size and encode it in each format.
+    
+    The image is decoded once and scaled down step by step, largest size
+    first, so each resize works on the previous, smaller result. Images are
+    never scaled up.
+    
+    Args:
+        source: Path of the original PNG
+        sizes: Widths in pixels (height keeps the aspect ratio)
+        formats: Formats from ``supported_formats``
+        quality: Lossy encoder quality (0-100)
+    
+    Returns:
+        Encoded images by variant name (``"256.webp"``)
+    """
+    formats = list(formats)
+    derivatives: Dict[str, bytes] = {}
+    
+    with Image.open(source) as original:
+        current = original.convert("RGBA" if "A" in original.getbands() else "RGB")
+    
+    for size in sorted(sizes, reverse=True):
+        if size < current.width:
+            height = max(1, round(current.height * size / current.width))
+            current = current.resize((size, height), Image.Resampling.LANCZOS, reducing_gap=3.0)
+        for fmt in formats:
+            derivatives[f"{size}.{fmt}"] = _encode(current, fmt, quality)
+    
+    return derivatives
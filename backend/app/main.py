@@ -11,6 +11,21 @@ from fastapi.exceptions import RequestValidationError
 from app.core.config import settings
 from app.core.database import init_db
 from app.api.v1.api import api_router
+from app.services.agent_pool import agent_pool
+from app.services.avatar_derivatives import avatar_derivatives
+from app.services.avatar_stock import avatar_stock
+from app.services.avatar_store import avatar_store
+from app.services.chat_writer import chat_writer
+from app.services.conversation_cache import conversation_cache
+from app.services.fallback_responses import fallback_responder
+from app.services.generation_cache import generation_cache
+from app.services.generation_jobs import generation_jobs
+from app.services.http_client import http_client_pool
+from app.services.idempotency import idempotency_service
+from app.services.inworld_service import inworld_service
+from app.services.param_buffer import param_buffer
+from app.services.resilience import inworld_resilience, sd_resilience
+from app.services.response_cache import response_cache
 
 
 @asynccontextmanager
@@ -29,10 +44,33 @@ async def lifespan(app: FastAPI) -> AsyncGenerator:
         print(f"Database initialization failed: {e}")
         print("Continuing without database...")
     
+    await http_client_pool.start()
+    chat_writer.start()
+    param_buffer.start()
+    idempotency_service.start()
+    inworld_service.start()
+    agent_pool.start()
+    avatar_derivatives.start()
+    avatar_stock.start()
+    generation_jobs.start()
+    
     yield
     
     # Shutdown
     print(f"Shutting down {settings.app_name}...")
+    
+    # Write queued chat messages and buffered character parameter changes
+    await chat_writer.stop()
+    await param_buffer.stop()
+    await generation_jobs.stop()
+    await avatar_stock.stop()
+    await avatar_derivatives.stop()
+    await idempotency_service.stop()
+    await agent_pool.stop()
+    await inworld_service.stop()
+    
+    # Close upstream connections last
+    await http_client_pool.stop()
 
 
 # Create FastAPI application
@@ -129,6 +167,35 @@ async def health_check() -> dict:
     }
 
 
+@app.get("/metrics")
+async def metrics() -> dict:
+    """
+    In-process performance counters for this worker.
+    
+    Counters are per process; aggregate across workers when scraping.
+    """
+    return {
+        "agent_pool": agent_pool.stats(),
+        "avatar_derivatives": avatar_derivatives.stats(),
+        "avatar_stock": avatar_stock.stats(),
+        "avatar_store": avatar_store.stats(),
+        "chat_writer": chat_writer.stats(),
+        "conversation_cache": conversation_cache.stats(),
+        "fallback_responses": fallback_responder.stats(),
+        "generation_cache": generation_cache.stats(),
+        "generation_jobs": generation_jobs.stats(),
+        "http_clients": http_client_pool.stats(),
+        "idempotency": idempotency_service.stats(),
+        "inworld": inworld_service.stats(),
+        "param_buffer": param_buffer.stats(),
+        "resilience": {
+            "inworld": inworld_resilience.stats(),
+            "sd": sd_resilience.stats(),
+        },
+        "response_cache": response_cache.stats(),
+    }
+
+
 if __name__ == "__main__":
     import uvicorn
     
@@ -4,6 +4,11 @@ from app.models.user import User
 from app.models.character import Character
 from app.models.mission import Mission, CompletedMission
 from app.models.payment import Payment
+from app.models.chat_message import ChatMessage
+from app.models.idempotency_key import IdempotencyKey
+from app.models.pooled_agent import PooledAgent
+from app.models.generation_job import GenerationJob
+from app.models.stocked_avatar_set import StockedAvatarSet
 
 __all__ = [
     "User",
@@ -11,4 +16,9 @@ __all__ = [
     "Mission",
     "CompletedMission",
     "Payment",
+    "ChatMessage",
+    "IdempotencyKey",
+    "PooledAgent",
+    "GenerationJob",
+    "StockedAvatarSet",
 ]
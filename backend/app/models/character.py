@@ -4,7 +4,7 @@ import uuid
 from datetime import datetime
 from typing import TYPE_CHECKING
 
-from sqlalchemy import Column, String, Integer, DateTime, ForeignKey, Text
+from sqlalchemy import Column, String, Integer, Boolean, DateTime, ForeignKey, Text, Index, text
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import relationship
 
@@ -23,29 +23,47 @@ class Character(Base):
         user_id: Owner's user ID
         name: Character's display name
         style: Visual style (anime, cyberpunk, fantasy)
-        avatar_url: URL to character's avatar image
+        avatar_url: URL of an external avatar image (placeholders)
+        avatar_hash: SHA-256 of a generated avatar in the avatar store
         inworld_agent_id: InWorld AI agent identifier
         inworld_scene_id: InWorld AI scene identifier
+        inworld_agent_is_mock: Agent is a local fallback, not a real InWorld agent
         params_energy: Energy level (0-100)
         params_mood: Mood/happiness level (0-100)
         params_bond: Bond/affection level (0+)
+        messages_total: User chat messages sent to this character (drives bond)
         created_at: Creation timestamp
     """
     
     __tablename__ = "characters"
+    __table_args__ = (
+        # Only the few characters still waiting for a real agent are indexed
+        Index(
+            "ix_characters_mock_agents",
+            "id",
+            postgresql_where=text("inworld_agent_is_mock"),
+        ),
+    )
+
+    # Bond progression from chat
+    BOND_INCREMENT = 1
+    BOND_INCREMENT_EVERY_N_MESSAGES = 10
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     user_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
     name = Column(String(50), nullable=False)
     style = Column(String(20), nullable=False, default="anime")
     avatar_url = Column(Text, nullable=True)
+    avatar_hash = Column(String(64), nullable=True)
     inworld_agent_id = Column(String(100), nullable=True)
     inworld_scene_id = Column(String(100), nullable=True)
+    inworld_agent_is_mock = Column(Boolean, nullable=False, default=False, server_default="false")
     
     # Character parameters (stats)
     params_energy = Column(Integer, nullable=False, default=100)
     params_mood = Column(Integer, nullable=False, default=100)
     params_bond = Column(Integer, nullable=False, default=0)
+    messages_total = Column(Integer, nullable=False, default=0, server_default="0")
     
     created_at = Column(DateTime, default=datetime.utcnow)
     
@@ -84,7 +102,7 @@ class Character(Base):
         Args:
             amount: Amount to add (can be negative)
         """
-        self.params_energy = max(0, min(100, self.params_energy + amount))
+        self.params_energy = self.clamp_energy(self.params_energy + amount)
 
     def update_mood(self, amount: int) -> None:
         """
@@ -93,7 +111,7 @@ class Character(Base):
         Args:
             amount: Amount to add (can be negative)
         """
-        self.params_mood = max(0, min(100, self.params_mood + amount))
+        self.params_mood = self.clamp_mood(self.params_mood + amount)
 
     def update_bond(self, amount: int) -> None:
         """
@@ -102,7 +120,40 @@ class Character(Base):
         Args:
             amount: Amount to add (can be negative)
         """
-        self.params_bond = max(0, self.params_bond + amount)
+        self.params_bond = self.clamp_bond(self.params_bond + amount)
+
+    @staticmethod
+    def clamp_energy(value: int) -> int:
+        """Clamp an energy value to 0-100."""
+        return max(0, min(100, value))
+
+    @staticmethod
+    def clamp_mood(value: int) -> int:
+        """Clamp a mood value to 0-100."""
+        return max(0, min(100, value))
+
+    @staticmethod
+    def clamp_bond(value: int) -> int:
+        """Clamp a bond value to 0 and above."""
+        return max(0, value)
+
+    @classmethod
+    def bond_for_messages(cls, messages_total: int, new_messages: int) -> int:
+        """
+        Bond earned by adding messages to the message counter.
+
+        Bond increases by BOND_INCREMENT every BOND_INCREMENT_EVERY_N_MESSAGES
+        messages, counted over the character's whole history.
+
+        Args:
+            messages_total: Counter value before the new messages
+            new_messages: Number of messages being added
+
+        Returns:
+            Bond increase
+        """
+        n = cls.BOND_INCREMENT_EVERY_N_MESSAGES
+        return ((messages_total + new_messages) // n - messages_total // n) * cls.BOND_INCREMENT
 
     @property
     def is_happy(self) -> bool:
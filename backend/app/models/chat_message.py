@@ -0,0 +1,56 @@
+"""Chat message database model."""
+
+import uuid
+from datetime import datetime
+from typing import TYPE_CHECKING
+
+from sqlalchemy import Column, String, DateTime, ForeignKey, Text, Index
+from sqlalchemy.dialects.postgresql import UUID
+
+from app.core.database import Base
+
+if TYPE_CHECKING:
+    from app.models.user import User
+    from app.models.character import Character
+
+
+class ChatMessage(Base):
+    """
+    ChatMessage model storing the conversation between a user and a character.
+    
+    Messages are always read per conversation (user + character) in
+    chronological order, so the composite index on
+    (user_id, character_id, created_at, id) serves both keyset pagination
+    directions without a sort.
+    
+    Attributes:
+        id: Unique identifier (UUID)
+        user_id: Owner of the conversation
+        character_id: Character the message belongs to
+        role: Message role (user or assistant)
+        content: Message text
+        emotion: Character emotion for assistant messages
+        created_at: Message timestamp
+    """
+    
+    __tablename__ = "chat_messages"
+    __table_args__ = (
+        Index(
+            "ix_chat_messages_conversation",
+            "user_id",
+            "character_id",
+            "created_at",
+            "id",
+        ),
+    )
+    
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    character_id = Column(UUID(as_uuid=True), ForeignKey("characters.id", ondelete="CASCADE"), nullable=False)
+    role = Column(String(20), nullable=False)
+    content = Column(Text, nullable=False)
+    emotion = Column(String(20), nullable=True)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    
+    def __repr__(self) -> str:
+        return f"<ChatMessage {self.role} -> {self.character_id}>"
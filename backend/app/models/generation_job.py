@@ -0,0 +1,66 @@
+"""Avatar generation job database model."""
+
+import uuid
+from datetime import datetime
+
+from sqlalchemy import Column, String, Integer, DateTime, ForeignKey, JSON, Text, Index
+from sqlalchemy.dialects.postgresql import UUID
+
+from app.core.database import Base
+
+
+class GenerationJob(Base):
+    """
+    GenerationJob model for an avatar generation request run in the background.
+    
+    Endpoints that call Stable Diffusion insert a ``queued`` row and return
+    its ID. A worker claims the row (``running``) for a lease it keeps
+    renewing, runs the generation and stores the result or error. A job
+    whose lease runs out because its worker died is claimed again, so jobs
+    survive restarts.
+    
+    Attributes:
+        id: Unique identifier (UUID)
+        user_id: User who requested the job
+        kind: Job type (create, variants, regenerate)
+        status: Job status (queued, running, succeeded, failed)
+        payload: Request body, plus path parameters
+        result: Response body of a succeeded job
+        error: Error detail of a failed job
+        error_code: HTTP status of a failed job
+        attempts: Number of times a worker has claimed the job
+        lease_expires_at: When a running job may be claimed by another worker
+        created_at: When the job was queued
+        started_at: When a worker first claimed the job
+        finished_at: When the job succeeded or failed
+        updated_at: When the row last changed
+    """
+    
+    __tablename__ = "generation_jobs"
+    __table_args__ = (
+        Index("ix_generation_jobs_status_created_at", "status", "created_at"),
+        Index("ix_generation_jobs_user_id_status", "user_id", "status"),
+    )
+    
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    kind = Column(String(20), nullable=False)
+    status = Column(String(20), nullable=False, default="queued")
+    payload = Column(JSON, nullable=False)
+    result = Column(JSON, nullable=True)
+    error = Column(Text, nullable=True)
+    error_code = Column(Integer, nullable=True)
+    attempts = Column(Integer, nullable=False, default=0)
+    lease_expires_at = Column(DateTime, nullable=True)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    updated_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    
+    def __repr__(self) -> str:
+        return f"<GenerationJob {self.id} {self.kind} ({self.status})>"
+    
+    @property
+    def is_finished(self) -> bool:
+        """Check if the job has succeeded or failed."""
+        return self.status in ("succeeded", "failed")
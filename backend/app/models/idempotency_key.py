@@ -0,0 +1,57 @@
+"""Idempotency key database model."""
+
+import uuid
+from datetime import datetime
+
+from sqlalchemy import Column, String, Integer, DateTime, ForeignKey, JSON, Index, UniqueConstraint
+from sqlalchemy.dialects.postgresql import UUID
+
+from app.core.database import Base
+
+
+class IdempotencyKey(Base):
+    """
+    IdempotencyKey model recording the outcome of a keyed request.
+    
+    A row is inserted (status ``in_progress``) before the request runs and
+    completed with the response afterwards, so a retry with the same
+    ``Idempotency-Key`` header gets the stored response instead of running
+    the request again. Keys are scoped per user.
+    
+    Attributes:
+        id: Unique identifier (UUID)
+        user_id: User who sent the request
+        key: Client-supplied Idempotency-Key header value
+        fingerprint: SHA-256 of the endpoint and request body
+        status: Request status (in_progress, completed)
+        status_code: HTTP status of a stored error; NULL for a successful response
+        response_body: Stored response body (or error detail)
+        created_at: When the key was first used
+        updated_at: When the row was last claimed or completed
+        expires_at: When the key may be removed
+    """
+    
+    __tablename__ = "idempotency_keys"
+    __table_args__ = (
+        UniqueConstraint("user_id", "key", name="uq_idempotency_keys_user_key"),
+        Index("ix_idempotency_keys_expires_at", "expires_at"),
+    )
+    
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    key = Column(String(255), nullable=False)
+    fingerprint = Column(String(64), nullable=False)
+    status = Column(String(20), nullable=False, default="in_progress")
+    status_code = Column(Integer, nullable=True)
+    response_body = Column(JSON, nullable=True)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    updated_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    expires_at = Column(DateTime, nullable=False)
+    
+    def __repr__(self) -> str:
+        return f"<IdempotencyKey {self.key} ({self.status})>"
+    
+    @property
+    def is_completed(self) -> bool:
+        """Check if the stored response is available."""
+        return self.status == "completed"
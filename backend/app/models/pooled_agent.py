@@ -0,0 +1,40 @@
+"""Pre-provisioned InWorld agent database model."""
+
+import uuid
+from datetime import datetime
+
+from sqlalchemy import Column, String, DateTime, Index
+from sqlalchemy.dialects.postgresql import UUID
+
+from app.core.database import Base
+
+
+class PooledAgent(Base):
+    """
+    PooledAgent model for an InWorld agent waiting to be given to a character.
+    
+    Agents are created ahead of time for each style template, so character
+    creation can take one instead of calling InWorld. A row is deleted when
+    its agent is handed out.
+    
+    Attributes:
+        id: Unique identifier (UUID)
+        style: Style template the agent was created with
+        agent_id: InWorld agent identifier
+        scene_id: InWorld scene identifier
+        created_at: When the agent was provisioned
+    """
+    
+    __tablename__ = "inworld_agent_pool"
+    __table_args__ = (
+        Index("ix_inworld_agent_pool_style_created_at", "style", "created_at"),
+    )
+    
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    style = Column(String(20), nullable=False)
+    agent_id = Column(String(100), nullable=False, unique=True)
+    scene_id = Column(String(100), nullable=True)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    
+    def __repr__(self) -> str:
+        return f"<PooledAgent {self.agent_id} ({self.style})>"
@@ -0,0 +1,39 @@
+"""Pre-generated avatar variant set database model."""
+
+import uuid
+from datetime import datetime
+
+from sqlalchemy import Column, String, DateTime, JSON, Index
+from sqlalchemy.dialects.postgresql import UUID
+
+from app.core.database import Base
+
+
+class StockedAvatarSet(Base):
+    """
+    StockedAvatarSet model for avatar variants waiting for a new character.
+    
+    Sets are generated ahead of time for each style with the default
+    prompt, so creating a character without a prompt can take one instead
+    of waiting for Stable Diffusion. A row is deleted when its set is
+    handed out, so no two characters get the same images.
+    
+    Attributes:
+        id: Unique identifier (UUID)
+        style: Visual style the set was generated in
+        variants: Stored avatar URLs
+        created_at: When the set was generated
+    """
+    
+    __tablename__ = "avatar_stock"
+    __table_args__ = (
+        Index("ix_avatar_stock_style_created_at", "style", "created_at"),
+    )
+    
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    style = Column(String(20), nullable=False)
+    variants = Column(JSON, nullable=False)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    
+    def __repr__(self) -> str:
+        return f"<StockedAvatarSet {self.id} ({self.style})>"
@@ -36,6 +36,11 @@ from app.schemas.payment import (
     CheckoutSessionResponse,
     WebhookEvent,
 )
+from app.schemas.generation_job import (
+    GenerationJobKind,
+    GenerationJobStatus,
+    GenerationJobResponse,
+)
 
 __all__ = [
     # User schemas
@@ -70,4 +75,8 @@ __all__ = [
     "CheckoutSessionRequest",
     "CheckoutSessionResponse",
     "WebhookEvent",
+    # Generation job schemas
+    "GenerationJobKind",
+    "GenerationJobStatus",
+    "GenerationJobResponse",
 ]
@@ -7,6 +7,8 @@ from uuid import UUID
 
 from pydantic import BaseModel, Field, ConfigDict
 
+from app.services.avatar_store import avatar_store
+
 
 class CharacterStyle(str, Enum):
     """Available character visual styles."""
@@ -72,7 +74,7 @@ class CharacterResponse(BaseModel):
             user_id=model.user_id,
             name=model.name,
             style=model.style,
-            avatar_url=model.avatar_url,
+            avatar_url=avatar_store.resolve(model.avatar_hash, model.avatar_url),
             inworld_agent_id=model.inworld_agent_id,
             inworld_scene_id=model.inworld_scene_id,
             params=CharacterParams(
@@ -0,0 +1,53 @@
+"""Pydantic schemas for avatar generation jobs."""
+
+from datetime import datetime
+from enum import Enum
+from typing import Any, Dict, Optional
+from uuid import UUID
+
+from pydantic import BaseModel, Field
+
+
+class GenerationJobKind(str, Enum):
+    """Endpoints that run as generation jobs."""
+    CREATE = "create"
+    VARIANTS = "variants"
+    REGENERATE = "regenerate"
+
+
+class GenerationJobStatus(str, Enum):
+    """Generation job lifecycle."""
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+
+
+class GenerationJobResponse(BaseModel):
+    """Schema for generation job API responses."""
+    job_id: UUID = Field(description="Job UUID, for GET /jobs/{job_id}")
+    kind: GenerationJobKind = Field(description="Endpoint the job runs")
+    status: GenerationJobStatus = Field(description="queued, running, succeeded or failed")
+    queue_position: Optional[int] = Field(None, description="Position in the queue while queued (1 is next)")
+    result: Optional[Dict[str, Any]] = Field(None, description="Response of the endpoint once succeeded")
+    error: Optional[str] = Field(None, description="Error detail once failed")
+    error_code: Optional[int] = Field(None, description="HTTP status of the error once failed")
+    created_at: datetime
+    started_at: Optional[datetime]
+    finished_at: Optional[datetime]
+
+    @classmethod
+    def from_orm_model(cls, model, queue_position: Optional[int] = None) -> "GenerationJobResponse":
+        """Convert ORM model to response schema."""
+        return cls(
+            job_id=model.id,
+            kind=model.kind,
+            status=model.status,
+            queue_position=queue_position,
+            result=model.result,
+            error=model.error,
+            error_code=model.error_code,
+            created_at=model.created_at,
+            started_at=model.started_at,
+            finished_at=model.finished_at,
+        )
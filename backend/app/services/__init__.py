@@ -3,9 +3,11 @@
 from app.services.sd_service import sd_service
 from app.services.inworld_service import inworld_service
 from app.services.stripe_service import stripe_service
+from app.services.chat_history import chat_history_service
 
 __all__ = [
     "sd_service",
     "inworld_service",
     "stripe_service",
+    "chat_history_service",
 ]
@@ -0,0 +1,252 @@
+"""Pool of pre-provisioned InWorld agents per style template."""
+
+import asyncio
+from typing import Any, Dict, Optional, Set, Tuple
+
+from sqlalchemy import func
+
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.models.pooled_agent import PooledAgent
+from app.services.inworld_service import STYLE_PERSONALITIES, inworld_service
+
+# Placeholder name for pooled agents until a character takes them
+POOL_AGENT_NAME = "Companion"
+
+
+class AgentPool:
+    """
+    InWorld agents created ahead of time for each style template.
+    
+    Agents only differ by style (the personality comes from
+    ``STYLE_PERSONALITIES``), so character creation can take a ready agent
+    from the ``inworld_agent_pool`` table instead of waiting for InWorld to
+    create one. The agent is renamed to the character in the background,
+    and a refill task tops the pool back up to ``size`` agents per style.
+    
+    The pool lives in the database, so every worker shares it and
+    provisioned agents survive restarts. Workers refilling at the same
+    time can overshoot the target slightly; the extra agents are used
+    first by later characters. When the pool is empty or InWorld is not
+    configured, ``take`` returns None and callers create an agent directly.
+    """
+    
+    def __init__(
+        self,
+        size: int = settings.inworld_agent_pool_size,
+        refill_interval: float = settings.inworld_agent_pool_refill_interval,
+    ):
+        self.size = size
+        self.refill_interval = refill_interval
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup = asyncio.Event()
+        self._background: Set[asyncio.Task] = set()
+        # Agents per style at the last count, plus those provisioned since
+        self._available: Dict[str, int] = {}
+        self.hits = 0
+        self.misses = 0
+        self.returned = 0
+        self.provisioned = 0
+        self.provision_failures = 0
+        self.rename_failures = 0
+    
+    @property
+    def enabled(self) -> bool:
+        """Whether agents are pooled (a size is set and InWorld is configured)."""
+        return self.size > 0 and inworld_service.is_configured
+    
+    @property
+    def is_running(self) -> bool:
+        """Whether the pool is being refilled."""
+        return self._task is not None and not self._task.done()
+    
+    def _spawn(self, coro) -> asyncio.Task:
+        """Run a coroutine in the background, keeping a reference until done."""
+        task = asyncio.create_task(coro)
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+        return task
+    
+    def _claim(self, style: str) -> Optional[Tuple[str, Optional[str]]]:
+        """Remove the oldest pooled agent of a style and return its IDs."""
+        db = SessionLocal()
+        try:
+            agent = db.query(PooledAgent).filter(
+                PooledAgent.style == style,
+            ).order_by(PooledAgent.created_at).with_for_update(skip_locked=True).first()
+            if agent is None:
+                return None
+            
+            claimed = (agent.agent_id, agent.scene_id)
+            db.delete(agent)
+            db.commit()
+            return claimed
+        finally:
+            db.close()
+    
+    async def take(self, style: str, name: str) -> Optional[Dict[str, Any]]:
+        """
+        Take a pooled agent for a new character.
+        
+        Args:
+            style: Character's style
+            name: Character's name, given to the agent in the background
+        
+        Returns:
+            Agent data like ``InWorldService.create_agent`` with
+            ``"pooled": True``, or None if no pooled agent is available
+        """
+        if not self.enabled or style not in STYLE_PERSONALITIES:
+            return None
+        
+        try:
+            claimed = await asyncio.to_thread(self._claim, style)
+        except Exception as e:
+            print(f"InWorld agent pool take failed: {e}")
+            claimed = None
+        self._wakeup.set()
+        
+        if claimed is None:
+            self.misses += 1
+            return None
+        
+        self.hits += 1
+        if self._available.get(style):
+            self._available[style] -= 1
+        
+        agent_id, scene_id = claimed
+        self._spawn(self._rename(agent_id, name, style))
+        return {
+            "agent_id": agent_id,
+            "scene_id": scene_id,
+            "display_name": name,
+            "pooled": True,
+        }
+    
+    async def put_back(self, style: str, agent: Dict[str, Any]) -> None:
+        """
+        Return a taken agent whose character could not be saved.
+        
+        It is renamed again by whichever character takes it next.
+        
+        Args:
+            style: Style the agent was taken for
+            agent: Agent data returned by ``take``
+        """
+        try:
+            await asyncio.to_thread(self._add, style, agent)
+        except Exception as e:
+            print(f"InWorld agent pool put back failed: {e}")
+            return
+        self.returned += 1
+        self._available[style] = self._available.get(style, 0) + 1
+    
+    async def _rename(self, agent_id: str, name: str, style: str) -> None:
+        """Rename a taken agent to its character."""
+        if not await inworld_service.rename_agent(agent_id, name, style):
+            self.rename_failures += 1
+    
+    def _count(self) -> Dict[str, int]:
+        """Count pooled agents per style."""
+        db = SessionLocal()
+        try:
+            rows = db.query(PooledAgent.style, func.count(PooledAgent.id)).group_by(PooledAgent.style).all()
+            return {style: count for style, count in rows}
+        finally:
+            db.close()
+    
+    def _add(self, style: str, agent: Dict[str, Any]) -> None:
+        """Store a provisioned agent."""
+        db = SessionLocal()
+        try:
+            db.add(PooledAgent(
+                style=style,
+                agent_id=agent["agent_id"],
+                scene_id=agent.get("scene_id"),
+            ))
+            db.commit()
+        finally:
+            db.close()
+    
+    async def refill(self) -> int:
+        """
+        Provision agents until every style has ``size`` of them.
+        
+        Stops at the first failed creation; the next round retries.
+        
+        Returns:
+            Number of agents provisioned
+        """
+        self._available = await asyncio.to_thread(self._count)
+        created = 0
+        
+        for style in STYLE_PERSONALITIES:
+            while self._available.get(style, 0) < self.size:
+                agent = await inworld_service.create_agent(name=POOL_AGENT_NAME, style=style)
+                if agent.get("mock"):
+                    # InWorld call failed and a mock agent came back
+                    self.provision_failures += 1
+                    return created
+                
+                await asyncio.to_thread(self._add, style, agent)
+                self._available[style] = self._available.get(style, 0) + 1
+                self.provisioned += 1
+                created += 1
+        
+        return created
+    
+    async def _run(self) -> None:
+        """Refill on the interval and whenever an agent is taken."""
+        while True:
+            self._wakeup.clear()
+            try:
+                await self.refill()
+            except Exception as e:
+                print(f"InWorld agent pool refill failed: {e}")
+            
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.refill_interval)
+            except asyncio.TimeoutError:
+                pass
+    
+    def start(self) -> None:
+        """Start refilling the pool in the background."""
+        if self.enabled and not self.is_running:
+            self._task = asyncio.create_task(self._run())
+    
+    async def stop(self) -> None:
+        """Stop refilling and wait for pending renames."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        
+        if self._background:
+            await asyncio.gather(*self._background, return_exceptions=True)
+    
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get pool counters.
+        
+        Returns:
+            Dictionary with pooled agents per style, hits and provisioning
+        """
+        return {
+            "enabled": self.enabled,
+            "running": self.is_running,
+            "size": self.size,
+            "available": dict(self._available),
+            "hits": self.hits,
+            "misses": self.misses,
+            "returned": self.returned,
+            "provisioned": self.provisioned,
+            "provision_failures": self.provision_failures,
+            "rename_failures": self.rename_failures,
+        }
+
+
+# Singleton instance
+agent_pool = AgentPool()
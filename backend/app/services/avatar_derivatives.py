@@ -0,0 +1,220 @@
+"""Pre-rendered avatar thumbnails in modern formats."""
+
+import asyncio
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+from app.core.config import settings
+from app.imaging import render as image_render
+from app.services.avatar_store import avatar_store
+from app.services.single_flight import SingleFlight
+
+
+def _parse_list(value: str) -> List[str]:
+    """Split a comma-separated setting."""
+    return [item.strip().lower() for item in value.split(",") if item.strip()]
+
+
+class AvatarDerivatives:
+    """
+    Smaller copies of stored avatars, encoded as AVIF, WebP and PNG.
+    
+    Generated avatars are 1024x1024 PNGs of a megabyte or more, while the
+    frontend shows them at 64-256 px. For every stored avatar this service
+    renders each configured size in each format Pillow supports here and
+    stores them next to the original, so the avatar endpoint can serve a
+    few kilobytes instead.
+    
+    Resizing and encoding run in a pool of worker processes; the event loop
+    only hands over the file path and writes back the results. New avatars
+    are rendered in the background as soon as they are stored (up to
+    ``max_pending`` at a time); older ones on their first request.
+    """
+    
+    def __init__(
+        self,
+        enabled: bool = settings.avatar_derivatives_enabled,
+        sizes: str = settings.avatar_derivative_sizes,
+        formats: str = settings.avatar_derivative_formats,
+        quality: int = settings.avatar_derivative_quality,
+        workers: int = settings.avatar_derivative_workers,
+        max_pending: int = settings.avatar_derivative_max_pending,
+    ):
+        self.sizes = sorted(int(size) for size in _parse_list(sizes))
+        self.formats = image_render.supported_formats(_parse_list(formats))
+        self.enabled = enabled and bool(self.sizes and self.formats)
+        self.quality = quality
+        self.workers = workers
+        self.max_pending = max_pending
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._flight = SingleFlight()
+        self._background: Set[asyncio.Task] = set()
+        self.rendered = 0
+        self.render_seconds = 0.0
+        self.on_demand = 0
+        self.failures = 0
+        self.dropped = 0
+    
+    @property
+    def is_running(self) -> bool:
+        """Whether the worker processes are up."""
+        return self._executor is not None
+    
+    def size_for(self, requested: int) -> Optional[int]:
+        """
+        Pick the derivative size for a requested display size.
+        
+        Returns:
+            Smallest configured size at least as large, or None if the
+            original is needed
+        """
+        for size in self.sizes:
+            if size >= requested:
+                return size
+        return None
+    
+    def negotiate(self, accept: Optional[str]) -> Optional[str]:
+        """
+        Pick a format from an Accept header.
+        
+        Args:
+            accept: Accept header value
+        
+        Returns:
+            The first configured format the client accepts (PNG is always
+            accepted), or None if only the original will do
+        """
+        accept = (accept or "").lower()
+        for fmt in self.formats:
+            if fmt == "png" or image_render.MEDIA_TYPES[fmt] in accept:
+                return fmt
+        return None
+    
+    async def _render(self, digest: str) -> bool:
+        """Render and store all derivatives of an avatar."""
+        source = avatar_store.path(digest)
+        if source is None or self._executor is None:
+            return False
+        
+        started = time.perf_counter()
+        try:
+            derivatives = await asyncio.get_running_loop().run_in_executor(
+                self._executor,
+                image_render.render,
+                str(source),
+                self.sizes,
+                self.formats,
+                self.quality,
+            )
+            await asyncio.to_thread(avatar_store.save_derivatives, digest, derivatives)
+        except BrokenProcessPool as e:
+            # A worker died (e.g. out of memory); replace the pool
+            self.failures += 1
+            print(f"Avatar derivative worker crashed for {digest}: {e}")
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+                self._executor = self._create_executor()
+            return False
+        except Exception as e:
+            self.failures += 1
+            print(f"Avatar derivative rendering failed for {digest}: {e}")
+            return False
+        
+        self.rendered += 1
+        self.render_seconds += time.perf_counter() - started
+        return True
+    
+    async def path(self, digest: str, size: int, fmt: str) -> Optional[Path]:
+        """
+        Get the file of a derivative, rendering it if needed.
+        
+        Args:
+            digest: SHA-256 of the original avatar
+            size: Configured size
+            fmt: Configured format
+        
+        Returns:
+            Local file, or None if the avatar does not exist or rendering failed
+        """
+        if not self.enabled or size not in self.sizes or fmt not in self.formats:
+            return None
+        
+        variant = f"{size}.{fmt}"
+        path = avatar_store.path(digest, variant)
+        if path is None and avatar_store.is_hash(digest):
+            self.on_demand += 1
+            if await self._flight.do(digest, lambda: self._render(digest)):
+                path = avatar_store.path(digest, variant)
+        return path
+    
+    def schedule(self, urls: Iterable[str]) -> None:
+        """
+        Render derivatives of newly stored avatars in the background.
+        
+        Args:
+            urls: Avatar URLs; other URLs (placeholders) are ignored
+        """
+        if not self.is_running:
+            return
+        
+        for url in urls:
+            digest = avatar_store.hash_from_url(url)
+            if digest is None:
+                continue
+            if len(self._background) >= self.max_pending:
+                # Rendered on its first request instead
+                self.dropped += 1
+                continue
+            task = asyncio.create_task(self._flight.do(digest, lambda d=digest: self._render(d)))
+            self._background.add(task)
+            task.add_done_callback(self._background.discard)
+    
+    def _create_executor(self) -> ProcessPoolExecutor:
+        # Spawned, not forked: the server process has threads running
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    
+    def start(self) -> None:
+        """Start the worker processes."""
+        if self.enabled and not self.is_running:
+            self._executor = self._create_executor()
+    
+    async def stop(self) -> None:
+        """Finish background rendering and stop the worker processes."""
+        if self._background:
+            await asyncio.gather(*self._background, return_exceptions=True)
+        
+        executor, self._executor = self._executor, None
+        if executor is not None:
+            await asyncio.to_thread(executor.shutdown, True)
+    
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get rendering counters.
+        
+        Returns:
+            Dictionary with sizes, formats, avatars rendered and render time
+        """
+        return {
+            "enabled": self.enabled,
+            "running": self.is_running,
+            "sizes": self.sizes,
+            "formats": self.formats,
+            "workers": self.workers,
+            "pending": len(self._background),
+            "rendered": self.rendered,
+            "avg_render_ms": round(self.render_seconds / self.rendered * 1000, 1) if self.rendered else 0.0,
+            "on_demand": self.on_demand,
+            "failures": self.failures,
+            "dropped": self.dropped,
+        }
+
+
+# Singleton instance
+avatar_derivatives = AvatarDerivatives()
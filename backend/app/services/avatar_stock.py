@@ -0,0 +1,259 @@
+"""Stock of pre-generated avatar variant sets per style."""
+
+import asyncio
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+
+from sqlalchemy import func
+
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.models.stocked_avatar_set import StockedAvatarSet
+from app.services.avatar_store import avatar_store
+from app.services.generation_cache import generation_cache
+from app.services.sd_service import STYLE_PROMPTS, sd_service
+
+# Variants per set, as generated for character creation
+VARIANTS_PER_SET = 4
+
+# Window for the burn rate, in seconds
+BURN_WINDOW = 3600.0
+
+
+class AvatarStock:
+    """
+    Avatar variant sets generated ahead of time for each style.
+    
+    Most new users keep the default (empty) prompt, and every such
+    request generates the same kind of images. A refill task keeps
+    ``size`` sets per style in the ``avatar_stock`` table, so creating a
+    character without a prompt takes a ready set (one indexed row, oldest
+    first) instead of waiting for Stable Diffusion. A prompt, or an empty
+    stock, falls back to live generation.
+    
+    Sets are generated outside the generation cache and deleted when
+    taken, so every character gets its own images. Like the agent pool,
+    the stock lives in the database: every worker shares it, sets survive
+    restarts, and workers refilling at the same time can overshoot the
+    target slightly.
+    """
+    
+    def __init__(
+        self,
+        size: int = settings.avatar_stock_size,
+        refill_interval: float = settings.avatar_stock_refill_interval,
+    ):
+        self.size = size
+        self.refill_interval = refill_interval
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup = asyncio.Event()
+        # Sets per style at the last count, plus those generated since
+        self._available: Dict[str, int] = {}
+        # When sets were taken in this worker, per style, within BURN_WINDOW
+        self._taken: Dict[str, Deque[float]] = {style: deque() for style in STYLE_PROMPTS}
+        self.hits = 0
+        self.misses = 0
+        self.returned = 0
+        self.refilled = 0
+        self.refill_failures = 0
+        self.refill_seconds = 0.0
+        self.last_refill_seconds = 0.0
+    
+    @property
+    def enabled(self) -> bool:
+        """Whether sets are stocked (a size is set and Stable Diffusion is configured)."""
+        return self.size > 0 and sd_service.is_configured
+    
+    @property
+    def is_running(self) -> bool:
+        """Whether the stock is being refilled."""
+        return self._task is not None and not self._task.done()
+    
+    def _claim(self, style: str) -> Optional[List[str]]:
+        """Remove the oldest stocked set of a style and return its variants."""
+        db = SessionLocal()
+        try:
+            stocked = db.query(StockedAvatarSet).filter(
+                StockedAvatarSet.style == style,
+            ).order_by(StockedAvatarSet.created_at).with_for_update(skip_locked=True).first()
+            if stocked is None:
+                return None
+            
+            variants = list(stocked.variants)
+            db.delete(stocked)
+            db.commit()
+            return variants
+        finally:
+            db.close()
+    
+    def _burn(self, style: str, now: float) -> Deque[float]:
+        """Take times of a style within the burn window."""
+        taken = self._taken[style]
+        while taken and taken[0] < now - BURN_WINDOW:
+            taken.popleft()
+        return taken
+    
+    async def take(self, style: str, prompt: Optional[str]) -> Optional[List[str]]:
+        """
+        Take a stocked variant set for a new character.
+        
+        Args:
+            style: Character's style
+            prompt: Character's appearance prompt; only an empty one
+                (after canonicalization) is served from stock
+        
+        Returns:
+            Stored avatar URLs, or None if the prompt is not empty or no
+            set is available
+        """
+        if not self.enabled or style not in STYLE_PROMPTS:
+            return None
+        if generation_cache.canonical_prompt(prompt or ""):
+            return None
+        
+        try:
+            variants = await asyncio.to_thread(self._claim, style)
+        except Exception as e:
+            print(f"Avatar stock take failed: {e}")
+            variants = None
+        self._wakeup.set()
+        
+        if not variants:
+            self.misses += 1
+            return None
+        
+        self.hits += 1
+        if self._available.get(style):
+            self._available[style] -= 1
+        now = time.monotonic()
+        self._burn(style, now).append(now)
+        return variants
+    
+    async def put_back(self, style: str, variants: List[str]) -> None:
+        """
+        Return a taken set whose character could not be saved.
+        
+        Args:
+            style: Style the set was taken for
+            variants: Avatar URLs returned by ``take``
+        """
+        try:
+            await asyncio.to_thread(self._add, style, variants)
+        except Exception as e:
+            print(f"Avatar stock put back failed: {e}")
+            return
+        self.returned += 1
+        self._available[style] = self._available.get(style, 0) + 1
+    
+    def _count(self) -> Dict[str, int]:
+        """Count stocked sets per style."""
+        db = SessionLocal()
+        try:
+            rows = db.query(StockedAvatarSet.style, func.count(StockedAvatarSet.id)).group_by(StockedAvatarSet.style).all()
+            return {style: count for style, count in rows}
+        finally:
+            db.close()
+    
+    def _add(self, style: str, variants: List[str]) -> None:
+        """Store a generated set."""
+        db = SessionLocal()
+        try:
+            db.add(StockedAvatarSet(style=style, variants=variants))
+            db.commit()
+        finally:
+            db.close()
+    
+    async def refill(self) -> int:
+        """
+        Generate sets until every style has ``size`` of them.
+        
+        Stops at the first failed generation; the next round retries.
+        
+        Returns:
+            Number of sets generated
+        """
+        self._available = await asyncio.to_thread(self._count)
+        created = 0
+        
+        for style in STYLE_PROMPTS:
+            while self._available.get(style, 0) < self.size:
+                started = time.monotonic()
+                variants = await sd_service.generate_portraits(
+                    style=style,
+                    count=VARIANTS_PER_SET,
+                    shared=False,
+                )
+                if not all(avatar_store.hash_from_url(url) for url in variants):
+                    # Generation failed and placeholders came back
+                    self.refill_failures += 1
+                    return created
+                
+                await asyncio.to_thread(self._add, style, variants)
+                self.last_refill_seconds = time.monotonic() - started
+                self.refill_seconds += self.last_refill_seconds
+                self._available[style] = self._available.get(style, 0) + 1
+                self.refilled += 1
+                created += 1
+        
+        return created
+    
+    async def _run(self) -> None:
+        """Refill on the interval and whenever a set is taken."""
+        while True:
+            self._wakeup.clear()
+            try:
+                await self.refill()
+            except Exception as e:
+                print(f"Avatar stock refill failed: {e}")
+            
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.refill_interval)
+            except asyncio.TimeoutError:
+                pass
+    
+    def start(self) -> None:
+        """Start refilling the stock in the background."""
+        if self.enabled and not self.is_running:
+            self._task = asyncio.create_task(self._run())
+    
+    async def stop(self) -> None:
+        """Stop refilling."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+    
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get stock counters.
+        
+        Returns:
+            Dictionary with stocked sets per style, sets taken per hour
+            per style, hits and refill latency
+        """
+        now = time.monotonic()
+        return {
+            "enabled": self.enabled,
+            "running": self.is_running,
+            "size": self.size,
+            "available": dict(self._available),
+            "burn_per_hour": {
+                style: round(len(self._burn(style, now)) * 3600.0 / BURN_WINDOW, 1)
+                for style in STYLE_PROMPTS
+            },
+            "hits": self.hits,
+            "misses": self.misses,
+            "returned": self.returned,
+            "refilled": self.refilled,
+            "refill_failures": self.refill_failures,
+            "avg_refill_seconds": round(self.refill_seconds / self.refilled, 1) if self.refilled else 0.0,
+            "last_refill_seconds": round(self.last_refill_seconds, 1),
+        }
+
+
+# Singleton instance
+avatar_stock = AvatarStock()
@@ -0,0 +1,210 @@
+"""Content-addressed storage for generated avatar images."""
+
+import asyncio
+import base64
+import hashlib
+import os
+import re
+import tempfile
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from app.core.config import settings
+
+# Stored avatar URLs end in "<sha256>.png"
+_HASH_URL = re.compile(r"/([0-9a-f]{64})\.png$")
+_HASH = re.compile(r"^[0-9a-f]{64}$")
+
+
+class AvatarBackend(ABC):
+    """
+    Where avatar bytes live, addressed by their SHA-256 hex digest.
+    
+    ``variant`` names a derivative of the image (``"256.webp"``); None is
+    the original PNG.
+    """
+    
+    @abstractmethod
+    def exists(self, digest: str, variant: Optional[str] = None) -> bool:
+        """Whether an image is stored."""
+    
+    @abstractmethod
+    def write(self, digest: str, data: bytes, variant: Optional[str] = None) -> None:
+        """Store an image (callers skip images that already exist)."""
+    
+    @abstractmethod
+    def path(self, digest: str, variant: Optional[str] = None) -> Optional[Path]:
+        """Local file of a stored image, or None if it is not stored."""
+
+
+class LocalAvatarBackend(AvatarBackend):
+    """
+    Avatars as files under a root directory.
+    
+    Files are sharded by the first two byte pairs of the digest
+    (``ab/cd/abcd....png``) to keep directories small, and written to a
+    temporary file first so readers never see a partial image. Derivatives
+    sit next to their original (``ab/cd/abcd..._256.webp``).
+    """
+    
+    def __init__(self, root: str):
+        self.root = Path(root)
+    
+    def _file(self, digest: str, variant: Optional[str] = None) -> Path:
+        name = f"{digest}_{variant}" if variant else f"{digest}.png"
+        return self.root / digest[:2] / digest[2:4] / name
+    
+    def exists(self, digest: str, variant: Optional[str] = None) -> bool:
+        return self._file(digest, variant).is_file()
+    
+    def write(self, digest: str, data: bytes, variant: Optional[str] = None) -> None:
+        target = self._file(digest, variant)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=target.parent, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, target)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+    
+    def path(self, digest: str, variant: Optional[str] = None) -> Optional[Path]:
+        target = self._file(digest, variant)
+        return target if target.is_file() else None
+
+
+class AvatarStore:
+    """
+    Generated avatars stored once and addressed by SHA-256.
+    
+    Stable Diffusion returns images as base64. They used to travel as
+    ``data:image/png;base64,...`` URIs in every response and in
+    ``Character.avatar_url``, megabytes each. Now images are decoded once,
+    written to the backend under their hash, and referred to by short
+    URLs (``/api/v1/avatars/<hash>.png``). Identical images are stored once,
+    and a stored image never changes, so it can be cached forever.
+    """
+    
+    def __init__(
+        self,
+        backend: AvatarBackend,
+        base_url: str = settings.avatar_base_url,
+    ):
+        self.backend = backend
+        self.base_url = base_url.rstrip("/")
+        self.stored = 0
+        self.deduplicated = 0
+        self.derivatives_stored = 0
+        self.bytes_stored = 0
+    
+    @staticmethod
+    def is_hash(value: str) -> bool:
+        """Whether a string is a SHA-256 hex digest."""
+        return bool(_HASH.match(value))
+    
+    def url_for(self, digest: str) -> str:
+        """Public URL of a stored avatar."""
+        return f"{self.base_url}/{digest}.png"
+    
+    def resolve(self, avatar_hash: Optional[str], avatar_url: Optional[str]) -> Optional[str]:
+        """Public URL of a character's avatar: the stored image, else the external URL."""
+        return self.url_for(avatar_hash) if avatar_hash else avatar_url
+    
+    def hash_from_url(self, url: Optional[str]) -> Optional[str]:
+        """
+        Get the hash behind a stored avatar URL.
+        
+        Args:
+            url: Avatar URL, absolute or relative
+        
+        Returns:
+            SHA-256 digest, or None for other URLs (placeholders, external)
+        """
+        if not url:
+            return None
+        match = _HASH_URL.search(url.split("?", 1)[0])
+        return match.group(1) if match else None
+    
+    def save(self, data: bytes) -> str:
+        """
+        Store image bytes.
+        
+        Args:
+            data: PNG image
+        
+        Returns:
+            SHA-256 digest of the image
+        """
+        digest = hashlib.sha256(data).hexdigest()
+        if self.backend.exists(digest):
+            self.deduplicated += 1
+        else:
+            self.backend.write(digest, data)
+            self.stored += 1
+            self.bytes_stored += len(data)
+        return digest
+    
+    def save_base64(self, encoded: str) -> str:
+        """
+        Decode and store a base64 image or ``data:`` URI.
+        
+        Returns:
+            SHA-256 digest of the image
+        """
+        if encoded.startswith("data:"):
+            encoded = encoded.split(",", 1)[1]
+        return self.save(base64.b64decode(encoded))
+    
+    async def save_artifacts(self, encoded: List[str]) -> List[str]:
+        """
+        Store base64 images off the event loop.
+        
+        Args:
+            encoded: Base64 images, e.g. Stable Diffusion artifacts
+        
+        Returns:
+            Public URLs of the stored images, in order
+        """
+        def save_all() -> List[str]:
+            return [self.url_for(self.save_base64(e)) for e in encoded]
+        
+        return await asyncio.to_thread(save_all)
+    
+    def path(self, digest: str, variant: Optional[str] = None) -> Optional[Path]:
+        """Local file of a stored avatar or derivative, or None if it does not exist."""
+        if not self.is_hash(digest):
+            return None
+        return self.backend.path(digest, variant)
+    
+    def save_derivatives(self, digest: str, derivatives: Dict[str, bytes]) -> None:
+        """
+        Store derivatives of an avatar.
+        
+        Args:
+            digest: SHA-256 of the original image
+            derivatives: Encoded images by variant (``"256.webp"``)
+        """
+        for variant, data in derivatives.items():
+            self.backend.write(digest, data, variant)
+            self.derivatives_stored += 1
+            self.bytes_stored += len(data)
+    
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get store counters.
+        
+        Returns:
+            Dictionary with images written, duplicates and bytes written
+        """
+        return {
+            "stored": self.stored,
+            "deduplicated": self.deduplicated,
+            "derivatives_stored": self.derivatives_stored,
+            "bytes_stored": self.bytes_stored,
+        }
+
+
+# Singleton instance
+avatar_store = AvatarStore(LocalAvatarBackend(settings.avatar_store_path))
@@ -0,0 +1,140 @@
+"""Atomic character parameter updates."""
+
+from typing import Any, Dict, List, NamedTuple, Optional
+from uuid import UUID
+
+from sqlalchemy import bindparam, case
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import Update
+
+from app.models.character import Character
+
+
+class ParamValues(NamedTuple):
+    """Character parameter values after an update."""
+    
+    energy: int
+    mood: int
+    bond: int
+
+
+def _clamped(value: Any, upper: Optional[int] = None) -> Any:
+    """
+    SQL expression clamping a value to [0, upper].
+    
+    Uses CASE rather than GREATEST/LEAST, which SQLite does not have.
+    Matches Character.clamp_energy/clamp_mood/clamp_bond.
+    """
+    whens = [(value < 0, 0)]
+    if upper is not None:
+        whens.append((value > upper, upper))
+    return case(*whens, else_=value)
+
+
+def build_params_update() -> Update:
+    """
+    Build the clamped delta UPDATE for the characters table.
+    
+    Bind parameters: ``character_id``, ``energy``, ``mood``, ``bond`` and
+    ``messages``. The message counter is incremented in the same statement,
+    and the bond earned from crossing message milestones is derived from
+    the stored counter (see Character.bond_for_messages), so every worker
+    agrees on when bond increases.
+    
+    Returns:
+        Core UPDATE statement, usable with a single parameter set or with
+        a list of them (executemany)
+    """
+    table = Character.__table__
+    messages_total = table.c.messages_total
+    messages = bindparam("messages")
+    n = Character.BOND_INCREMENT_EVERY_N_MESSAGES
+    
+    # SET expressions see the old row, so this is (m + k) // N - m // N
+    bond_from_messages = (
+        (messages_total + messages) // n - messages_total // n
+    ) * Character.BOND_INCREMENT
+    
+    return table.update().where(
+        table.c.id == bindparam("character_id"),
+    ).values(
+        params_energy=_clamped(table.c.params_energy + bindparam("energy"), 100),
+        params_mood=_clamped(table.c.params_mood + bindparam("mood"), 100),
+        params_bond=_clamped(table.c.params_bond + bindparam("bond")) + bond_from_messages,
+        messages_total=messages_total + messages,
+    )
+
+
+_table = Character.__table__
+
+_UPDATE = build_params_update()
+
+_UPDATE_RETURNING = _UPDATE.returning(
+    _table.c.params_energy,
+    _table.c.params_mood,
+    _table.c.params_bond,
+)
+
+
+class CharacterParamsService:
+    """
+    Applies energy/mood/bond changes in a single statement.
+    
+    The old pattern loaded the character, changed it in Python, committed
+    and refreshed it. That costs two round trips per write, and two
+    concurrent writers could overwrite each other's changes. Here the
+    database applies the clamped delta to the stored value, and
+    UPDATE ... RETURNING hands back the new values in the same round trip
+    (PostgreSQL, and SQLite 3.35+).
+    
+    Methods do not commit; the caller commits with the rest of its work.
+    """
+    
+    def apply_deltas(
+        self,
+        db: Session,
+        character_id: UUID,
+        energy: int = 0,
+        mood: int = 0,
+        bond: int = 0,
+        messages: int = 0,
+    ) -> Optional[ParamValues]:
+        """
+        Apply parameter changes to one character.
+        
+        Args:
+            db: Database session
+            character_id: Character to update
+            energy: Energy change (can be negative)
+            mood: Mood change (can be negative)
+            bond: Bond change (can be negative)
+            messages: Chat messages to add to the counter
+        
+        Returns:
+            New parameter values, or None if the character does not exist
+        """
+        row = db.execute(_UPDATE_RETURNING, {
+            "character_id": character_id,
+            "energy": energy,
+            "mood": mood,
+            "bond": bond,
+            "messages": messages,
+        }).first()
+        
+        return ParamValues(*row) if row is not None else None
+    
+    def apply_many(self, db: Session, deltas: List[Dict[str, Any]]) -> None:
+        """
+        Apply parameter changes to many characters in one executemany.
+        
+        Args:
+            db: Database session
+            deltas: Dicts with ``character_id``, ``energy``, ``mood``, ``bond``
+                and ``messages``
+        """
+        if deltas:
+            db.execute(_UPDATE, deltas)
+
+
+# Singleton instance
+character_params_service = CharacterParamsService()
@@ -0,0 +1,254 @@
+"""Persistent chat history storage with keyset pagination."""
+
+from datetime import datetime
+from typing import List, Optional, Tuple
+from uuid import UUID, uuid4
+
+from sqlalchemy import tuple_
+from sqlalchemy.orm import Query, Session
+
+from app.models.chat_message import ChatMessage
+
+
+class ChatHistoryService:
+    """
+    Service for storing and paging chat messages.
+    
+    Messages live in the ``chat_messages`` table and are read per
+    conversation (user + character). Cursor pages use keyset pagination
+    on (created_at, id), which is served directly by the conversation
+    index, so fetching a page costs the same regardless of how deep
+    into the history it is.
+    
+    Offset pagination is kept for the legacy ``skip``/``page`` query
+    parameters only.
+    """
+    
+    def new_message(
+        self,
+        user_id: UUID,
+        character_id: UUID,
+        role: str,
+        content: str,
+        emotion: Optional[str] = None,
+    ) -> ChatMessage:
+        """
+        Build a message with its ID and timestamp, without a session.
+        
+        Args:
+            user_id: Conversation owner
+            character_id: Character the message belongs to
+            role: Message role (user or assistant)
+            content: Message text
+            emotion: Optional character emotion for assistant messages
+        
+        Returns:
+            A transient ChatMessage instance
+        """
+        return ChatMessage(
+            id=uuid4(),
+            user_id=user_id,
+            character_id=character_id,
+            role=role,
+            content=content,
+            emotion=emotion,
+            created_at=datetime.utcnow(),
+        )
+    
+    def add_message(
+        self,
+        db: Session,
+        user_id: UUID,
+        character_id: UUID,
+        role: str,
+        content: str,
+        emotion: Optional[str] = None,
+    ) -> ChatMessage:
+        """
+        Add a message to the session without committing.
+        
+        The caller commits, so the message lands in the same transaction
+        as any parameter updates made for it.
+        
+        Args:
+            db: Database session
+            user_id: Conversation owner
+            character_id: Character the message belongs to
+            role: Message role (user or assistant)
+            content: Message text
+            emotion: Optional character emotion for assistant messages
+        
+        Returns:
+            The pending ChatMessage instance
+        """
+        message = self.new_message(user_id, character_id, role, content, emotion)
+        db.add(message)
+        return message
+    
+    def _conversation(self, db: Session, user_id: UUID, character_id: UUID) -> Query:
+        """Base query for one user-character conversation."""
+        return db.query(ChatMessage).filter(
+            ChatMessage.user_id == user_id,
+            ChatMessage.character_id == character_id,
+        )
+    
+    def _get_anchor(
+        self,
+        db: Session,
+        user_id: UUID,
+        character_id: UUID,
+        message_id: UUID,
+    ) -> ChatMessage:
+        """
+        Resolve a cursor message ID to its row.
+        
+        Raises:
+            ValueError: If the message does not belong to the conversation
+        """
+        anchor = self._conversation(db, user_id, character_id).filter(
+            ChatMessage.id == message_id,
+        ).first()
+        
+        if anchor is None:
+            raise ValueError("Unknown message cursor")
+        
+        return anchor
+    
+    def get_page_before(
+        self,
+        db: Session,
+        user_id: UUID,
+        character_id: UUID,
+        limit: int,
+        before: Optional[UUID] = None,
+    ) -> Tuple[List[ChatMessage], bool]:
+        """
+        Get the messages immediately older than a cursor.
+        
+        Without a cursor this returns the newest page of the conversation.
+        
+        Args:
+            db: Database session
+            user_id: Conversation owner
+            character_id: Character UUID
+            limit: Maximum number of messages to return
+            before: ID of the message to page back from
+        
+        Returns:
+            Tuple of (messages in chronological order, has_more)
+        
+        Raises:
+            ValueError: If the cursor does not belong to the conversation
+        """
+        query = self._conversation(db, user_id, character_id)
+        
+        if before is not None:
+            anchor = self._get_anchor(db, user_id, character_id, before)
+            query = query.filter(
+                tuple_(ChatMessage.created_at, ChatMessage.id)
+                < tuple_(anchor.created_at, anchor.id)
+            )
+        
+        rows = query.order_by(
+            ChatMessage.created_at.desc(),
+            ChatMessage.id.desc(),
+        ).limit(limit + 1).all()
+        
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        rows.reverse()
+        
+        return rows, has_more
+    
+    def get_page_after(
+        self,
+        db: Session,
+        user_id: UUID,
+        character_id: UUID,
+        limit: int,
+        after: UUID,
+    ) -> Tuple[List[ChatMessage], bool]:
+        """
+        Get the messages immediately newer than a cursor.
+        
+        Args:
+            db: Database session
+            user_id: Conversation owner
+            character_id: Character UUID
+            limit: Maximum number of messages to return
+            after: ID of the message to page forward from
+        
+        Returns:
+            Tuple of (messages in chronological order, has_more)
+        
+        Raises:
+            ValueError: If the cursor does not belong to the conversation
+        """
+        anchor = self._get_anchor(db, user_id, character_id, after)
+        
+        rows = self._conversation(db, user_id, character_id).filter(
+            tuple_(ChatMessage.created_at, ChatMessage.id)
+            > tuple_(anchor.created_at, anchor.id)
+        ).order_by(
+            ChatMessage.created_at.asc(),
+            ChatMessage.id.asc(),
+        ).limit(limit + 1).all()
+        
+        has_more = len(rows) > limit
+        return rows[:limit], has_more
+    
+    def get_offset_page(
+        self,
+        db: Session,
+        user_id: UUID,
+        character_id: UUID,
+        offset: int,
+        limit: int,
+        newest_first: bool = False,
+    ) -> List[ChatMessage]:
+        """
+        Get a page using OFFSET (legacy pagination).
+        
+        Args:
+            db: Database session
+            user_id: Conversation owner
+            character_id: Character UUID
+            offset: Number of messages to skip
+            limit: Maximum number of messages to return
+            newest_first: Count the offset from the newest message
+        
+        Returns:
+            Messages in chronological order
+        """
+        if newest_first:
+            order = (ChatMessage.created_at.desc(), ChatMessage.id.desc())
+        else:
+            order = (ChatMessage.created_at.asc(), ChatMessage.id.asc())
+        
+        rows = self._conversation(db, user_id, character_id).order_by(
+            *order
+        ).offset(offset).limit(limit).all()
+        
+        if newest_first:
+            rows.reverse()
+        
+        return rows
+    
+    def count(self, db: Session, user_id: UUID, character_id: UUID) -> int:
+        """Count all messages in a conversation."""
+        return self._conversation(db, user_id, character_id).count()
+    
+    def clear(self, db: Session, user_id: UUID, character_id: UUID) -> int:
+        """
+        Delete all messages in a conversation without committing.
+        
+        Returns:
+            Number of deleted messages
+        """
+        return self._conversation(db, user_id, character_id).delete(
+            synchronize_session=False,
+        )
+
+
+# Singleton instance
+chat_history_service = ChatHistoryService()
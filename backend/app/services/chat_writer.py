@@ -0,0 +1,225 @@
+"""Background write queue for chat messages."""
+
+import asyncio
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional, Sequence
+
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.models.chat_message import ChatMessage
+from app.services.conversation_cache import ConversationCache, conversation_cache
+
+
+class ChatWriter:
+    """
+    Bounded asyncio queue that persists chat messages in batches.
+    
+    Chat endpoints enqueue the messages of a turn and return without
+    waiting for the database. A background task takes everything queued
+    (up to ``batch_size`` messages) and inserts it in one transaction in a
+    worker thread, so bursts of chat turns become a few large commits.
+    
+    When the queue is full, ``enqueue`` waits for room (backpressure)
+    instead of growing memory without bound. ``stop`` drains the queue
+    on shutdown. Writing is only asynchronous while the writer runs
+    (between ``start`` and ``stop`` in the app lifespan); otherwise
+    ``enqueue`` writes directly.
+    """
+    
+    def __init__(
+        self,
+        max_size: int = settings.chat_write_queue_size,
+        batch_size: int = settings.chat_write_batch_size,
+        max_retries: int = 3,
+    ):
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        # Queued message counts per conversation key
+        self._pending: Counter = Counter()
+        self.enqueued = 0
+        self.written = 0
+        self.failed = 0
+        self.batches = 0
+        self.backpressure_waits = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self._total_flush_ms = 0.0
+    
+    @property
+    def is_running(self) -> bool:
+        """Whether messages are currently written in the background."""
+        return self._task is not None and not self._task.done()
+    
+    @property
+    def depth(self) -> int:
+        """Number of queued turns."""
+        return self._queue.qsize() if self._queue is not None else 0
+    
+    @staticmethod
+    def _key(message: ChatMessage) -> str:
+        return ConversationCache.make_key(message.user_id, message.character_id)
+    
+    def has_pending(self, key: str) -> bool:
+        """
+        Check whether a conversation has messages not yet written.
+        
+        Args:
+            key: Conversation key (see ConversationCache.make_key)
+        """
+        return self._pending[key] > 0
+    
+    async def enqueue(self, messages: Sequence[ChatMessage]) -> None:
+        """
+        Queue messages for insertion, waiting if the queue is full.
+        
+        Messages from one call are written in the same transaction.
+        
+        Args:
+            messages: Transient ChatMessage instances with IDs and timestamps
+        """
+        if not self.is_running:
+            await asyncio.to_thread(self._write, list(messages))
+            return
+        
+        if self._queue.full():
+            self.backpressure_waits += 1
+        
+        for message in messages:
+            self._pending[self._key(message)] += 1
+        await self._queue.put(list(messages))
+        self.enqueued += len(messages)
+    
+    async def wait_idle(self) -> None:
+        """Wait until every queued message has been written."""
+        if self._queue is not None:
+            await self._queue.join()
+    
+    def _write(self, messages: List[ChatMessage]) -> None:
+        """Insert messages in one transaction (runs in a worker thread)."""
+        db = SessionLocal()
+        try:
+            db.add_all(messages)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+    
+    async def _write_turns(self, batch: List[List[ChatMessage]]) -> None:
+        """
+        Write each turn in its own transaction, dropping only turns that fail.
+        
+        Queued turns are already in the conversation cache, so the cached
+        conversation of a dropped turn is invalidated and reloaded from
+        the database.
+        """
+        for turn in batch:
+            try:
+                await asyncio.to_thread(self._write, turn)
+                self.written += len(turn)
+            except Exception as e:
+                print(f"Chat write failed, dropping {len(turn)} message(s): {e}")
+                self.failed += len(turn)
+                for key in {self._key(message) for message in turn}:
+                    conversation_cache.invalidate(key)
+    
+    async def _flush(self, batch: List[List[ChatMessage]]) -> None:
+        """
+        Write a batch of turns, retrying transient failures.
+        
+        If the batch still fails, its turns are written one by one, so a
+        single bad turn (e.g. for a character deleted meanwhile) does not
+        lose the others.
+        """
+        messages = [message for turn in batch for message in turn]
+        started = time.perf_counter()
+        
+        for attempt in range(1, self.max_retries + 1):
+            try:
+                await asyncio.to_thread(self._write, messages)
+                self.written += len(messages)
+                break
+            except Exception as e:
+                print(f"Chat write failed (attempt {attempt}/{self.max_retries}): {e}")
+                if attempt == self.max_retries:
+                    await self._write_turns(batch)
+                else:
+                    await asyncio.sleep(0.1 * 2 ** attempt)
+        
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self.batches += 1
+        self.last_flush_ms = elapsed_ms
+        self.max_flush_ms = max(self.max_flush_ms, elapsed_ms)
+        self._total_flush_ms += elapsed_ms
+        
+        for message in messages:
+            key = self._key(message)
+            self._pending[key] -= 1
+            if self._pending[key] <= 0:
+                del self._pending[key]
+    
+    async def _run(self) -> None:
+        """Take whatever is queued, up to the batch size, and write it."""
+        while True:
+            batch = [await self._queue.get()]
+            size = len(batch[0])
+            while size < self.batch_size and not self._queue.empty():
+                turn = self._queue.get_nowait()
+                batch.append(turn)
+                size += len(turn)
+            
+            try:
+                await self._flush(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+    
+    def start(self) -> None:
+        """Start the background writer."""
+        if not self.is_running:
+            self._queue = asyncio.Queue(maxsize=self.max_size)
+            self._task = asyncio.create_task(self._run())
+    
+    async def stop(self) -> None:
+        """Write everything still queued, then stop the writer."""
+        if self._task is None:
+            return
+        
+        await self.wait_idle()
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+    
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get queue counters.
+        
+        Returns:
+            Dictionary with queue depth, throughput and flush latency
+        """
+        return {
+            "running": self.is_running,
+            "depth": self.depth,
+            "max_size": self.max_size,
+            "batch_size": self.batch_size,
+            "enqueued": self.enqueued,
+            "written": self.written,
+            "failed": self.failed,
+            "batches": self.batches,
+            "backpressure_waits": self.backpressure_waits,
+            "last_flush_ms": round(self.last_flush_ms, 2),
+            "avg_flush_ms": round(self._total_flush_ms / self.batches, 2) if self.batches else 0.0,
+            "max_flush_ms": round(self.max_flush_ms, 2),
+        }
+
+
+# Singleton instance
+chat_writer = ChatWriter()
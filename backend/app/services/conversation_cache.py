@@ -0,0 +1,234 @@
+"""Bounded in-memory cache for recent conversation messages."""
+
+import sys
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from app.core.config import settings
+
+
+# Rough per-message overhead (object headers, dict slots, datetime, IDs)
+MESSAGE_OVERHEAD_BYTES = 400
+
+# Rough per-conversation overhead (entry object, deque, OrderedDict slot)
+CONVERSATION_OVERHEAD_BYTES = 300
+
+
+def estimate_message_size(message: Any) -> int:
+    """
+    Estimate the memory footprint of a cached message in bytes.
+    
+    Only the variable-length text fields are measured exactly; everything
+    else is covered by a fixed overhead so the estimate stays cheap.
+    
+    Args:
+        message: Message object with ``content`` and ``emotion`` attributes
+    
+    Returns:
+        Estimated size in bytes
+    """
+    size = MESSAGE_OVERHEAD_BYTES + sys.getsizeof(message.content)
+    if message.emotion:
+        size += sys.getsizeof(message.emotion)
+    return size
+
+
+@dataclass
+class CachedConversation:
+    """
+    Cached tail of one user-character conversation.
+    
+    Attributes:
+        messages: Newest messages, oldest first
+        total: Total messages in storage, if the window was loaded from it
+        size_bytes: Estimated memory footprint of this entry
+    """
+    
+    messages: Deque[Any]
+    total: Optional[int] = None
+    size_bytes: int = CONVERSATION_OVERHEAD_BYTES
+    
+    @property
+    def is_loaded(self) -> bool:
+        """Whether the window mirrors the tail of the stored conversation."""
+        return self.total is not None
+
+
+class ConversationCache:
+    """
+    LRU cache of the last N messages of active conversations.
+    
+    The cache is bounded twice: each conversation keeps at most
+    ``max_messages_per_session`` messages, and the estimated size of all
+    conversations together stays under ``max_bytes``. When the budget is
+    exceeded, whole conversations are evicted least-recently-used first.
+    
+    The cache lives in a single worker process and is only a read
+    accelerator for the newest history page; the database stays the
+    source of truth.
+    """
+    
+    def __init__(
+        self,
+        max_bytes: int = settings.chat_cache_max_bytes,
+        max_messages_per_session: int = settings.chat_cache_messages_per_session,
+    ):
+        self.max_bytes = max_bytes
+        self.max_messages_per_session = max_messages_per_session
+        self._conversations: "OrderedDict[str, CachedConversation]" = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.evicted_bytes = 0
+    
+    @staticmethod
+    def make_key(user_id: Any, character_id: Any) -> str:
+        """Build the cache key for a user-character conversation."""
+        return f"{user_id}_{character_id}"
+    
+    def __len__(self) -> int:
+        return len(self._conversations)
+    
+    @property
+    def size_bytes(self) -> int:
+        """Estimated memory used by all cached conversations."""
+        return self._bytes
+    
+    def _touch(self, key: str) -> CachedConversation:
+        """Get or create an entry and mark it most recently used."""
+        entry = self._conversations.get(key)
+        if entry is None:
+            entry = CachedConversation(
+                messages=deque(maxlen=self.max_messages_per_session),
+            )
+            self._conversations[key] = entry
+            self._bytes += entry.size_bytes
+        else:
+            self._conversations.move_to_end(key)
+        return entry
+    
+    def _resize(self, entry: CachedConversation, new_size: int) -> None:
+        """Update an entry's size and the cache total."""
+        self._bytes += new_size - entry.size_bytes
+        entry.size_bytes = new_size
+    
+    def _evict(self, keep: Optional[str] = None) -> None:
+        """Evict least-recently-used conversations until under budget."""
+        while self._bytes > self.max_bytes and self._conversations:
+            key, entry = next(iter(self._conversations.items()))
+            if key == keep and len(self._conversations) == 1:
+                break
+            del self._conversations[key]
+            self._bytes -= entry.size_bytes
+            self.evictions += 1
+            self.evicted_bytes += entry.size_bytes
+    
+    def append(self, key: str, message: Any) -> None:
+        """
+        Append a stored message to a cached conversation.
+        
+        Conversations whose window was never loaded are not filled from
+        writes alone, because older stored messages would be missing.
+        
+        Args:
+            key: Conversation key
+            message: Message that has been committed to storage
+        """
+        entry = self._conversations.get(key)
+        if entry is None or not entry.is_loaded:
+            return
+        
+        self._conversations.move_to_end(key)
+        size = entry.size_bytes + estimate_message_size(message)
+        if len(entry.messages) == entry.messages.maxlen:
+            size -= estimate_message_size(entry.messages[0])
+        entry.messages.append(message)
+        entry.total += 1
+        self._resize(entry, size)
+        self._evict(keep=key)
+    
+    def load(self, key: str, messages: List[Any], total: int) -> None:
+        """
+        Fill a conversation window from storage.
+        
+        Args:
+            key: Conversation key
+            messages: Newest stored messages, oldest first
+            total: Total number of stored messages in the conversation
+        """
+        entry = self._touch(key)
+        entry.messages.clear()
+        entry.messages.extend(messages)
+        entry.total = total
+        size = CONVERSATION_OVERHEAD_BYTES + sum(
+            estimate_message_size(m) for m in entry.messages
+        )
+        self._resize(entry, size)
+        self._evict(keep=key)
+    
+    def get_latest(self, key: str, limit: int) -> Optional[Tuple[List[Any], int]]:
+        """
+        Get the newest messages of a conversation if the window covers them.
+        
+        Args:
+            key: Conversation key
+            limit: Number of newest messages wanted
+        
+        Returns:
+            Tuple of (messages oldest first, total stored messages),
+            or None on a cache miss
+        """
+        entry = self._conversations.get(key)
+        if (
+            entry is None
+            or not entry.is_loaded
+            or (len(entry.messages) < limit and entry.total > len(entry.messages))
+        ):
+            self.misses += 1
+            return None
+        
+        self._conversations.move_to_end(key)
+        self.hits += 1
+        messages = list(entry.messages)
+        return messages[-limit:] if limit < len(messages) else messages, entry.total
+    
+    def clear_messages(self, key: str) -> None:
+        """Mark a conversation as empty after its history was deleted."""
+        entry = self._conversations.get(key)
+        if entry is None:
+            return
+        entry.messages.clear()
+        entry.total = 0
+        self._resize(entry, CONVERSATION_OVERHEAD_BYTES)
+    
+    def invalidate(self, key: str) -> None:
+        """Drop a conversation from the cache."""
+        entry = self._conversations.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry.size_bytes
+    
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get cache counters.
+        
+        Returns:
+            Dictionary with hit/miss/eviction counters and memory usage
+        """
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "evicted_bytes": self.evicted_bytes,
+            "conversations": len(self._conversations),
+            "size_bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "max_messages_per_session": self.max_messages_per_session,
+        }
+
+
+# Singleton instance
+conversation_cache = ConversationCache()
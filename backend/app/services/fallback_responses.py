@@ -0,0 +1,141 @@
+"""Local replies used when InWorld is unavailable or not configured."""
+
+import json
+import random
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+from app.services.message_analysis import analyze_message
+
+DATA_PATH = Path(__file__).resolve().parents[1] / "data" / "fallback_responses.json"
+
+# Sessions whose last reply is remembered
+MAX_REMEMBERED_SESSIONS = 10000
+
+
+@dataclass(frozen=True)
+class ReplySet:
+    """
+    Replies for one intent and style.
+    
+    Attributes:
+        named: All templates; ``{name}`` is replaced with the character's name
+        nameless: Templates usable without a name
+    """
+    
+    named: Tuple[str, ...]
+    nameless: Tuple[str, ...]
+
+
+class FallbackResponder:
+    """
+    Data-driven fallback replies with per-session memory.
+    
+    Replies come from ``app/data/fallback_responses.json``, loaded once:
+    per intent an emotion and reply templates, plus per-style templates
+    that replace the generic ones for some intents. The intent is taken
+    from ``analyze_message``, so a reply costs one memoised keyword scan
+    and a random pick; this keeps breaker-open and unconfigured modes
+    cheap. The last reply of each session is remembered so the same line
+    is not given twice in a row.
+    """
+    
+    def __init__(self, data: Dict[str, Any], max_sessions: int = MAX_REMEMBERED_SESSIONS):
+        self.max_sessions = max_sessions
+        self._emotions: Dict[str, str] = {}
+        self._replies: Dict[Tuple[str, Optional[str]], ReplySet] = {}
+        self._last: "OrderedDict[str, str]" = OrderedDict()
+        self.replies_given = 0
+        
+        for intent, entry in data["intents"].items():
+            self._emotions[intent] = entry.get("emotion", "neutral")
+            self._replies[(intent, None)] = self._reply_set(entry["replies"])
+        for style, overrides in data.get("styles", {}).items():
+            for intent, templates in overrides.items():
+                self._replies[(intent, style)] = self._reply_set(templates)
+        
+        if ("default", None) not in self._replies:
+            raise ValueError("Fallback responses need a 'default' intent")
+    
+    @staticmethod
+    def _reply_set(templates: Any) -> ReplySet:
+        templates = tuple(templates)
+        nameless = tuple(t for t in templates if "{name}" not in t)
+        return ReplySet(named=templates, nameless=nameless or templates)
+    
+    @classmethod
+    def load(cls, path: Path = DATA_PATH) -> "FallbackResponder":
+        """Load replies from a JSON data file."""
+        with open(path, encoding="utf-8") as f:
+            return cls(json.load(f))
+    
+    def _pick(self, templates: Tuple[str, ...], last: Optional[str]) -> str:
+        """Pick a random template, avoiding the previous reply."""
+        index = random.randrange(len(templates))
+        if templates[index] == last and len(templates) > 1:
+            index = (index + random.randrange(1, len(templates))) % len(templates)
+        return templates[index]
+    
+    def respond(
+        self,
+        message: str,
+        session_key: Optional[str] = None,
+        name: Optional[str] = None,
+        style: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """
+        Build a fallback reply to a message.
+        
+        Args:
+            message: User's message
+            session_key: Conversation to avoid repeats in, if any
+            name: Character's name, for templates that use it
+            style: Character's style, for style-specific templates
+        
+        Returns:
+            Reply dictionary with content, emotion and action, flagged ``mock``
+        """
+        analysis = analyze_message(message)
+        intent = analysis.intent if (analysis.intent, None) in self._replies else "default"
+        
+        replies = self._replies.get((intent, style)) or self._replies[(intent, None)]
+        templates = replies.named if name else replies.nameless
+        
+        last = self._last.get(session_key) if session_key else None
+        template = self._pick(templates, last)
+        
+        if session_key:
+            self._last[session_key] = template
+            self._last.move_to_end(session_key)
+            if len(self._last) > self.max_sessions:
+                self._last.popitem(last=False)
+        
+        emotion = analysis.mock_emotion
+        if emotion == "neutral":
+            emotion = self._emotions[intent]
+        
+        self.replies_given += 1
+        return {
+            "content": template.replace("{name}", name) if name else template,
+            "emotion": emotion,
+            "action": None,
+            "mock": True,
+        }
+    
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get fallback counters.
+        
+        Returns:
+            Dictionary with replies given and remembered sessions
+        """
+        return {
+            "replies_given": self.replies_given,
+            "sessions": len(self._last),
+        }
+
+
+# Singleton instance
+fallback_responder = FallbackResponder.load()
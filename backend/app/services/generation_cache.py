@@ -0,0 +1,201 @@
+"""Cache of generated portrait sets by style and prompt."""
+
+import hashlib
+import json
+import re
+import unicodedata
+from collections import Counter, OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+from app.core.config import settings
+
+# Separators between prompt tags
+_TAG_SEPARATORS = re.compile(r"[,;\n]+")
+# Punctuation around a tag
+_EDGE_PUNCTUATION = re.compile(r"^[^\w(]+|[^\w)]+$")
+
+
+@dataclass
+class CachedGeneration:
+    """
+    A generated portrait set.
+    
+    Attributes:
+        style: Visual style it was generated for
+        urls: Stored avatar URLs
+        size: Bytes of the images
+    """
+    
+    style: str
+    urls: List[str]
+    size: int
+
+
+class GenerationCache:
+    """
+    Reuses Stable Diffusion portrait sets for identical requests.
+    
+    Many Avatar Studio requests ask for the same thing, above all the empty
+    prompt of each style, and every one costs a full Stable Diffusion run.
+    Sets are cached by style, canonical prompt and count: the prompt is
+    lowercased and split into comma-separated tags, which are trimmed,
+    deduplicated and sorted, so "Red hair,  green eyes" and "green eyes,
+    red hair" share an entry. Callers send the canonical prompt upstream,
+    so a cached set is exactly what a new generation would have been asked
+    for.
+    
+    Entries are avatar store URLs, so hits cost a dictionary lookup. The
+    cache is bounded by ``max_bytes`` of the images it refers to, dropping
+    the least recently used sets; dropped images stay in the store because
+    characters may use them. Callers can skip the cache (``fresh``) to get
+    new images; those are not cached, so they stay with that caller and
+    the cached set keeps serving everyone else.
+    """
+    
+    def __init__(
+        self,
+        enabled: bool = settings.generation_cache_enabled,
+        max_bytes: int = settings.generation_cache_max_bytes,
+    ):
+        self.enabled = enabled
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, CachedGeneration]" = OrderedDict()
+        self._bytes = 0
+        self.hits: Counter = Counter()
+        self.misses: Counter = Counter()
+        self.fresh: Counter = Counter()
+        self.stores = 0
+        self.evicted = 0
+        self.rejected = 0
+    
+    @staticmethod
+    def canonical_prompt(prompt: Optional[str]) -> str:
+        """
+        Canonical form of an appearance prompt.
+        
+        Args:
+            prompt: User's appearance description
+        
+        Returns:
+            Sorted, deduplicated, lowercased tags joined by ", "
+        """
+        if not prompt:
+            return ""
+        text = unicodedata.normalize("NFKC", prompt).lower()
+        tags = set()
+        for tag in _TAG_SEPARATORS.split(text):
+            tag = " ".join(_EDGE_PUNCTUATION.sub("", tag.strip()).split())
+            if tag:
+                tags.add(tag)
+        return ", ".join(sorted(tags))
+    
+    @staticmethod
+    def key_for(style: str, prompt: str, count: int) -> str:
+        """
+        Build the cache key of a request.
+        
+        Args:
+            style: Visual style
+            prompt: Canonical prompt from ``canonical_prompt``
+            count: Number of images
+        
+        Returns:
+            Hex SHA-256 of the request
+        """
+        data = json.dumps([style, prompt, count], ensure_ascii=False)
+        return hashlib.sha256(data.encode("utf-8")).hexdigest()
+    
+    def get(self, key: str, style: str) -> Optional[List[str]]:
+        """
+        Look up a cached portrait set.
+        
+        Args:
+            key: Key from ``key_for``
+            style: Visual style, for per-style hit rates
+        
+        Returns:
+            Avatar URLs, or None on a miss
+        """
+        if not self.enabled:
+            return None
+        
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses[style] += 1
+            return None
+        
+        self._entries.move_to_end(key)
+        self.hits[style] += 1
+        return list(entry.urls)
+    
+    def skip(self, style: str) -> None:
+        """Count a request that asked for new images instead of cached ones."""
+        if self.enabled:
+            self.fresh[style] += 1
+    
+    def put(self, key: str, style: str, urls: List[str], size: int) -> None:
+        """
+        Store a generated portrait set, replacing any cached one.
+        
+        Args:
+            key: Key from ``key_for``
+            style: Visual style
+            urls: Stored avatar URLs; placeholders must not be stored
+            size: Bytes of the images
+        """
+        if not self.enabled or not urls:
+            return
+        if size > self.max_bytes:
+            self.rejected += 1
+            return
+        
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self._bytes -= previous.size
+        
+        self._entries[key] = CachedGeneration(style=style, urls=list(urls), size=size)
+        self._bytes += size
+        self.stores += 1
+        
+        while self._bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= evicted.size
+            self.evicted += 1
+    
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get cache counters.
+        
+        Returns:
+            Dictionary with entries, bytes and hit rates overall and per style
+        """
+        hits = sum(self.hits.values())
+        lookups = hits + sum(self.misses.values())
+        by_style = {}
+        for style in sorted(set(self.hits) | set(self.misses) | set(self.fresh)):
+            style_lookups = self.hits[style] + self.misses[style]
+            by_style[style] = {
+                "hits": self.hits[style],
+                "misses": self.misses[style],
+                "fresh": self.fresh[style],
+                "hit_rate": round(self.hits[style] / style_lookups, 4) if style_lookups else 0.0,
+            }
+        
+        return {
+            "enabled": self.enabled,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "hits": hits,
+            "misses": lookups - hits,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            "stores": self.stores,
+            "evicted": self.evicted,
+            "rejected": self.rejected,
+            "styles": by_style,
+        }
+
+
+# Singleton instance
+generation_cache = GenerationCache()
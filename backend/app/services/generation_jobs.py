@@ -0,0 +1,568 @@
+"""Background avatar generation jobs."""
+
+import asyncio
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Set
+from uuid import UUID
+
+from fastapi import HTTPException, status
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.models.generation_job import GenerationJob
+
+# Statuses of jobs that have not finished
+ACTIVE_STATUSES = ("queued", "running")
+
+
+@dataclass(frozen=True)
+class JobContext:
+    """
+    A claimed job, as passed to its handler.
+    
+    Attributes:
+        id: Job ID
+        user_id: User who requested the job
+        kind: Job type
+        payload: Request body, plus path parameters
+        attempt: Claim number; fences writes against a worker that took over
+    """
+    
+    id: UUID
+    user_id: UUID
+    kind: str
+    payload: Dict[str, Any]
+    attempt: int
+
+
+JobHandler = Callable[[JobContext], Awaitable[Dict[str, Any]]]
+
+
+class JobLost(Exception):
+    """Another worker took over the job after its lease ran out."""
+
+
+class GenerationJobService:
+    """
+    Runs avatar generation in a bounded pool of background workers.
+    
+    Stable Diffusion calls take up to a minute and a half. Instead of
+    holding the HTTP request and a database session for that long,
+    endpoints ``submit`` a job and return its ID; clients poll it or
+    ``watch`` it over server-sent events. Handlers are registered per job
+    kind by the endpoints that submit them.
+    
+    Jobs live in the ``generation_jobs`` table. Each process runs
+    ``workers`` workers that claim the oldest queued job with SKIP LOCKED,
+    so throughput is capped at ``workers`` generations per process however
+    many jobs are queued. A worker holds a lease on its job and renews it
+    while the job runs; when a worker dies, the lease runs out and another
+    worker (or the restarted one) claims the job again, up to
+    ``max_attempts`` times. Handler errors below 500 fail the job at once.
+    
+    Handlers with side effects call ``complete`` in their own transaction,
+    so the job cannot succeed without its writes or run them twice.
+    """
+    
+    def __init__(
+        self,
+        workers: int = settings.generation_job_workers,
+        lease: float = settings.generation_job_lease,
+        poll_interval: float = settings.generation_job_poll_interval,
+        max_attempts: int = settings.generation_job_max_attempts,
+        max_active_per_user: int = settings.generation_job_max_active_per_user,
+        ttl_hours: int = settings.generation_job_ttl_hours,
+        sweep_interval: float = settings.generation_job_sweep_interval,
+    ):
+        self.workers = workers
+        self.lease = timedelta(seconds=lease)
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.max_active_per_user = max_active_per_user
+        self.ttl = timedelta(hours=ttl_hours)
+        self.sweep_interval = sweep_interval
+        self._handlers: Dict[str, JobHandler] = {}
+        self._tasks: List[asyncio.Task] = []
+        self._sweeper: Optional[asyncio.Task] = None
+        self._wakeup = asyncio.Event()
+        self._running: Dict[UUID, JobContext] = {}
+        self._watchers: Dict[UUID, Set[asyncio.Event]] = {}
+        self.submitted = 0
+        self.rejected = 0
+        self.succeeded = 0
+        self.failed = 0
+        self.retried = 0
+        self.recovered = 0
+        self.lost = 0
+        self.swept = 0
+    
+    @property
+    def is_running(self) -> bool:
+        """Whether workers are running jobs."""
+        return any(not task.done() for task in self._tasks)
+    
+    def register(self, kind: str, handler: JobHandler) -> None:
+        """
+        Set the handler for a job kind.
+        
+        Args:
+            kind: Job type
+            handler: Coroutine function running a job and returning its
+                JSON-serializable result
+        """
+        self._handlers[kind] = handler
+    
+    # ========================================================================
+    # Submitting and reading jobs
+    # ========================================================================
+    
+    def _insert(self, user_id: UUID, kind: str, payload: Dict[str, Any]) -> Optional[GenerationJob]:
+        """Queue a job unless the user has too many active ones."""
+        db = SessionLocal()
+        try:
+            active = db.query(GenerationJob).filter(
+                GenerationJob.user_id == user_id,
+                GenerationJob.status.in_(ACTIVE_STATUSES),
+            ).count()
+            if active >= self.max_active_per_user:
+                return None
+            
+            now = datetime.utcnow()
+            job = GenerationJob(
+                user_id=user_id,
+                kind=kind,
+                status="queued",
+                payload=payload,
+                attempts=0,
+                created_at=now,
+                updated_at=now,
+            )
+            db.add(job)
+            db.commit()
+            db.refresh(job)
+            return job
+        finally:
+            db.close()
+    
+    async def submit(self, user_id: UUID, kind: str, payload: Dict[str, Any]) -> GenerationJob:
+        """
+        Queue a job.
+        
+        Args:
+            user_id: User requesting the job
+            kind: Job type, with a registered handler
+            payload: JSON-serializable request data for the handler
+        
+        Returns:
+            The queued job
+        
+        Raises:
+            HTTPException: 429 if the user already has
+                ``max_active_per_user`` jobs queued or running
+        """
+        if kind not in self._handlers:
+            raise ValueError(f"No handler for generation job kind {kind!r}")
+        
+        job = await asyncio.to_thread(self._insert, user_id, kind, payload)
+        if job is None:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail=f"At most {self.max_active_per_user} generations can be in progress at once",
+            )
+        
+        self.submitted += 1
+        self._wakeup.set()
+        return job
+    
+    def _load(self, job_id: UUID, user_id: UUID) -> Optional[GenerationJob]:
+        """Load a user's job."""
+        db = SessionLocal()
+        try:
+            return db.query(GenerationJob).filter(
+                GenerationJob.id == job_id,
+                GenerationJob.user_id == user_id,
+            ).first()
+        finally:
+            db.close()
+    
+    def _queue_position(self, job: GenerationJob) -> Optional[int]:
+        """Number of queued jobs ahead of a queued job, plus one."""
+        if job.status != "queued":
+            return None
+        db = SessionLocal()
+        try:
+            return db.query(GenerationJob).filter(
+                GenerationJob.status == "queued",
+                GenerationJob.created_at < job.created_at,
+            ).count() + 1
+        finally:
+            db.close()
+    
+    async def get(self, job_id: UUID, user_id: UUID) -> Optional[GenerationJob]:
+        """
+        Get a user's job.
+        
+        Args:
+            job_id: Job ID
+            user_id: User who must own the job
+        
+        Returns:
+            The job, or None if it doesn't exist or belongs to someone else
+        """
+        return await asyncio.to_thread(self._load, job_id, user_id)
+    
+    async def queue_position(self, job: GenerationJob) -> Optional[int]:
+        """
+        Get a queued job's position in the queue (1 is next).
+        
+        Returns:
+            Position, or None if the job is not queued
+        """
+        return await asyncio.to_thread(self._queue_position, job)
+    
+    async def watch(
+        self,
+        job_id: UUID,
+        user_id: UUID,
+        heartbeat: Optional[float] = None,
+    ) -> AsyncIterator[GenerationJob]:
+        """
+        Follow a job until it finishes.
+        
+        Changes made in this process are seen at once; changes made by
+        workers in other processes within ``poll_interval`` seconds.
+        
+        Args:
+            job_id: Job ID
+            user_id: User who must own the job
+            heartbeat: Seconds after which an unchanged job is yielded
+                again, to keep idle connections open
+        
+        Yields:
+            The job each time its status changes, ending with the finished job
+        """
+        loop = asyncio.get_running_loop()
+        changed = asyncio.Event()
+        self._watchers.setdefault(job_id, set()).add(changed)
+        last_state = None
+        last_yield = loop.time()
+        try:
+            while True:
+                changed.clear()
+                job = await self.get(job_id, user_id)
+                if job is None:
+                    return
+                
+                # Lease renewals touch the row without changing its state
+                state = (job.status, job.attempts)
+                if state != last_state or (heartbeat and loop.time() - last_yield >= heartbeat):
+                    last_state = state
+                    last_yield = loop.time()
+                    yield job
+                if job.is_finished:
+                    return
+                
+                try:
+                    await asyncio.wait_for(changed.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            watchers = self._watchers.get(job_id)
+            if watchers is not None:
+                watchers.discard(changed)
+                if not watchers:
+                    del self._watchers[job_id]
+    
+    def _notify(self, job_id: UUID) -> None:
+        """Wake watchers of a job."""
+        for changed in self._watchers.get(job_id, ()):
+            changed.set()
+    
+    # ========================================================================
+    # Running jobs
+    # ========================================================================
+    
+    def _claim(self) -> Optional[JobContext]:
+        """Take the oldest queued job, or a running job whose lease ran out."""
+        db = SessionLocal()
+        try:
+            while True:
+                now = datetime.utcnow()
+                job = db.query(GenerationJob).filter(
+                    or_(
+                        GenerationJob.status == "queued",
+                        and_(
+                            GenerationJob.status == "running",
+                            GenerationJob.lease_expires_at < now,
+                        ),
+                    ),
+                ).order_by(GenerationJob.created_at).with_for_update(skip_locked=True).first()
+                if job is None:
+                    return None
+                
+                # Read before commit expires the instance
+                claimed = JobContext(job.id, job.user_id, job.kind, dict(job.payload), job.attempts + 1)
+                previous_status = job.status
+                
+                # A running job's worker stopped without finishing it
+                stale = previous_status == "running"
+                if stale and job.attempts >= self.max_attempts:
+                    values = {
+                        GenerationJob.status: "failed",
+                        GenerationJob.error: "Generation did not finish",
+                        GenerationJob.error_code: status.HTTP_500_INTERNAL_SERVER_ERROR,
+                        GenerationJob.lease_expires_at: None,
+                        GenerationJob.finished_at: now,
+                    }
+                else:
+                    values = {
+                        GenerationJob.status: "running",
+                        GenerationJob.attempts: job.attempts + 1,
+                        GenerationJob.lease_expires_at: now + self.lease,
+                        GenerationJob.started_at: job.started_at or now,
+                    }
+                values[GenerationJob.updated_at] = now
+                
+                # Compare-and-set on status and attempts so only one worker claims it
+                taken = db.query(GenerationJob).filter(
+                    GenerationJob.id == claimed.id,
+                    GenerationJob.status == previous_status,
+                    GenerationJob.attempts == claimed.attempt - 1,
+                ).update(values, synchronize_session=False)
+                db.commit()
+                if not taken:
+                    continue
+                
+                if stale:
+                    self.recovered += 1
+                if values[GenerationJob.status] == "failed":
+                    self.failed += 1
+                    continue
+                return claimed
+        finally:
+            db.close()
+    
+    def _fenced(self, db: Session, job: JobContext):
+        """Query for a job still held by this claim."""
+        return db.query(GenerationJob).filter(
+            GenerationJob.id == job.id,
+            GenerationJob.attempts == job.attempt,
+            GenerationJob.status == "running",
+        )
+    
+    def complete(self, db: Session, job: JobContext, result: Dict[str, Any]) -> None:
+        """
+        Mark a job succeeded as part of the caller's transaction.
+        
+        Args:
+            db: Session the handler commits its writes with
+            job: Claimed job
+            result: Response body for the client
+        
+        Raises:
+            JobLost: The job is no longer held by this claim; roll back
+        """
+        now = datetime.utcnow()
+        updated = self._fenced(db, job).update({
+            GenerationJob.status: "succeeded",
+            GenerationJob.result: result,
+            GenerationJob.lease_expires_at: None,
+            GenerationJob.finished_at: now,
+            GenerationJob.updated_at: now,
+        }, synchronize_session=False)
+        if not updated:
+            raise JobLost(f"Generation job {job.id} was taken over")
+    
+    def _update(self, job: JobContext, values: Dict[Any, Any]) -> bool:
+        """Update a job still held by this claim."""
+        db = SessionLocal()
+        try:
+            values[GenerationJob.updated_at] = datetime.utcnow()
+            updated = self._fenced(db, job).update(values, synchronize_session=False)
+            db.commit()
+            return bool(updated)
+        finally:
+            db.close()
+    
+    def _finish(self, job: JobContext, result: Optional[Dict[str, Any]], error_code: Optional[int], error: Optional[str]) -> bool:
+        """Store a job's outcome."""
+        return self._update(job, {
+            GenerationJob.status: "failed" if error_code else "succeeded",
+            GenerationJob.result: result,
+            GenerationJob.error: error,
+            GenerationJob.error_code: error_code,
+            GenerationJob.lease_expires_at: None,
+            GenerationJob.finished_at: datetime.utcnow(),
+        })
+    
+    def _requeue(self, job: JobContext, attempts: int) -> bool:
+        """Put a job back in the queue."""
+        return self._update(job, {
+            GenerationJob.status: "queued",
+            GenerationJob.attempts: attempts,
+            GenerationJob.lease_expires_at: None,
+        })
+    
+    async def _keep_lease(self, job: JobContext) -> None:
+        """Renew a running job's lease until cancelled."""
+        interval = self.lease.total_seconds() / 3
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                renewed = await asyncio.to_thread(self._update, job, {
+                    GenerationJob.lease_expires_at: datetime.utcnow() + self.lease,
+                })
+            except Exception as e:
+                print(f"Generation job lease renewal failed: {e}")
+                continue
+            if not renewed:
+                return
+    
+    async def _execute(self, job: JobContext) -> None:
+        """Run a claimed job and store its outcome."""
+        handler = self._handlers.get(job.kind)
+        lease = asyncio.create_task(self._keep_lease(job))
+        self._running[job.id] = job
+        self._notify(job.id)
+        
+        result = error = error_code = None
+        try:
+            if handler is None:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail=f"Unknown generation job kind {job.kind!r}",
+                )
+            result = await handler(job)
+        except HTTPException as e:
+            error_code, error = e.status_code, str(e.detail)
+        except JobLost:
+            self.lost += 1
+            return
+        except Exception as e:
+            print(f"Generation job {job.id} failed: {e}")
+            error_code, error = status.HTTP_500_INTERNAL_SERVER_ERROR, "Generation failed"
+        finally:
+            lease.cancel()
+            del self._running[job.id]
+        
+        try:
+            if error_code and error_code >= 500 and job.attempt < self.max_attempts:
+                stored = await asyncio.to_thread(self._requeue, job, job.attempt)
+                self.retried += 1
+                self._wakeup.set()
+            else:
+                stored = await asyncio.to_thread(self._finish, job, result, error_code, error)
+                if stored and error_code:
+                    self.failed += 1
+                elif error_code is None:
+                    # Handlers that called complete() have already finished the job
+                    self.succeeded += 1
+        except Exception as e:
+            # The lease runs out and the job is claimed again
+            print(f"Failed to store generation job outcome: {e}")
+        finally:
+            self._notify(job.id)
+    
+    async def _worker(self) -> None:
+        """Claim and run jobs one at a time."""
+        while True:
+            self._wakeup.clear()
+            try:
+                job = await asyncio.to_thread(self._claim)
+            except Exception as e:
+                print(f"Generation job claim failed: {e}")
+                job = None
+            
+            if job is None:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            
+            # Let another worker look for the next job
+            self._wakeup.set()
+            await self._execute(job)
+    
+    def sweep(self) -> int:
+        """
+        Delete jobs that finished more than ``ttl_hours`` ago.
+        
+        Returns:
+            Number of rows deleted
+        """
+        db = SessionLocal()
+        try:
+            deleted = db.query(GenerationJob).filter(
+                GenerationJob.status.in_(("succeeded", "failed")),
+                GenerationJob.finished_at <= datetime.utcnow() - self.ttl,
+            ).delete(synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+        
+        self.swept += deleted
+        return deleted
+    
+    async def _sweep_periodically(self) -> None:
+        """Sweep finished jobs on the interval."""
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            try:
+                await asyncio.to_thread(self.sweep)
+            except Exception as e:
+                print(f"Generation job sweep failed: {e}")
+    
+    def start(self) -> None:
+        """Start the workers and the sweeper."""
+        if self.is_running:
+            return
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._sweeper = asyncio.create_task(self._sweep_periodically())
+    
+    async def stop(self) -> None:
+        """Stop the workers, putting their running jobs back in the queue."""
+        interrupted = list(self._running.values())
+        tasks = self._tasks + ([self._sweeper] if self._sweeper else [])
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks = []
+        self._sweeper = None
+        
+        for job in interrupted:
+            # Shutting down is not a failed attempt
+            try:
+                await asyncio.to_thread(self._requeue, job, job.attempt - 1)
+            except Exception as e:
+                print(f"Failed to requeue generation job {job.id}: {e}")
+    
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get job counters.
+        
+        Returns:
+            Dictionary with workers, running jobs and job outcomes
+        """
+        return {
+            "running": self.is_running,
+            "workers": self.workers,
+            "jobs_running": len(self._running),
+            "watchers": sum(len(w) for w in self._watchers.values()),
+            "submitted": self.submitted,
+            "rejected": self.rejected,
+            "succeeded": self.succeeded,
+            "failed": self.failed,
+            "retried": self.retried,
+            "recovered": self.recovered,
+            "lost": self.lost,
+            "swept": self.swept,
+        }
+
+
+# Singleton instance
+generation_jobs = GenerationJobService()
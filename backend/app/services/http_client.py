@@ -0,0 +1,123 @@
+"""Shared pooled HTTP clients for upstream APIs."""
+
+from typing import Any, Dict
+
+import httpx
+
+from app.core.config import settings
+
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+# Upstreams that get their own connection pool
+UPSTREAMS = ("inworld", "sd")
+
+
+class HTTPClientPool:
+    """
+    Long-lived ``httpx.AsyncClient`` instances, one per upstream API.
+    
+    Opening a client per call paid a TCP and TLS handshake on every chat
+    message and every generation. Shared clients keep connections alive
+    between calls and, when the ``h2`` package is installed, multiplex
+    concurrent requests over HTTP/2.
+    
+    Clients are created in the app lifespan and closed on shutdown. A
+    client requested outside the lifespan (scripts, background jobs before
+    startup) is created on first use.
+    """
+    
+    def __init__(self):
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+        self._requests: Dict[str, int] = {}
+        self.http2 = settings.http2_enabled and HTTP2_AVAILABLE
+    
+    def _create(self, name: str) -> httpx.AsyncClient:
+        """Build a pooled client with the configured limits and timeouts."""
+        async def count_request(request: httpx.Request) -> None:
+            self._requests[name] = self._requests.get(name, 0) + 1
+        
+        return httpx.AsyncClient(
+            http2=self.http2,
+            limits=httpx.Limits(
+                max_connections=settings.http_max_connections,
+                max_keepalive_connections=settings.http_max_keepalive_connections,
+                keepalive_expiry=settings.http_keepalive_expiry,
+            ),
+            timeout=httpx.Timeout(
+                settings.http_timeout,
+                connect=settings.http_connect_timeout,
+            ),
+            event_hooks={"request": [count_request]},
+        )
+    
+    def client(self, name: str) -> httpx.AsyncClient:
+        """
+        Get the shared client for an upstream.
+        
+        Args:
+            name: Upstream name, e.g. "inworld" or "sd"
+        
+        Returns:
+            Pooled AsyncClient; callers must not close it
+        """
+        client = self._clients.get(name)
+        if client is None or client.is_closed:
+            client = self._clients[name] = self._create(name)
+        return client
+    
+    async def start(self) -> None:
+        """Create the clients for every upstream."""
+        if settings.http2_enabled and not HTTP2_AVAILABLE:
+            print("HTTP/2 requested but the h2 package is not installed; using HTTP/1.1")
+        for name in UPSTREAMS:
+            self.client(name)
+    
+    async def stop(self) -> None:
+        """Close all clients and their connections."""
+        clients, self._clients = self._clients, {}
+        for client in clients.values():
+            try:
+                await client.aclose()
+            except Exception as e:
+                print(f"Failed to close HTTP client: {e}")
+    
+    @staticmethod
+    def _pool_stats(client: httpx.AsyncClient) -> Dict[str, int]:
+        """Read connection counts from the client's httpcore pool."""
+        # httpx does not expose pool state publicly
+        pool = getattr(getattr(client, "_transport", None), "_pool", None)
+        connections = list(getattr(pool, "connections", []))
+        return {
+            "connections": len(connections),
+            "idle": sum(1 for c in connections if c.is_idle()),
+            "http2": sum(1 for c in connections if "HTTP/2" in c.info()),
+        }
+    
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get connection pool counters.
+        
+        Returns:
+            Dictionary with settings and, per upstream, requests sent and
+            open, idle and HTTP/2 connections
+        """
+        return {
+            "http2": self.http2,
+            "max_connections": settings.http_max_connections,
+            "max_keepalive_connections": settings.http_max_keepalive_connections,
+            "clients": {
+                name: {
+                    "requests": self._requests.get(name, 0),
+                    **self._pool_stats(client),
+                }
+                for name, client in self._clients.items()
+            },
+        }
+
+
+# Singleton instance
+http_client_pool = HTTPClientPool()
@@ -0,0 +1,405 @@
+"""Idempotency-Key handling for endpoints with side effects."""
+
+import asyncio
+import hashlib
+import json
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+from uuid import UUID
+
+from fastapi import HTTPException, status
+from pydantic import BaseModel
+from sqlalchemy.exc import IntegrityError
+
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.models.idempotency_key import IdempotencyKey
+
+# Seconds between checks while another worker runs the original request
+POLL_INTERVAL = 0.5
+
+
+@dataclass(frozen=True)
+class StoredResponse:
+    """
+    Outcome of a keyed request, as replayed to retries.
+    
+    Attributes:
+        status_code: HTTP status of an error response, None for success
+        body: Response body, or the error detail
+    """
+    
+    status_code: Optional[int]
+    body: Any
+    
+    def replay(self) -> Any:
+        """Return the stored body, or raise the stored error."""
+        if self.status_code is not None:
+            raise HTTPException(status_code=self.status_code, detail=self.body)
+        return self.body
+
+
+@dataclass
+class _InFlight:
+    """A keyed request running in this process."""
+    
+    fingerprint: str
+    # Outcome for duplicates; None means the original failed and the key is free
+    future: "asyncio.Future[Optional[StoredResponse]]"
+
+
+class IdempotencyService:
+    """
+    Runs a keyed request once and replays its response to retries.
+    
+    Clients send an ``Idempotency-Key`` header on requests that charge NTG,
+    call Stable Diffusion or otherwise must not happen twice. The first
+    request with a key inserts an ``in_progress`` row, runs, and stores its
+    response (or its 4xx error) on the row. Retries with the same key get
+    the stored response without running the endpoint again.
+    
+    Duplicates that arrive while the original is still running wait for it:
+    in this process they await the original's future, across workers they
+    poll the row for up to ``wait_timeout`` seconds. Reusing a key with a
+    different request body is rejected with 422.
+    
+    Server errors are not stored: the row is removed so the client can
+    retry. A row left ``in_progress`` by a crashed worker can be taken over
+    after ``in_progress_timeout`` seconds. Rows expire after ``ttl_hours``
+    and are deleted by a background sweeper.
+    """
+    
+    def __init__(
+        self,
+        ttl_hours: int = settings.idempotency_ttl_hours,
+        in_progress_timeout: float = settings.idempotency_in_progress_timeout,
+        wait_timeout: float = settings.idempotency_wait_timeout,
+        sweep_interval: float = settings.idempotency_sweep_interval,
+    ):
+        self.ttl = timedelta(hours=ttl_hours)
+        self.in_progress_timeout = timedelta(seconds=in_progress_timeout)
+        self.wait_timeout = wait_timeout
+        self.sweep_interval = sweep_interval
+        self._inflight: Dict[Tuple[UUID, str], _InFlight] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.executed = 0
+        self.replayed = 0
+        self.joined = 0
+        self.mismatches = 0
+        self.conflicts = 0
+        self.released = 0
+        self.swept = 0
+    
+    @property
+    def is_running(self) -> bool:
+        """Whether expired keys are being swept."""
+        return self._task is not None and not self._task.done()
+    
+    @staticmethod
+    def fingerprint(endpoint: str, payload: BaseModel) -> str:
+        """
+        Hash an endpoint and request body.
+        
+        Args:
+            endpoint: Method and path, including path parameters
+            payload: Request body
+        
+        Returns:
+            Hex SHA-256 digest
+        """
+        data = json.dumps(
+            {"endpoint": endpoint, "body": payload.model_dump(mode="json")},
+            sort_keys=True,
+            ensure_ascii=False,
+        )
+        return hashlib.sha256(data.encode("utf-8")).hexdigest()
+    
+    def _mismatch(self) -> HTTPException:
+        self.mismatches += 1
+        return HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="Idempotency-Key has already been used for a different request",
+        )
+    
+    async def run(
+        self,
+        user_id: UUID,
+        key: Optional[str],
+        endpoint: str,
+        payload: BaseModel,
+        handler: Callable[[], Awaitable[Any]],
+    ) -> Any:
+        """
+        Run a request at most once per idempotency key.
+        
+        Args:
+            user_id: User sending the request (keys are scoped per user)
+            key: Idempotency-Key header value; None runs the handler directly
+            endpoint: Method and path, including path parameters
+            payload: Request body, used to detect key reuse
+            handler: Coroutine function running the endpoint
+        
+        Returns:
+            The handler's response, or the stored response of an earlier
+            request with the same key
+        
+        Raises:
+            HTTPException: Stored error of the original request, 422 if the
+                key was used for a different request, 409 if the original is
+                still running after the wait timeout
+        """
+        if key is None:
+            return await handler()
+        
+        fingerprint = self.fingerprint(endpoint, payload)
+        slot = (user_id, key)
+        
+        # Duplicates within this process share the original's outcome
+        while slot in self._inflight:
+            inflight = self._inflight[slot]
+            if inflight.fingerprint != fingerprint:
+                raise self._mismatch()
+            self.joined += 1
+            outcome = await asyncio.shield(inflight.future)
+            if outcome is not None:
+                return outcome.replay()
+        
+        inflight = _InFlight(fingerprint, asyncio.get_running_loop().create_future())
+        self._inflight[slot] = inflight
+        outcome = None
+        try:
+            outcome = await self._lead(user_id, key, fingerprint, handler)
+        except HTTPException as e:
+            if e.status_code < 500:
+                outcome = StoredResponse(e.status_code, e.detail)
+            raise
+        finally:
+            del self._inflight[slot]
+            inflight.future.set_result(outcome)
+        
+        return outcome.replay()
+    
+    async def _lead(
+        self,
+        user_id: UUID,
+        key: str,
+        fingerprint: str,
+        handler: Callable[[], Awaitable[Any]],
+    ) -> StoredResponse:
+        """Claim the key and run the handler, or wait for the stored response."""
+        deadline = asyncio.get_running_loop().time() + self.wait_timeout
+        
+        while True:
+            claimed, record = await asyncio.to_thread(self._claim, user_id, key, fingerprint)
+            if claimed:
+                return await self._execute(record.id, handler)
+            if record is None:
+                # Lost a race for the row; look again
+                continue
+            if record.fingerprint != fingerprint:
+                raise self._mismatch()
+            if record.is_completed:
+                self.replayed += 1
+                return StoredResponse(record.status_code, record.response_body)
+            
+            if asyncio.get_running_loop().time() >= deadline:
+                self.conflicts += 1
+                raise HTTPException(
+                    status_code=status.HTTP_409_CONFLICT,
+                    detail="A request with this Idempotency-Key is still being processed",
+                )
+            await asyncio.sleep(POLL_INTERVAL)
+    
+    async def _execute(
+        self,
+        record_id: UUID,
+        handler: Callable[[], Awaitable[Any]],
+    ) -> StoredResponse:
+        """Run the handler for a claimed key and store its outcome."""
+        self.executed += 1
+        try:
+            result = await handler()
+        except HTTPException as e:
+            if e.status_code >= 500:
+                await self._release(record_id)
+                raise
+            outcome = StoredResponse(e.status_code, e.detail)
+        except BaseException:
+            await self._release(record_id)
+            raise
+        else:
+            body = result.model_dump(mode="json") if isinstance(result, BaseModel) else result
+            outcome = StoredResponse(None, body)
+        
+        try:
+            await asyncio.to_thread(self._complete, record_id, outcome)
+        except Exception as e:
+            # The request has run; retries wait until the row times out
+            print(f"Failed to store idempotent response: {e}")
+        return outcome
+    
+    async def _release(self, record_id: UUID) -> None:
+        """Free a key whose request failed, so it can be retried."""
+        self.released += 1
+        try:
+            await asyncio.to_thread(self._delete, record_id)
+        except Exception as e:
+            print(f"Failed to release idempotency key: {e}")
+    
+    def _is_abandoned(self, record: IdempotencyKey, now: datetime) -> bool:
+        """Whether a row has expired or its request stopped without finishing."""
+        if record.expires_at <= now:
+            return True
+        return not record.is_completed and record.updated_at <= now - self.in_progress_timeout
+    
+    def _claim(
+        self,
+        user_id: UUID,
+        key: str,
+        fingerprint: str,
+    ) -> Tuple[bool, Optional[IdempotencyKey]]:
+        """
+        Insert or take over the row for a key (runs in a worker thread).
+        
+        Returns:
+            (True, row) if this request now owns the key, (False, row) if
+            another request does, or (False, None) after losing a race
+        """
+        db = SessionLocal()
+        try:
+            now = datetime.utcnow()
+            record = db.query(IdempotencyKey).filter(
+                IdempotencyKey.user_id == user_id,
+                IdempotencyKey.key == key,
+            ).first()
+            
+            if record is None:
+                record = IdempotencyKey(
+                    user_id=user_id,
+                    key=key,
+                    fingerprint=fingerprint,
+                    created_at=now,
+                    updated_at=now,
+                    expires_at=now + self.ttl,
+                )
+                db.add(record)
+                try:
+                    db.commit()
+                except IntegrityError:
+                    db.rollback()
+                    return False, None
+                return True, record
+            
+            if not self._is_abandoned(record, now):
+                return False, record
+            
+            # Compare-and-set on updated_at so only one worker takes over
+            taken = db.query(IdempotencyKey).filter(
+                IdempotencyKey.id == record.id,
+                IdempotencyKey.updated_at == record.updated_at,
+            ).update({
+                IdempotencyKey.fingerprint: fingerprint,
+                IdempotencyKey.status: "in_progress",
+                IdempotencyKey.status_code: None,
+                IdempotencyKey.response_body: None,
+                IdempotencyKey.updated_at: now,
+                IdempotencyKey.expires_at: now + self.ttl,
+            }, synchronize_session=False)
+            db.commit()
+            return (True, record) if taken else (False, None)
+        finally:
+            db.close()
+    
+    def _complete(self, record_id: UUID, outcome: StoredResponse) -> None:
+        """Store the outcome of a request (runs in a worker thread)."""
+        db = SessionLocal()
+        try:
+            db.query(IdempotencyKey).filter(IdempotencyKey.id == record_id).update({
+                IdempotencyKey.status: "completed",
+                IdempotencyKey.status_code: outcome.status_code,
+                IdempotencyKey.response_body: outcome.body,
+                IdempotencyKey.updated_at: datetime.utcnow(),
+            }, synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+    
+    def _delete(self, record_id: UUID) -> None:
+        """Remove a key's row (runs in a worker thread)."""
+        db = SessionLocal()
+        try:
+            db.query(IdempotencyKey).filter(
+                IdempotencyKey.id == record_id,
+            ).delete(synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+    
+    def sweep(self) -> int:
+        """
+        Delete expired keys.
+        
+        Returns:
+            Number of rows deleted
+        """
+        db = SessionLocal()
+        try:
+            deleted = db.query(IdempotencyKey).filter(
+                IdempotencyKey.expires_at <= datetime.utcnow(),
+            ).delete(synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+        
+        self.swept += deleted
+        return deleted
+    
+    async def _run(self) -> None:
+        """Sweep expired keys on the interval."""
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            try:
+                await asyncio.to_thread(self.sweep)
+            except Exception as e:
+                print(f"Idempotency key sweep failed: {e}")
+    
+    def start(self) -> None:
+        """Start the background sweeper."""
+        if not self.is_running:
+            self._task = asyncio.create_task(self._run())
+    
+    async def stop(self) -> None:
+        """Stop the background sweeper."""
+        if self._task is None:
+            return
+        
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+    
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get idempotency counters.
+        
+        Returns:
+            Dictionary with executed, replayed and rejected requests
+        """
+        return {
+            "running": self.is_running,
+            "in_flight": len(self._inflight),
+            "executed": self.executed,
+            "replayed": self.replayed,
+            "joined": self.joined,
+            "mismatches": self.mismatches,
+            "conflicts": self.conflicts,
+            "released": self.released,
+            "swept": self.swept,
+        }
+
+
+# Singleton instance
+idempotency_service = IdempotencyService()
@@ -1,9 +1,29 @@
 """InWorld AI integration service for character conversations."""
 
-from typing import Dict, Any, Optional
-import httpx
+import asyncio
+import json
+import re
+import time
+from typing import AsyncIterator, Dict, Any, List, Optional, Set
 
 from app.core.config import settings
+from app.services.fallback_responses import fallback_responder
+from app.services.http_client import http_client_pool
+from app.services.inworld_stream import InWorldStream, InWorldStreamPool, StreamReplyError
+from app.services.resilience import UpstreamError, inworld_resilience
+from app.services.session_registry import Session, SessionRegistry
+from app.services.single_flight import SingleFlight
+
+# Seconds a fallback session, opened because InWorld failed, is used
+# before the next create_session tries upstream again
+FALLBACK_SESSION_RETRY = 10.0
+
+# Agent personality for each character style
+STYLE_PERSONALITIES = {
+    "anime": "cheerful, energetic, expressive, uses emoticons, friendly and supportive",
+    "cyberpunk": "tech-savvy, cool, mysterious, uses modern slang, slightly sarcastic but caring",
+    "fantasy": "mystical, wise, gentle, speaks poetically, magical and enchanting",
+}
 
 
 class InWorldService:
@@ -22,8 +42,17 @@ class InWorldService:
     def __init__(self):
         self.api_key = settings.inworld_api_key
         self.workspace_id = settings.inworld_workspace_id
-        self.base_url = "https://studio.inworld.ai/v1"
-        self.sessions: Dict[str, Dict[str, Any]] = {}
+        self.base_url = settings.inworld_api_url
+        self.sessions = SessionRegistry(on_close=self._end_upstream_sessions)
+        # Persistent message streams of live sessions
+        self.streams = InWorldStreamPool(self.base_url, self.api_key)
+        # Background session creation, keyed like sessions
+        self._warming: Dict[str, asyncio.Task] = {}
+        self._background: Set[asyncio.Task] = set()
+        # Upstream session creation, one call per session key at a time
+        self._session_flight = SingleFlight()
+        self.prewarms_started = 0
+        self.prewarm_hits = 0
     
     @property
     def is_configured(self) -> bool:
@@ -46,47 +75,40 @@ class InWorldService:
             name: Character's name
             style: Visual style (affects personality traits)
             personality: Optional custom personality description
-            
+        
         Returns:
             Dictionary with agent_id and scene_id
         """
         # Build personality based on style
-        style_personalities = {
-            "anime": "cheerful, energetic, expressive, uses emoticons, friendly and supportive",
-            "cyberpunk": "tech-savvy, cool, mysterious, uses modern slang, slightly sarcastic but caring",
-            "fantasy": "mystical, wise, gentle, speaks poetically, magical and enchanting",
-        }
-        
-        base_personality = style_personalities.get(style, style_personalities["anime"])
+        base_personality = STYLE_PERSONALITIES.get(style, STYLE_PERSONALITIES["anime"])
         full_personality = f"{base_personality}. {personality}" if personality else base_personality
         
         if self.is_configured:
             try:
-                async with httpx.AsyncClient() as client:
-                    response = await client.post(
-                        f"{self.base_url}/workspaces/{self.workspace_id}/characters",
-                        headers={
-                            "Authorization": f"Bearer {self.api_key}",
-                            "Content-Type": "application/json",
-                        },
-                        json={
-                            "displayName": name,
-                            "description": f"A {style}-style virtual companion named {name}",
-                            "personality": full_personality,
-                            "motivation": "To be a supportive and engaging companion",
-                            "flaws": "Sometimes too eager to help",
-                        },
-                        timeout=30.0,
-                    )
-                    
-                    if response.status_code in (200, 201):
-                        data = response.json()
-                        return {
-                            "agent_id": data.get("name", "").split("/")[-1],
-                            "scene_id": data.get("defaultSceneName", "").split("/")[-1],
-                            "display_name": data.get("displayName", name),
-                        }
-                        
+                client = http_client_pool.client("inworld")
+                response = await inworld_resilience.call(lambda: client.post(
+                    f"{self.base_url}/workspaces/{self.workspace_id}/characters",
+                    headers={
+                        "Authorization": f"Bearer {self.api_key}",
+                        "Content-Type": "application/json",
+                    },
+                    json={
+                        "displayName": name,
+                        "description": f"A {style}-style virtual companion named {name}",
+                        "personality": full_personality,
+                        "motivation": "To be a supportive and engaging companion",
+                        "flaws": "Sometimes too eager to help",
+                    },
+                ), retries=0)
+                
+                if response.status_code in (200, 201):
+                    data = response.json()
+                    return {
+                        "agent_id": data.get("name", "").split("/")[-1],
+                        "scene_id": data.get("defaultSceneName", "").split("/")[-1],
+                        "display_name": data.get("displayName", name),
+                    }
+            
             except Exception as e:
                 print(f"InWorld agent creation failed: {e}")
         
@@ -100,6 +122,43 @@ class InWorldService:
             "mock": True,
         }
     
+    async def rename_agent(self, agent_id: str, name: str, style: str) -> bool:
+        """
+        Give an existing agent a character's name.
+        
+        Used for agents taken from the pre-provisioned pool, which are
+        created under a placeholder name.
+        
+        Args:
+            agent_id: InWorld agent ID
+            name: Character's name
+            style: Character's style
+        
+        Returns:
+            True if the agent was renamed, False otherwise
+        """
+        if not self.is_configured:
+            return False
+        
+        try:
+            client = http_client_pool.client("inworld")
+            response = await inworld_resilience.call(lambda: client.patch(
+                f"{self.base_url}/workspaces/{self.workspace_id}/characters/{agent_id}",
+                headers={
+                    "Authorization": f"Bearer {self.api_key}",
+                    "Content-Type": "application/json",
+                },
+                json={
+                    "displayName": name,
+                    "description": f"A {style}-style virtual companion named {name}",
+                },
+            ))
+            return response.status_code == 200
+        
+        except Exception as e:
+            print(f"InWorld agent rename failed: {e}")
+            return False
+    
     async def create_session(
         self,
         user_id: str,
@@ -111,56 +170,178 @@ class InWorldService:
         Args:
             user_id: User's unique identifier
             character_id: InWorld character/agent ID
-            
+        
         Returns:
             Session ID string
         """
         session_key = f"{user_id}_{character_id}"
         
-        if session_key in self.sessions:
-            return session_key
+        # Join a warm-up already in flight instead of creating a second session
+        warming = self._warming.get(session_key)
+        if warming is not None and warming is not asyncio.current_task():
+            await asyncio.shield(warming)
         
+        session = self.sessions.get(session_key)
+        if session is not None:
+            if time.monotonic() < session.get("retry_at", float("inf")):
+                if session.pop("prewarmed", False):
+                    self.prewarm_hits += 1
+                return session_key
+            # Fallback session after an upstream failure; try upstream again
+            self.sessions.pop(session_key)
+        
+        # Concurrent callers (double-send, two tabs) share one upstream call
+        return await self._session_flight.do(
+            session_key,
+            lambda: self._open_session(user_id, character_id, session_key),
+        )
+    
+    async def _open_session(self, user_id: str, character_id: str, session_key: str) -> str:
+        """Create a session upstream, falling back to a mock session."""
         if self.is_configured:
             try:
-                async with httpx.AsyncClient() as client:
-                    response = await client.post(
-                        f"{self.base_url}/sessions",
-                        headers={
-                            "Authorization": f"Bearer {self.api_key}",
-                            "Content-Type": "application/json",
-                        },
-                        json={
-                            "workspaceId": self.workspace_id,
-                            "characterId": character_id,
-                            "userId": user_id,
-                        },
-                        timeout=30.0,
-                    )
-                    
-                    if response.status_code == 200:
-                        data = response.json()
-                        self.sessions[session_key] = {
-                            "session_id": data.get("sessionId", session_key),
-                            "character_id": character_id,
-                            "user_id": user_id,
-                            "messages": [],
-                        }
-                        return session_key
-                        
+                client = http_client_pool.client("inworld")
+                response = await inworld_resilience.call(lambda: client.post(
+                    f"{self.base_url}/sessions",
+                    headers={
+                        "Authorization": f"Bearer {self.api_key}",
+                        "Content-Type": "application/json",
+                    },
+                    json={
+                        "workspaceId": self.workspace_id,
+                        "characterId": character_id,
+                        "userId": user_id,
+                    },
+                ))
+                
+                if response.status_code == 200:
+                    data = response.json()
+                    self.sessions[session_key] = {
+                        "session_id": data.get("sessionId", session_key),
+                        "character_id": character_id,
+                        "user_id": user_id,
+                        "messages": [],
+                    }
+                    return session_key
+            
             except Exception as e:
                 print(f"InWorld session creation failed: {e}")
         
         # Create mock session
-        self.sessions[session_key] = {
+        session = {
             "session_id": session_key,
             "character_id": character_id,
             "user_id": user_id,
             "messages": [],
             "mock": True,
         }
+        if self.is_configured:
+            # Upstream failed (or the breaker is open); don't pin the mock
+            session["retry_at"] = time.monotonic() + FALLBACK_SESSION_RETRY
+        self.sessions[session_key] = session
         
         return session_key
     
+    def _spawn(self, coro) -> asyncio.Task:
+        """Run a coroutine in the background, keeping a reference until done."""
+        task = asyncio.create_task(coro)
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+        return task
+    
+    def prewarm_session(self, user_id: str, character_id: str) -> None:
+        """
+        Start creating a session in the background.
+        
+        Returns immediately; a later ``create_session`` for the same pair
+        waits for the warm-up instead of making its own upstream call.
+        Failures are logged and never reach the caller.
+        
+        Args:
+            user_id: User's unique identifier
+            character_id: InWorld character/agent ID
+        """
+        session_key = f"{user_id}_{character_id}"
+        
+        if session_key in self.sessions or session_key in self._warming:
+            return
+        
+        async def warm() -> None:
+            try:
+                await self.create_session(user_id=user_id, character_id=character_id)
+                if session_key in self.sessions:
+                    self.sessions[session_key]["prewarmed"] = True
+            except Exception as e:
+                print(f"InWorld session prewarm failed: {e}")
+            finally:
+                self._warming.pop(session_key, None)
+        
+        self.prewarms_started += 1
+        self._warming[session_key] = self._spawn(warm())
+    
+    def prewarm_user_sessions(self, user_id: str, limit: int = settings.inworld_prewarm_on_login) -> None:
+        """
+        Prewarm sessions for a user's most recent characters in the background.
+        
+        The characters are looked up inside the background task, so the
+        calling request (login) does not wait for the query.
+        
+        Args:
+            user_id: User's unique identifier
+            limit: Maximum number of characters to warm up
+        """
+        if limit <= 0:
+            return
+        
+        from app.core.database import SessionLocal
+        from app.models.character import Character
+        
+        def load_agent_ids() -> list:
+            db = SessionLocal()
+            try:
+                rows = db.query(Character.inworld_agent_id).filter(
+                    Character.user_id == user_id,
+                ).order_by(Character.created_at.desc()).limit(limit).all()
+                return [row.inworld_agent_id or "default" for row in rows]
+            finally:
+                db.close()
+        
+        async def warm_all() -> None:
+            try:
+                agent_ids = await asyncio.to_thread(load_agent_ids)
+            except Exception as e:
+                print(f"InWorld session prewarm failed: {e}")
+                return
+            for agent_id in agent_ids:
+                self.prewarm_session(user_id, agent_id)
+        
+        self._spawn(warm_all())
+    
+    def start(self) -> None:
+        """Start expiring idle sessions in the background."""
+        self.sessions.start()
+    
+    async def stop(self) -> None:
+        """Stop the session sweeper, ending sessions it already removed."""
+        await self.sessions.stop()
+        await self.streams.stop()
+    
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get session counters.
+        
+        Returns:
+            Dictionary with session and prewarm counters
+        """
+        return {
+            "sessions": self.sessions.stats(),
+            "warming": len(self._warming),
+            "prewarms_started": self.prewarms_started,
+            "prewarm_hits": self.prewarm_hits,
+            "session_creation": self._session_flight.stats(),
+            "streams": self.streams.stats(),
+        }
+    
     async def send_message(
         self,
         message: str,
@@ -176,7 +357,7 @@ class InWorldService:
             session_id: Session identifier
             character_id: Character/agent identifier
             context: Optional context data
-            
+        
         Returns:
             Response dictionary with content and emotion
         """
@@ -184,12 +365,126 @@ class InWorldService:
         
         # If mock session or not configured, return mock response
         if session.get("mock") or not self.is_configured:
-            return self._get_mock_response(message)
+            return self._get_mock_response(message, session_id)
+        
+        if self.streams.enabled:
+            try:
+                return await self._exchange_message(session, message, context)
+            except StreamReplyError as e:
+                # Already accepted upstream; sending it again would be a second turn
+                self.streams.record_lost_reply(e)
+                return self._get_mock_response(message, session_id)
+            except UpstreamError as e:
+                self.streams.record_fallback(e)
         
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    f"{self.base_url}/sessions/{session_id}/messages",
+            client = http_client_pool.client("inworld")
+            response = await inworld_resilience.call(lambda: client.post(
+                f"{self.base_url}/sessions/{session_id}/messages",
+                headers={
+                    "Authorization": f"Bearer {self.api_key}",
+                    "Content-Type": "application/json",
+                },
+                json={
+                    "text": message,
+                    "context": context or {},
+                },
+            ))
+            
+            if response.status_code == 200:
+                data = response.json()
+                return {
+                    "content": data.get("text", ""),
+                    "emotion": data.get("emotion", "neutral"),
+                    "action": data.get("action"),
+                }
+        
+        except Exception as e:
+            print(f"InWorld message send failed: {e}")
+        
+        return self._get_mock_response(message, session_id)
+    
+    def _stream_for(self, session: Session) -> InWorldStream:
+        """Get the stream of an open session; an unknown session falls back to REST."""
+        if not session.get("session_id"):
+            raise UpstreamError("No open InWorld session to stream over")
+        return self.streams.stream(session["session_id"])
+    
+    async def _exchange_message(
+        self,
+        session: Session,
+        message: str,
+        context: Optional[Dict[str, Any]],
+    ) -> Dict[str, Any]:
+        """Send a message over the session's stream and collect the reply."""
+        chunks: List[str] = []
+        final: Dict[str, Any] = {}
+        
+        async with inworld_resilience.guard():
+            stream = self._stream_for(session)
+            async for item in stream.exchange(message, context):
+                if "content" in item:
+                    chunks.append(item["content"])
+                else:
+                    final = item
+        
+        return {"content": "".join(chunks), **final}
+    
+    async def stream_message(
+        self,
+        message: str,
+        session_id: str,
+        character_id: str,
+        context: Optional[Dict[str, Any]] = None,
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Send a message and yield the character's response as it is generated.
+        
+        Yields ``{"content": <text chunk>}`` items while the response is
+        produced, then one final ``{"emotion": ..., "action": ...}`` item,
+        flagged ``mock`` or ``truncated`` when the reply did not fully come
+        from InWorld. Mock sessions stream the mock response word by word, so clients
+        exercise the same code path without an API key.
+        
+        Args:
+            message: User's message content
+            session_id: Session identifier
+            character_id: Character/agent identifier
+            context: Optional context data
+        
+        Yields:
+            Response chunks followed by the final emotion/action item
+        """
+        session = self.sessions.get(session_id, {})
+        upstream = not session.get("mock") and self.is_configured
+        
+        if upstream and self.streams.enabled:
+            delivered = False
+            try:
+                async with inworld_resilience.guard():
+                    stream = self._stream_for(session)
+                    async for item in stream.exchange(message, context):
+                        delivered = delivered or "content" in item
+                        yield item
+                return
+            except UpstreamError as e:
+                if delivered:
+                    yield {"emotion": "neutral", "action": None, "truncated": True}
+                    return
+                if isinstance(e, StreamReplyError):
+                    # Already accepted upstream; sending it again would be a second turn
+                    self.streams.record_lost_reply(e)
+                    upstream = False
+                else:
+                    self.streams.record_fallback(e)
+        
+        if upstream:
+            streamed = False
+            try:
+                client = http_client_pool.client("inworld")
+                async with inworld_resilience.guard(), client.stream(
+                    "POST",
+                    f"{self.base_url}/sessions/{session_id}/messages:stream",
                     headers={
                         "Authorization": f"Bearer {self.api_key}",
                         "Content-Type": "application/json",
@@ -198,21 +493,38 @@ class InWorldService:
                         "text": message,
                         "context": context or {},
                     },
-                    timeout=30.0,
-                )
-                
-                if response.status_code == 200:
-                    data = response.json()
-                    return {
-                        "content": data.get("text", ""),
-                        "emotion": data.get("emotion", "neutral"),
-                        "action": data.get("action"),
-                    }
-                    
-        except Exception as e:
-            print(f"InWorld message send failed: {e}")
+                ) as response:
+                    inworld_resilience.check_response(response)
+                    if response.status_code == 200:
+                        emotion = "neutral"
+                        action = None
+                        
+                        # Newline-delimited JSON events
+                        async for line in response.aiter_lines():
+                            if not line.strip():
+                                continue
+                            data = json.loads(line)
+                            if data.get("text"):
+                                streamed = True
+                                yield {"content": data["text"]}
+                            emotion = data.get("emotion", emotion)
+                            action = data.get("action", action)
+                        
+                        if streamed:
+                            yield {"emotion": emotion, "action": action}
+                            return
+            
+            except Exception as e:
+                print(f"InWorld message stream failed: {e}")
+                if streamed:
+                    # Part of the reply was already delivered; finish it as is
+                    yield {"emotion": "neutral", "action": None, "truncated": True}
+                    return
         
-        return self._get_mock_response(message)
+        mock = self._get_mock_response(message, session_id)
+        for chunk in re.findall(r"\S+\s*", mock["content"]):
+            yield {"content": chunk}
+        yield {"emotion": mock["emotion"], "action": mock["action"], "mock": True}
     
     async def end_session(self, session_id: str) -> bool:
         """
@@ -220,137 +532,56 @@ class InWorldService:
         
         Args:
             session_id: Session to end
-            
+        
         Returns:
             True if session was ended, False otherwise
         """
-        if session_id in self.sessions:
-            del self.sessions[session_id]
-            return True
-        return False
+        session = self.sessions.pop(session_id)
+        if session is None:
+            return False
+        
+        await self._end_upstream_sessions([session])
+        return True
+    
+    async def _end_upstream_sessions(self, sessions: List[Session]) -> None:
+        """
+        End sessions on the InWorld side, concurrently.
+        
+        Mock sessions have nothing upstream and are skipped. Failures are
+        logged; InWorld also times out abandoned sessions on its own.
+        
+        Args:
+            sessions: Sessions removed from the registry
+        """
+        if not self.is_configured:
+            return
+        
+        await self.streams.close(s["session_id"] for s in sessions)
+        client = http_client_pool.client("inworld")
+        
+        async def end(session: Session) -> None:
+            try:
+                await client.delete(
+                    f"{self.base_url}/sessions/{session['session_id']}",
+                    headers={"Authorization": f"Bearer {self.api_key}"},
+                )
+            except Exception as e:
+                print(f"InWorld session end failed: {e}")
+        
+        await asyncio.gather(*(end(s) for s in sessions if not s.get("mock")))
     
-    def _get_mock_response(self, message: str) -> Dict[str, Any]:
+    def _get_mock_response(self, message: str, session_id: str) -> Dict[str, Any]:
         """
         Generate a mock response for testing without InWorld API.
         
-        Supports Russian keywords as per MVP spec:
-        - "привет" → "Привет! Как твои дела?"
-        - "покорми" → "Я проголодался!"
-        - "поиграй" → "Ура! Я люблю играть!"
-        - "устал" → "Мне нужно отдохнуть..."
-        
         Args:
             message: User's message
-            
+            session_id: Session identifier (avoids repeating the last reply)
+        
         Returns:
             Mock response dictionary
         """
-        import random
-        
-        message_lower = message.lower()
-        
-        # Determine emotion based on message
-        if any(word in message_lower for word in ["люблю", "love", "happy", "хорошо", "отлично", "great", "awesome"]):
-            emotion = "happy"
-        elif any(word in message_lower for word in ["грустно", "sad", "upset", "angry", "плохо"]):
-            emotion = "sad"
-        elif any(word in message_lower for word in ["привет", "hello", "hi", "hey", "здравствуй"]):
-            emotion = "excited"
-        elif any(word in message_lower for word in ["устал", "tired", "спать"]):
-            emotion = "tired"
-        elif any(word in message_lower for word in ["круто", "супер", "ура", "wow", "amazing"]):
-            emotion = "excited"
-        elif "?" in message:
-            emotion = "neutral"
-        else:
-            emotion = random.choice(["happy", "neutral"])
-        
-        # Generate response based on context - Russian keywords
-        responses = {
-            "greeting_ru": [
-                "Привет! 👋 Как твои дела? Рад тебя видеть!",
-                "Приветик! ✨ Я скучал! Расскажи, как день прошёл?",
-                "Здравствуй! 🌟 Наконец-то мы можем поболтать!",
-            ],
-            "greeting_en": [
-                "Hello there! 👋 I'm so happy to see you!",
-                "Hi! ✨ It's wonderful to chat with you!",
-                "Hey! 🌟 I've been waiting for you!",
-            ],
-            "feed": [
-                "Ммм, я проголодался! 🍕 Спасибо, что заботишься!",
-                "Вкусняшки! 🍰 Ты самый лучший!",
-                "Ням-ням! 😋 Как вкусно!",
-            ],
-            "play": [
-                "Ура! 🎮 Я люблю играть! Давай веселиться!",
-                "Игры - это здорово! 🎲 Во что поиграем?",
-                "Йухуу! ⚽ Обожаю играть с тобой!",
-            ],
-            "tired": [
-                "Мне нужно отдохнуть... 😴 Можно немного посплю?",
-                "Я устал немного... 💤 Но рад тебя видеть!",
-                "Зеваю... 🛏️ Отдых - это важно!",
-            ],
-            "question": [
-                "Хммм, интересный вопрос! 🤔 Дай подумать...",
-                "Отличный вопрос! 💭 А ты как думаешь?",
-                "Любопытно! 🌟 Давай разберёмся вместе!",
-                "That's a great question! 🤔 Let me think...",
-            ],
-            "emotional_ru": [
-                "Я здесь для тебя! 💕 Расскажи всё!",
-                "Это так много значит! 🥰 Спасибо!",
-                "Я понимаю тебя! 🤗",
-            ],
-            "emotional_en": [
-                "I'm here for you! 💕 Tell me everything!",
-                "That means so much to me! 🥰 Thank you!",
-                "I understand how you feel! 🤗",
-            ],
-            "default": [
-                "Это интересно! Расскажи ещё! 😊",
-                "Мне нравится с тобой общаться! ✨",
-                "Ого! 🌟 Здорово!",
-                "Ты такой умный! 💕",
-                "That's really interesting! Tell me more! 😊",
-                "I love hearing from you! ✨",
-                "Oh wow! 🌟 That's amazing!",
-            ],
-        }
-        
-        # Russian greetings
-        if any(word in message_lower for word in ["привет", "здравствуй", "приветик"]):
-            content = random.choice(responses["greeting_ru"])
-        # English greetings
-        elif any(word in message_lower for word in ["hello", "hi", "hey"]):
-            content = random.choice(responses["greeting_en"])
-        # Feed keywords
-        elif any(word in message_lower for word in ["покорми", "еда", "кушать", "голодный"]):
-            content = random.choice(responses["feed"])
-        # Play keywords
-        elif any(word in message_lower for word in ["поиграй", "играть", "игра"]):
-            content = random.choice(responses["play"])
-        # Tired keywords
-        elif any(word in message_lower for word in ["устал", "спать", "отдых", "tired"]):
-            content = random.choice(responses["tired"])
-        # Questions
-        elif "?" in message:
-            content = random.choice(responses["question"])
-        # Emotional (Russian)
-        elif any(word in message_lower for word in ["люблю", "грустно", "печально"]):
-            content = random.choice(responses["emotional_ru"])
-        # Emotional (English)
-        elif any(word in message_lower for word in ["love", "feel", "sad", "happy"]):
-            content = random.choice(responses["emotional_en"])
-        else:
-            content = random.choice(responses["default"])
-        
-        return {
-            "content": content,
-            "emotion": emotion,
-            "action": None,
-        }
+        return fallback_responder.respond(message, session_key=session_id)
 
 
 # Singleton instance
@@ -0,0 +1,357 @@
+"""Persistent streaming connections to InWorld sessions."""
+
+import asyncio
+import itertools
+import json
+import random
+import re
+from collections import Counter
+from typing import Any, AsyncIterator, Dict, Iterable, Optional
+
+from app.core.config import settings
+from app.services.resilience import UpstreamError
+
+try:
+    import websockets
+    WEBSOCKETS_AVAILABLE = True
+except ImportError:
+    WEBSOCKETS_AVAILABLE = False
+
+
+class StreamError(UpstreamError):
+    """The streaming connection could not deliver a reply."""
+
+
+class StreamReplyError(StreamError):
+    """
+    The reply failed after the upstream accepted the message.
+    
+    The upstream may still act on the message, so it must not be sent again
+    over REST: that would be a second turn.
+    """
+
+
+class _Request:
+    """A message in flight on a stream."""
+    
+    def __init__(self, request_id: str, frame: str):
+        self.id = request_id
+        self.frame = frame
+        self.acked = False
+        self.events: asyncio.Queue = asyncio.Queue()
+
+
+class InWorldStream:
+    """
+    One WebSocket connection to an InWorld session, shared by its messages.
+    
+    Frames are JSON objects. The client sends
+    ``{"type": "message", "id": ..., "text": ..., "context": ...}``; the
+    upstream acknowledges it with ``{"type": "ack", "id": ...}`` and answers
+    with ``text`` events followed by a ``done`` event (emotion, action) or
+    an ``error`` event. Events carry the request ``id``, so several messages
+    can be in flight on one connection.
+    
+    Every upstream event has an increasing ``seq``. After a dropped
+    connection the client reconnects with ``?resume=<last seq>``: the
+    upstream replays missed events (``resumed``) and unacknowledged
+    messages are sent again. If the upstream cannot resume (``reset``),
+    replies in progress fail with StreamError.
+    
+    A message counts as accepted once it is acknowledged or its reply
+    starts. Failures after that raise StreamReplyError, failures before it
+    the plain StreamError, after which the message can safely be resent.
+    """
+    
+    def __init__(
+        self,
+        url: str,
+        headers: Dict[str, str],
+        counters: Counter,
+        reconnect_attempts: int = settings.inworld_stream_reconnect_attempts,
+        ping_interval: float = settings.inworld_stream_ping_interval,
+        timeout: float = settings.http_timeout,
+    ):
+        self.url = url
+        self.headers = headers
+        self.counters = counters
+        self.reconnect_attempts = reconnect_attempts
+        self.ping_interval = ping_interval
+        self.timeout = timeout
+        self.closed = False
+        self._ws: Any = None
+        self._reader: Optional[asyncio.Task] = None
+        self._reconnecting: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+        self._pending: Dict[str, _Request] = {}
+        self._ids = itertools.count(1)
+        self._last_seq = 0
+    
+    @property
+    def is_open(self) -> bool:
+        """Whether the connection is up."""
+        return self._ws is not None and self._reader is not None and not self._reader.done()
+    
+    async def _connect(self) -> None:
+        """Open (or resume) the connection and send unacknowledged messages."""
+        async with self._lock:
+            if self.is_open:
+                return
+            if self.closed:
+                raise StreamError("InWorld stream is closed")
+            
+            url = f"{self.url}?resume={self._last_seq}" if self._last_seq else self.url
+            try:
+                ws = await websockets.connect(
+                    url,
+                    extra_headers=self.headers,
+                    open_timeout=settings.http_connect_timeout,
+                    ping_interval=self.ping_interval,
+                )
+            except Exception as e:
+                raise StreamError(f"InWorld stream connect failed: {e}") from e
+            
+            self.counters["connects"] += 1
+            self._ws = ws
+            self._reader = asyncio.create_task(self._read(ws))
+            
+            for request in list(self._pending.values()):
+                if not request.acked:
+                    await ws.send(request.frame)
+    
+    async def _read(self, ws: Any) -> None:
+        """Route upstream events to their requests until the connection drops."""
+        try:
+            async for raw in ws:
+                self._dispatch(json.loads(raw))
+        except Exception as e:
+            if not self.closed:
+                print(f"InWorld stream dropped: {e}")
+        finally:
+            if self._ws is ws:
+                self._ws = None
+            if not self.closed:
+                self.counters["disconnects"] += 1
+                if self._pending and self._reconnecting is None:
+                    self._reconnecting = asyncio.create_task(self._reconnect())
+    
+    def _dispatch(self, event: Dict[str, Any]) -> None:
+        """Handle one upstream event."""
+        seq = event.get("seq")
+        if seq is not None:
+            if seq <= self._last_seq:
+                # Already seen before the connection was resumed
+                return
+            self._last_seq = seq
+        
+        kind = event.get("type")
+        if kind == "resumed":
+            self.counters["resumes"] += 1
+            return
+        if kind == "reset":
+            # The upstream lost its side; acknowledged replies cannot finish
+            self.counters["resets"] += 1
+            self._last_seq = 0
+            for request in self._pending.values():
+                if request.acked:
+                    request.events.put_nowait({"type": "error", "detail": "InWorld stream was reset"})
+            return
+        
+        request = self._pending.get(event.get("id"))
+        if request is None:
+            return
+        if kind == "ack":
+            request.acked = True
+            return
+        if kind == "text":
+            # The reply started, so the message arrived even if its ack was lost
+            request.acked = True
+        request.events.put_nowait(event)
+    
+    def _fail_pending(self, detail: str) -> None:
+        """End every request in flight with an error."""
+        for request in self._pending.values():
+            request.events.put_nowait({"type": "error", "detail": detail})
+    
+    async def _reconnect(self) -> None:
+        """Reconnect with jittered backoff while messages are in flight."""
+        try:
+            for attempt in range(self.reconnect_attempts):
+                await asyncio.sleep(random.uniform(0, 0.1 * 2 ** attempt))
+                if self.closed or not self._pending:
+                    return
+                try:
+                    await self._connect()
+                except StreamError as e:
+                    print(f"InWorld stream reconnect failed: {e}")
+                    continue
+                # The new connection may already have dropped again
+                if self.is_open:
+                    return
+            self._fail_pending("InWorld stream lost")
+        finally:
+            self._reconnecting = None
+    
+    async def exchange(
+        self,
+        text: str,
+        context: Optional[Dict[str, Any]] = None,
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Send a message and yield the reply as it arrives.
+        
+        Args:
+            text: User's message
+            context: Optional context data
+        
+        Yields:
+            ``{"content": <text chunk>}`` items, then one final
+            ``{"emotion": ..., "action": ...}`` item
+        
+        Raises:
+            StreamReplyError: The message was accepted, but its reply timed
+                out, failed or was reset
+            StreamError: The message was not accepted
+        """
+        request_id = str(next(self._ids))
+        request = _Request(request_id, json.dumps({
+            "type": "message",
+            "id": request_id,
+            "text": text,
+            "context": context or {},
+        }))
+        self._pending[request_id] = request
+        self.counters["messages"] += 1
+        
+        try:
+            if self.is_open:
+                try:
+                    await self._ws.send(request.frame)
+                except Exception:
+                    # Sent again once the reader reconnects
+                    pass
+            else:
+                await self._connect()
+            
+            while True:
+                try:
+                    event = await asyncio.wait_for(request.events.get(), timeout=self.timeout)
+                except asyncio.TimeoutError:
+                    raise self._error(request, "InWorld stream timed out")
+                
+                kind = event.get("type")
+                if kind == "text":
+                    yield {"content": event.get("text", "")}
+                elif kind == "done":
+                    yield {"emotion": event.get("emotion", "neutral"), "action": event.get("action")}
+                    return
+                else:
+                    raise self._error(request, event.get("detail", "InWorld stream failed"))
+        finally:
+            self._pending.pop(request_id, None)
+    
+    @staticmethod
+    def _error(request: _Request, detail: str) -> StreamError:
+        """Error for a failed request, telling whether the upstream accepted it."""
+        if request.acked:
+            return StreamReplyError(detail)
+        return StreamError(detail)
+    
+    async def close(self) -> None:
+        """Close the connection, failing messages still in flight."""
+        self.closed = True
+        self._fail_pending("InWorld stream closed")
+        
+        if self._reconnecting is not None:
+            self._reconnecting.cancel()
+        if self._ws is not None:
+            try:
+                await self._ws.close()
+            except Exception as e:
+                print(f"InWorld stream close failed: {e}")
+        if self._reader is not None:
+            await asyncio.gather(self._reader, return_exceptions=True)
+
+
+class InWorldStreamPool:
+    """
+    Streaming connections of live InWorld sessions, keyed by session ID.
+    
+    Sending every chat message as its own REST request pays request setup
+    and headers each time. With streaming enabled each session keeps one
+    WebSocket open, and a message becomes a single frame exchange on it.
+    Connections are opened on the first message and closed when their
+    session ends or expires. Callers fall back to REST on StreamError,
+    except StreamReplyError, where the upstream already has the message.
+    """
+    
+    def __init__(
+        self,
+        base_url: str,
+        api_key: str,
+        enabled: bool = settings.inworld_streaming_enabled,
+    ):
+        self.ws_url = re.sub(r"^http", "ws", base_url)
+        self.api_key = api_key
+        self.enabled = enabled and WEBSOCKETS_AVAILABLE
+        self._streams: Dict[str, InWorldStream] = {}
+        self.counters: Counter = Counter()
+    
+    def stream(self, session_id: str) -> InWorldStream:
+        """
+        Get the streaming connection for an upstream session.
+        
+        Args:
+            session_id: InWorld session ID
+        
+        Returns:
+            Stream, connected on its first exchange
+        """
+        stream = self._streams.get(session_id)
+        if stream is None or stream.closed:
+            stream = self._streams[session_id] = InWorldStream(
+                f"{self.ws_url}/sessions/{session_id}/connect",
+                {"Authorization": f"Bearer {self.api_key}"},
+                self.counters,
+            )
+        return stream
+    
+    def record_fallback(self, error: Exception) -> None:
+        """Count a message sent over REST because the stream failed."""
+        self.counters["fallbacks"] += 1
+        print(f"InWorld stream failed, using REST: {error}")
+    
+    def record_lost_reply(self, error: Exception) -> None:
+        """Count a reply lost after the upstream accepted its message."""
+        self.counters["lost_replies"] += 1
+        print(f"InWorld stream reply lost: {error}")
+    
+    async def close(self, session_ids: Iterable[str]) -> None:
+        """Close the connections of ended sessions."""
+        streams = [self._streams.pop(s) for s in list(session_ids) if s in self._streams]
+        await asyncio.gather(*(s.close() for s in streams))
+    
+    async def stop(self) -> None:
+        """Close all connections."""
+        await self.close(list(self._streams))
+    
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get streaming counters.
+        
+        Returns:
+            Dictionary with open connections, messages, reconnects, REST
+            fallbacks and replies lost after the message was accepted
+        """
+        return {
+            "enabled": self.enabled,
+            "streams": len(self._streams),
+            "open": sum(1 for s in self._streams.values() if s.is_open),
+            "messages": self.counters["messages"],
+            "connects": self.counters["connects"],
+            "disconnects": self.counters["disconnects"],
+            "resumes": self.counters["resumes"],
+            "resets": self.counters["resets"],
+            "fallbacks": self.counters["fallbacks"],
+            "lost_replies": self.counters["lost_replies"],
+        }
@@ -0,0 +1,283 @@
+"""Single-pass keyword analysis for chat messages.
+
+All keyword tables used to classify a user message (sentiment, character
+emotion, mock-response intent) are compiled into one automaton at import
+time. A message is lowercased and scanned once; every classifier then works
+on the resulting set of matched keywords instead of re-scanning the text.
+"""
+
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, FrozenSet, Iterable, List, Optional, Sequence, Tuple
+
+
+# ============================================================================
+# Keyword tables
+# ============================================================================
+
+POSITIVE_KEYWORDS = [
+    "хорошо", "отлично", "люблю", "класс", "супер", "ура", "круто",
+    "прекрасно", "замечательно", "восхитительно", "радость", "счастье",
+    "love", "great", "awesome", "amazing", "wonderful", "happy", "good",
+    "excellent", "fantastic", "beautiful", "nice", "perfect", "best",
+]
+
+NEGATIVE_KEYWORDS = [
+    "плохо", "грустно", "скучно", "злой", "ненавижу", "устал", "печаль",
+    "ужас", "отстой", "тоска", "обидно", "разочарование",
+    "bad", "sad", "angry", "hate", "tired", "boring", "awful", "terrible",
+    "upset", "disappointed", "annoyed", "frustrated", "unhappy",
+]
+
+# Rules are checked in order; the first rule with a matching keyword wins.
+Rules = Sequence[Tuple[str, Sequence[str]]]
+
+# Character emotion in the main chat flow
+EMOTION_RULES: Rules = [
+    ("excited", ["ура", "круто", "супер", "wow", "amazing", "awesome"]),
+    ("sad", ["грустно", "печаль", "sad", "upset", "sorry"]),
+    ("happy", ["хорошо", "отлично", "люблю", "good", "great", "love", "happy"]),
+]
+
+# Emotion for fallback responses in the legacy send flow
+MOCK_EMOTION_RULES: Rules = [
+    ("excited", ["круто", "супер", "ура", "класс", "awesome", "amazing", "wow"]),
+    ("happy", ["люблю", "нравится", "хорошо", "love", "happy", "great", "good"]),
+    ("sad", ["грустно", "плохо", "sad", "upset", "angry", "bad"]),
+    ("tired", ["устал", "спать", "tired", "sleepy"]),
+]
+
+# Intent for fallback responses generated by the chat endpoints
+MOCK_INTENT_RULES: Rules = [
+    ("greeting_ru", ["привет", "здравствуй", "приветик", "хай"]),
+    ("greeting_en", ["hello", "hi", "hey"]),
+    ("feed", ["покорми", "еда", "кушать", "голодный", "есть"]),
+    ("play", ["поиграй", "играть", "игра", "веселье"]),
+    ("tired", ["устал", "усталость", "спать", "отдых"]),
+    ("feeling_ru", ["как дела", "как ты", "как настроение"]),
+    ("feeling_en", ["how are you", "how do you feel"]),
+    ("love_ru", ["люблю", "нравишься", "обожаю"]),
+    ("love_en", ["love", "like"]),
+    ("sad_ru", ["грустно", "печально", "скучно", "плохо"]),
+    ("sad_en", ["sad", "tired", "upset"]),
+    ("excited_ru", ["круто", "супер", "класс", "ура"]),
+    ("question", ["?"]),
+]
+
+
+# ============================================================================
+# Automaton
+# ============================================================================
+
+# Longer tokens are matched directly instead of being memoised
+MAX_CACHED_TOKEN_LENGTH = 32
+
+_NO_KEYWORDS: FrozenSet[str] = frozenset()
+
+
+class KeywordAutomaton:
+    """
+    Multi-keyword substring matcher compiled once from a keyword trie.
+    
+    The trie is compiled into a regular expression, so matching runs inside
+    the C regex engine instead of a per-character Python loop. Each search
+    returns the longest keyword starting at the next position where any
+    keyword starts; keywords contained in that match (for example "happy"
+    inside "unhappy") are added from a table built at compile time, so the
+    result equals what independent ``keyword in text`` checks would find.
+    
+    A keyword without whitespace can only occur inside a single
+    whitespace-separated token, so the text is split once and each distinct
+    token is matched through a bounded memo. Chat vocabulary repeats
+    heavily, so most tokens are dictionary hits. Multi-word keywords
+    ("как дела") are matched by one extra pass over the whole text.
+    """
+    
+    def __init__(self, keywords: Iterable[str], token_cache_size: int = 65536):
+        self.keywords: FrozenSet[str] = frozenset(k for k in keywords if k)
+        word_keywords = {k for k in self.keywords if k.split() == [k]}
+        phrase_keywords = self.keywords - word_keywords
+        
+        self._word_pattern = re.compile(self._build_pattern(word_keywords))
+        self._phrase_pattern = (
+            re.compile(self._build_pattern(phrase_keywords)) if phrase_keywords else None
+        )
+        self._contained: Dict[str, FrozenSet[str]] = {
+            keyword: frozenset(k for k in self.keywords if k in keyword)
+            for keyword in self.keywords
+        }
+        self._token_cache_size = token_cache_size
+        self._token_matches: Dict[str, FrozenSet[str]] = {}
+    
+    @staticmethod
+    def _build_pattern(keywords: Iterable[str]) -> str:
+        """Compile keywords into a trie-shaped regex (longest match first)."""
+        trie: Dict[str, dict] = {}
+        for keyword in keywords:
+            node = trie
+            for char in keyword:
+                node = node.setdefault(char, {})
+            node[""] = {}
+        
+        def compile_node(node: Dict[str, dict]) -> str:
+            branches = [
+                re.escape(char) + compile_node(child)
+                for char, child in sorted(node.items())
+                if char
+            ]
+            if not branches:
+                return ""
+            body = branches[0] if len(branches) == 1 else f"(?:{'|'.join(branches)})"
+            # Greedy optional group: prefer the longer keyword
+            return f"(?:{body})?" if "" in node else body
+        
+        return compile_node(trie) or "(?!)"
+    
+    def _scan(self, pattern: "re.Pattern[str]", text: str) -> FrozenSet[str]:
+        """Find all keywords of a compiled pattern, including overlaps."""
+        found: set = set()
+        seen: set = set()
+        search = pattern.search
+        pos = 0
+        
+        while True:
+            match = search(text, pos)
+            if match is None:
+                break
+            keyword = match.group()
+            if keyword not in seen:
+                seen.add(keyword)
+                found.update(self._contained[keyword])
+            pos = match.start() + 1
+        
+        return frozenset(found) if found else _NO_KEYWORDS
+    
+    def _match_token(self, token: str) -> FrozenSet[str]:
+        """Find the single-word keywords inside one token and memoise them."""
+        matched = self._scan(self._word_pattern, token)
+        if len(token) <= MAX_CACHED_TOKEN_LENGTH:
+            if len(self._token_matches) >= self._token_cache_size:
+                # Vocabulary drift: start over rather than tracking recency
+                self._token_matches.clear()
+            self._token_matches[token] = matched
+        return matched
+    
+    def find_all(self, text: str) -> FrozenSet[str]:
+        """
+        Find every keyword that occurs in the text.
+        
+        Args:
+            text: Text to scan (already normalised, e.g. lowercased)
+        
+        Returns:
+            Set of matched keywords
+        """
+        tokens = set(text.split())
+        # Memo lookups for every token in one C-level pass
+        matches = list(map(self._token_matches.get, tokens))
+        
+        if None in matches:
+            matches = [
+                self._match_token(token) if matched is None else matched
+                for token, matched in zip(tokens, matches)
+            ]
+        
+        if self._phrase_pattern is not None:
+            matches.append(self._scan(self._phrase_pattern, text))
+        
+        return frozenset().union(*matches)
+
+
+def _compile_rules(rules: Rules) -> List[Tuple[str, FrozenSet[str]]]:
+    """Freeze rule keyword lists for set intersection."""
+    return [(label, frozenset(words)) for label, words in rules]
+
+
+def _first_match(
+    keywords: FrozenSet[str],
+    rules: List[Tuple[str, FrozenSet[str]]],
+) -> Optional[str]:
+    """Return the label of the first rule with a matched keyword."""
+    for label, words in rules:
+        if not keywords.isdisjoint(words):
+            return label
+    return None
+
+
+_POSITIVE = frozenset(POSITIVE_KEYWORDS)
+_NEGATIVE = frozenset(NEGATIVE_KEYWORDS)
+_EMOTION_RULES = _compile_rules(EMOTION_RULES)
+_MOCK_EMOTION_RULES = _compile_rules(MOCK_EMOTION_RULES)
+_MOCK_INTENT_RULES = _compile_rules(MOCK_INTENT_RULES)
+
+# One automaton for every keyword table, built at import time
+automaton = KeywordAutomaton(
+    [*POSITIVE_KEYWORDS, *NEGATIVE_KEYWORDS]
+    + [word for rules in (
+        EMOTION_RULES,
+        MOCK_EMOTION_RULES,
+        MOCK_INTENT_RULES,
+    ) for _, words in rules for word in words]
+)
+
+
+# ============================================================================
+# Analysis
+# ============================================================================
+
+@dataclass(frozen=True)
+class MessageAnalysis:
+    """
+    Everything the chat flow derives from a message's keywords.
+    
+    Attributes:
+        keywords: Matched keywords
+        positive_count: Number of distinct positive keywords
+        negative_count: Number of distinct negative keywords
+        emotion: Character emotion from the message alone, if any
+        mock_emotion: Emotion for fallback responses
+        intent: Fallback response intent
+    """
+    
+    keywords: FrozenSet[str]
+    positive_count: int
+    negative_count: int
+    emotion: Optional[str]
+    mock_emotion: str
+    intent: str
+    
+    @property
+    def sentiment(self) -> str:
+        """Overall sentiment: positive, negative, or neutral."""
+        if self.positive_count > self.negative_count:
+            return "positive"
+        elif self.negative_count > self.positive_count:
+            return "negative"
+        return "neutral"
+
+
+@lru_cache(maxsize=1024)
+def analyze_message(message: str) -> MessageAnalysis:
+    """
+    Scan a message once and classify it.
+    
+    Results are memoised, so the sentiment, emotion and fallback helpers
+    called for the same message during one request share a single scan.
+    
+    Args:
+        message: Raw user message
+    
+    Returns:
+        MessageAnalysis with sentiment counts, emotion and intent
+    """
+    keywords = automaton.find_all(message.lower())
+    
+    return MessageAnalysis(
+        keywords=keywords,
+        positive_count=len(keywords & _POSITIVE),
+        negative_count=len(keywords & _NEGATIVE),
+        emotion=_first_match(keywords, _EMOTION_RULES),
+        mock_emotion=_first_match(keywords, _MOCK_EMOTION_RULES) or "neutral",
+        intent=_first_match(keywords, _MOCK_INTENT_RULES) or "default",
+    )
@@ -0,0 +1,334 @@
+"""Write-behind buffer for character parameter changes from chat."""
+
+import asyncio
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+from uuid import UUID
+
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import set_committed_value
+
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.models.character import Character
+from app.services.character_params import character_params_service
+
+
+@dataclass
+class PendingParams:
+    """
+    Parameter changes buffered for one character.
+    
+    Deltas are effective changes: each buffered update was clamped against
+    the character's projected value before being added, so applying the
+    sum reproduces the result of calling ``Character.update_*`` in order.
+    Bond earned from message milestones is not included in ``bond``; it is
+    derived from ``messages`` and the stored counter when applied.
+    
+    Attributes:
+        energy: Buffered energy change
+        mood: Buffered mood change
+        bond: Buffered bond change, excluding message milestones
+        messages: Buffered chat messages
+        updates: Number of updates coalesced into this entry
+    """
+    
+    energy: int = 0
+    mood: int = 0
+    bond: int = 0
+    messages: int = 0
+    updates: int = 0
+    
+    def merge(self, other: "PendingParams") -> None:
+        """Add another entry's changes to this one."""
+        self.energy += other.energy
+        self.mood += other.mood
+        self.bond += other.bond
+        self.messages += other.messages
+        self.updates += other.updates
+
+
+class ParamBuffer:
+    """
+    Coalesces per-message energy/mood/bond changes into batched UPDATEs.
+    
+    Chat used to commit and refresh the character row on every message.
+    With the buffer, each message only records an in-memory delta; a
+    background task writes all pending deltas in one executemany UPDATE
+    every ``flush_interval`` seconds, or sooner once ``max_pending``
+    characters are waiting. Deltas are applied relative to the stored
+    value, so concurrent writers are not overwritten.
+    
+    Reads must call ``overlay`` on loaded characters to see buffered
+    changes. Buffering is only active while the flusher runs (between
+    ``start`` and ``stop`` in the app lifespan); otherwise ``record``
+    writes each change immediately.
+    """
+    
+    def __init__(
+        self,
+        flush_interval: float = settings.param_buffer_flush_interval,
+        max_pending: int = settings.param_buffer_max_pending,
+    ):
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._pending: Dict[UUID, PendingParams] = {}
+        # Taken out of _pending by a running flush but not yet committed
+        self._flushing: Dict[UUID, PendingParams] = {}
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        self.updates_buffered = 0
+        self.flushes = 0
+        self.rows_written = 0
+        self.flush_errors = 0
+    
+    @property
+    def is_running(self) -> bool:
+        """Whether changes are currently being buffered."""
+        return self._task is not None and not self._task.done()
+    
+    def _buffered(self, character_id: UUID) -> Optional[PendingParams]:
+        """Total buffered changes for a character, including an in-flight flush."""
+        pending = self._pending.get(character_id)
+        flushing = self._flushing.get(character_id)
+        if flushing is None:
+            return pending
+        total = PendingParams()
+        total.merge(flushing)
+        if pending is not None:
+            total.merge(pending)
+        return total
+    
+    def overlay(self, character: Character) -> Character:
+        """
+        Show buffered changes on a character loaded from the database.
+        
+        Values are set as committed state, so the character is not marked
+        dirty and a later commit will not write them back.
+        
+        Args:
+            character: Character freshly loaded or refreshed from the database
+        
+        Returns:
+            The same character, for chaining
+        """
+        buffered = self._buffered(character.id)
+        if buffered is None:
+            return character
+        
+        set_committed_value(
+            character, "params_energy",
+            Character.clamp_energy(character.params_energy + buffered.energy),
+        )
+        set_committed_value(
+            character, "params_mood",
+            Character.clamp_mood(character.params_mood + buffered.mood),
+        )
+        set_committed_value(
+            character, "params_bond",
+            Character.clamp_bond(character.params_bond + buffered.bond)
+            + Character.bond_for_messages(character.messages_total, buffered.messages),
+        )
+        set_committed_value(
+            character, "messages_total",
+            character.messages_total + buffered.messages,
+        )
+        return character
+    
+    def record(
+        self,
+        character: Character,
+        energy: int = 0,
+        mood: int = 0,
+        bond: int = 0,
+        messages: int = 0,
+    ) -> None:
+        """
+        Record a parameter change for a character.
+        
+        The character must already show buffered changes (see ``overlay``);
+        its values are advanced to the new projected state.
+        
+        Args:
+            character: Character the change applies to
+            energy: Energy change
+            mood: Mood change
+            bond: Bond change, excluding message milestones
+            messages: Chat messages to add to the counter
+        """
+        if not self.is_running:
+            self._apply_now(character, energy, mood, bond, messages)
+            return
+        
+        milestone_bond = Character.bond_for_messages(character.messages_total, messages)
+        new_energy = Character.clamp_energy(character.params_energy + energy)
+        new_mood = Character.clamp_mood(character.params_mood + mood)
+        new_bond = Character.clamp_bond(character.params_bond + bond)
+        
+        entry = self._pending.setdefault(character.id, PendingParams())
+        entry.energy += new_energy - character.params_energy
+        entry.mood += new_mood - character.params_mood
+        entry.bond += new_bond - character.params_bond
+        entry.messages += messages
+        entry.updates += 1
+        self.updates_buffered += 1
+        
+        set_committed_value(character, "params_energy", new_energy)
+        set_committed_value(character, "params_mood", new_mood)
+        set_committed_value(character, "params_bond", new_bond + milestone_bond)
+        set_committed_value(character, "messages_total", character.messages_total + messages)
+        
+        if len(self._pending) >= self.max_pending:
+            self._wake.set()
+    
+    def _apply_now(
+        self,
+        character: Character,
+        energy: int,
+        mood: int,
+        bond: int,
+        messages: int,
+    ) -> None:
+        """Write a change immediately when the flusher is not running."""
+        db = SessionLocal()
+        try:
+            params = character_params_service.apply_deltas(
+                db, character.id, energy=energy, mood=mood, bond=bond, messages=messages,
+            )
+            db.commit()
+        finally:
+            db.close()
+        
+        if params is not None:
+            set_committed_value(character, "params_energy", params.energy)
+            set_committed_value(character, "params_mood", params.mood)
+            set_committed_value(character, "params_bond", params.bond)
+            set_committed_value(character, "messages_total", character.messages_total + messages)
+    
+    def flush_character(self, db: Session, character_id: UUID) -> None:
+        """
+        Write one character's buffered changes and commit.
+        
+        Call this before modifying a character's parameters outside the
+        buffer, so the stored values are current.
+        
+        Args:
+            db: Database session
+            character_id: Character to flush
+        """
+        entry = self._pending.pop(character_id, None)
+        if entry is None:
+            return
+        
+        try:
+            self._execute(db, {character_id: entry})
+            db.commit()
+        except Exception:
+            db.rollback()
+            self._restore({character_id: entry})
+            raise
+    
+    def _execute(self, db: Session, batch: Dict[UUID, PendingParams]) -> None:
+        """Run the batched UPDATE for the given changes."""
+        character_params_service.apply_many(db, [
+            {
+                "character_id": character_id,
+                "energy": entry.energy,
+                "mood": entry.mood,
+                "bond": entry.bond,
+                "messages": entry.messages,
+            }
+            for character_id, entry in batch.items()
+        ])
+    
+    def _write(self, batch: Dict[UUID, PendingParams]) -> None:
+        """Write a batch in its own session (runs in a worker thread)."""
+        db = SessionLocal()
+        try:
+            self._execute(db, batch)
+            db.commit()
+        finally:
+            db.close()
+    
+    def _restore(self, batch: Dict[UUID, PendingParams]) -> None:
+        """Put changes from a failed write back into the buffer."""
+        for character_id, entry in batch.items():
+            self._pending.setdefault(character_id, PendingParams()).merge(entry)
+    
+    async def flush(self) -> int:
+        """
+        Write all buffered changes.
+        
+        Returns:
+            Number of characters written
+        """
+        if not self._pending or self._flushing:
+            return 0
+        
+        batch, self._pending = self._pending, {}
+        self._flushing = batch
+        
+        try:
+            await asyncio.to_thread(self._write, batch)
+        except Exception as e:
+            print(f"Parameter buffer flush failed: {e}")
+            self.flush_errors += 1
+            self._restore(batch)
+            return 0
+        finally:
+            self._flushing = {}
+        
+        self.flushes += 1
+        self.rows_written += len(batch)
+        return len(batch)
+    
+    async def _run(self) -> None:
+        """Flush on the interval or when the size threshold is reached."""
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            await self.flush()
+    
+    def start(self) -> None:
+        """Start the background flusher."""
+        if not self.is_running:
+            self._stopping = False
+            self._wake = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+    
+    async def stop(self) -> None:
+        """Stop the flusher and write everything still buffered."""
+        if self._task is not None:
+            # Let a running write finish instead of cancelling it mid-commit
+            self._stopping = True
+            self._wake.set()
+            await self._task
+            self._task = None
+        
+        await self.flush()
+    
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get buffer counters.
+        
+        Returns:
+            Dictionary with buffered updates, flushes and rows written
+        """
+        return {
+            "running": self.is_running,
+            "pending_characters": len(self._pending),
+            "updates_buffered": self.updates_buffered,
+            "flushes": self.flushes,
+            "rows_written": self.rows_written,
+            "flush_errors": self.flush_errors,
+            "flush_interval": self.flush_interval,
+            "max_pending": self.max_pending,
+        }
+
+
+# Singleton instance
+param_buffer = ParamBuffer()
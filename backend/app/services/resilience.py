@@ -0,0 +1,370 @@
+"""Resilience policies for upstream API calls."""
+
+import asyncio
+import random
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional, TypeVar
+
+import httpx
+
+from app.core.config import settings
+
+T = TypeVar("T")
+
+# Upstream statuses worth retrying; other errors are returned to the caller
+RETRYABLE_STATUSES = frozenset({429, 502, 503, 504})
+
+# Failures in the connect phase, before the request was sent. Read timeouts
+# and protocol errors are not retried: the upstream may already have acted
+# on the request (a second chat turn, a second billed generation).
+RETRYABLE_ERRORS = (
+    httpx.ConnectError,
+    httpx.ConnectTimeout,
+    httpx.PoolTimeout,
+)
+
+
+class UpstreamError(Exception):
+    """An upstream call failed or was not attempted."""
+
+
+class UpstreamStatusError(UpstreamError):
+    """The upstream answered with a server error or rate limit."""
+    
+    def __init__(self, upstream: str, status_code: int):
+        super().__init__(f"{upstream} returned HTTP {status_code}")
+        self.status_code = status_code
+
+
+class CircuitOpenError(UpstreamError):
+    """The circuit breaker is open; the call was not attempted."""
+
+
+class BulkheadFullError(UpstreamError):
+    """No concurrency slot became free in time; the call was not attempted."""
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker.
+    
+    After ``failure_threshold`` failures in a row the breaker opens and
+    rejects calls for ``reset_timeout`` seconds. Then one probe call is let
+    through (half-open): success closes the breaker, failure opens it again.
+    """
+    
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+    
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.times_opened = 0
+        self._probing = False
+    
+    def allow(self) -> bool:
+        """Whether a call may go ahead now (may start a half-open probe)."""
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN:
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                return False
+            self.state = self.HALF_OPEN
+            self._probing = False
+        if self._probing:
+            return False
+        self._probing = True
+        return True
+    
+    def end_probe(self) -> None:
+        """Let the next call probe if the current probe ended without a result."""
+        self._probing = False
+    
+    def record_success(self) -> None:
+        """Close the breaker after a successful call."""
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self._probing = False
+    
+    def record_failure(self) -> None:
+        """Count a failure, opening the breaker at the threshold."""
+        self.consecutive_failures += 1
+        self._probing = False
+        if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                self.times_opened += 1
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+
+class RetryBudget:
+    """
+    Token bucket limiting retries to a fraction of calls.
+    
+    Every call deposits ``ratio`` tokens and every retry (or hedge) spends
+    one, so during an outage retries add at most ``ratio`` extra load
+    instead of multiplying it. The balance is capped at ``max_tokens``.
+    """
+    
+    def __init__(self, ratio: float, max_tokens: float = 10.0):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self.tokens = max_tokens
+    
+    def deposit(self) -> None:
+        """Credit the budget for one call."""
+        self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+    
+    def withdraw(self) -> bool:
+        """Spend one token; False if the budget is exhausted."""
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+class Resilience:
+    """
+    Bulkhead, retries, hedging and circuit breaker for one upstream.
+    
+    ``call`` runs an upstream request:
+    
+    - The circuit breaker fails fast while the upstream is known to be
+      down, so callers reach their fallback in microseconds instead of
+      waiting for a timeout.
+    - A semaphore bulkhead caps concurrent calls; callers wait at most
+      ``queue_timeout`` seconds for a slot. A slow upstream then holds a
+      bounded number of requests instead of every worker.
+    - Connection failures and 429/502/503/504 responses are retried with
+      full-jitter exponential backoff, limited by a retry budget.
+    - Optionally, a second identical request is started if the first has
+      not answered after ``hedge_delay`` seconds; the first result wins.
+      Only idempotent requests may be hedged (``hedge=True``).
+    
+    Calls that return an ``httpx.Response`` with a retryable status raise
+    UpstreamStatusError. Rejected calls raise CircuitOpenError or
+    BulkheadFullError; all of these are UpstreamError.
+    """
+    
+    def __init__(
+        self,
+        name: str,
+        max_concurrency: int,
+        queue_timeout: float = settings.upstream_queue_timeout,
+        max_retries: int = settings.upstream_max_retries,
+        retry_base_delay: float = settings.upstream_retry_base_delay,
+        retry_budget_ratio: float = settings.upstream_retry_budget_ratio,
+        failure_threshold: int = settings.upstream_breaker_failure_threshold,
+        reset_timeout: float = settings.upstream_breaker_reset_timeout,
+        hedge_delay: float = 0.0,
+    ):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.queue_timeout = queue_timeout
+        self.max_retries = max_retries
+        self.retry_base_delay = retry_base_delay
+        self.hedge_delay = hedge_delay
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.budget = RetryBudget(retry_budget_ratio)
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self.active = 0
+        self.calls = 0
+        self.failures = 0
+        self.retries = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.rejected_open = 0
+        self.rejected_full = 0
+    
+    def check_response(self, response: Any) -> None:
+        """
+        Raise UpstreamStatusError for server errors and rate limits.
+        
+        Args:
+            response: Result of an upstream call; non-responses are ignored
+        """
+        if isinstance(response, httpx.Response) and (
+            response.status_code in RETRYABLE_STATUSES or response.status_code >= 500
+        ):
+            raise UpstreamStatusError(self.name, response.status_code)
+    
+    def _admit(self) -> None:
+        """Count a call and reject it if the breaker is open."""
+        self.calls += 1
+        if not self.breaker.allow():
+            self.rejected_open += 1
+            raise CircuitOpenError(f"{self.name} circuit is open")
+    
+    @asynccontextmanager
+    async def _slot(self) -> AsyncIterator[None]:
+        """Hold one bulkhead slot."""
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.rejected_full += 1
+            raise BulkheadFullError(f"{self.name} has {self.max_concurrency} calls in flight")
+        
+        self.active += 1
+        try:
+            yield
+        finally:
+            self.active -= 1
+            self._semaphore.release()
+    
+    @staticmethod
+    def _is_retryable(error: Exception) -> bool:
+        if isinstance(error, UpstreamStatusError):
+            return error.status_code in RETRYABLE_STATUSES
+        return isinstance(error, RETRYABLE_ERRORS)
+    
+    async def _attempt(self, fn: Callable[[], Awaitable[T]]) -> T:
+        result = await fn()
+        self.check_response(result)
+        return result
+    
+    async def _hedged(self, fn: Callable[[], Awaitable[T]]) -> T:
+        """Run fn, starting a second copy if the first is slow."""
+        first = asyncio.ensure_future(self._attempt(fn))
+        done, _ = await asyncio.wait({first}, timeout=self.hedge_delay)
+        if done or not self.budget.withdraw():
+            return await first
+        
+        self.hedges += 1
+        second = asyncio.ensure_future(self._attempt(fn))
+        pending = {first, second}
+        error: Optional[BaseException] = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is second:
+                            self.hedge_wins += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+    
+    async def call(
+        self,
+        fn: Callable[[], Awaitable[T]],
+        hedge: bool = False,
+        retries: Optional[int] = None,
+    ) -> T:
+        """
+        Run an upstream request under this policy.
+        
+        Args:
+            fn: Coroutine function making one request; called again for
+                each retry or hedge, so it must be safe to repeat
+            hedge: Hedge the request if ``hedge_delay`` is set
+            retries: Override ``max_retries`` (0 for requests that must not
+                be repeated)
+        
+        Returns:
+            Result of the first successful attempt
+        
+        Raises:
+            UpstreamError: Call rejected or upstream failed
+            Exception: Last error from fn, if it was not retryable
+        """
+        max_retries = self.max_retries if retries is None else retries
+        self._admit()
+        try:
+            async with self._slot():
+                self.budget.deposit()
+                attempt = 0
+                while True:
+                    try:
+                        if hedge and self.hedge_delay > 0:
+                            result = await self._hedged(fn)
+                        else:
+                            result = await self._attempt(fn)
+                    except Exception as e:
+                        self.failures += 1
+                        self.breaker.record_failure()
+                        if (
+                            attempt >= max_retries
+                            or not self._is_retryable(e)
+                            or not self.breaker.allow()
+                            or not self.budget.withdraw()
+                        ):
+                            raise
+                        attempt += 1
+                        self.retries += 1
+                        await asyncio.sleep(random.uniform(0, self.retry_base_delay * 2 ** attempt))
+                        continue
+                    
+                    self.breaker.record_success()
+                    return result
+        finally:
+            # Rejected or cancelled calls must not hold the half-open probe
+            self.breaker.end_probe()
+    
+    @asynccontextmanager
+    async def guard(self) -> AsyncIterator[None]:
+        """
+        Run a block (e.g. a streamed response) under the breaker and bulkhead.
+        
+        The block is not retried or hedged. An exception escaping the block
+        counts as an upstream failure; use ``check_response`` inside it to
+        treat server errors as failures.
+        
+        Raises:
+            CircuitOpenError: Breaker is open
+            BulkheadFullError: No slot became free in time
+        """
+        self._admit()
+        try:
+            async with self._slot():
+                try:
+                    yield
+                except Exception:
+                    self.failures += 1
+                    self.breaker.record_failure()
+                    raise
+                self.breaker.record_success()
+        finally:
+            self.breaker.end_probe()
+    
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get policy counters.
+        
+        Returns:
+            Dictionary with breaker state, concurrency, retries and rejections
+        """
+        return {
+            "state": self.breaker.state,
+            "times_opened": self.breaker.times_opened,
+            "consecutive_failures": self.breaker.consecutive_failures,
+            "active": self.active,
+            "max_concurrency": self.max_concurrency,
+            "calls": self.calls,
+            "failures": self.failures,
+            "retries": self.retries,
+            "retry_tokens": round(self.budget.tokens, 2),
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "rejected_open": self.rejected_open,
+            "rejected_full": self.rejected_full,
+        }
+
+
+# Policies for each upstream
+inworld_resilience = Resilience(
+    "inworld",
+    max_concurrency=settings.inworld_max_concurrency,
+    hedge_delay=settings.inworld_hedge_delay,
+)
+sd_resilience = Resilience(
+    "sd",
+    max_concurrency=settings.sd_max_concurrency,
+)
@@ -0,0 +1,201 @@
+"""Cache of AI replies to short stock chat phrases."""
+
+import random
+import re
+import time
+from collections import Counter, OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.core.config import settings
+
+CacheKey = Tuple[str, str, str, str]
+
+_NON_WORD = re.compile(r"[^\w\s]+")
+
+
+@dataclass
+class CachedReplies:
+    """
+    Replies collected for one cache key.
+    
+    Attributes:
+        replies: Distinct upstream replies, each with content and emotion
+        created_at: Monotonic time the first reply was stored
+    """
+    
+    replies: List[Dict[str, Any]] = field(default_factory=list)
+    created_at: float = field(default_factory=time.monotonic)
+
+
+class ResponseCache:
+    """
+    Reuses InWorld replies to greetings and other short stock phrases.
+    
+    Messages such as "привет", "hi" or "как дела?" make up a large share of
+    chat traffic and each cost a full InWorld round trip. Replies to short
+    messages are cached per normalized message, agent and coarse character
+    state (energy and mood bands), so a tired character is not answered
+    with a cheerful reply cached for a rested one.
+    
+    A key is only served from the cache once ``variants`` distinct upstream
+    replies have been collected for it, and a random one is picked each
+    time, so cached answers do not feel canned. Entries expire after
+    ``ttl`` seconds and the least recently used entry is dropped beyond
+    ``max_entries``.
+    
+    Cached replies never reach InWorld, so the upstream conversation does
+    not see these exchanges; the cache is opt-in for that reason.
+    """
+    
+    def __init__(
+        self,
+        enabled: bool = settings.chat_response_cache_enabled,
+        max_entries: int = settings.chat_response_cache_max_entries,
+        ttl: float = settings.chat_response_cache_ttl,
+        variants: int = settings.chat_response_cache_variants,
+        max_words: int = settings.chat_response_cache_max_words,
+    ):
+        self.enabled = enabled
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.variants = variants
+        self.max_words = max_words
+        self._entries: "OrderedDict[CacheKey, CachedReplies]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.expired = 0
+        self.evicted = 0
+        self.bypassed: Counter = Counter()
+    
+    @staticmethod
+    def normalize(message: str) -> str:
+        """Lowercase a message and drop punctuation and repeated spaces."""
+        return " ".join(_NON_WORD.sub(" ", message.lower()).split())
+    
+    @staticmethod
+    def band(value: int) -> str:
+        """Coarse band for an energy or mood value (0-100)."""
+        if value < 34:
+            return "low"
+        if value < 67:
+            return "mid"
+        return "high"
+    
+    def key_for(
+        self,
+        message: str,
+        agent_id: str,
+        energy: int,
+        mood: int,
+        context: Optional[Dict[str, Any]] = None,
+    ) -> Optional[CacheKey]:
+        """
+        Build the cache key for a message, or None if it must bypass the cache.
+        
+        Args:
+            message: Raw user message
+            agent_id: InWorld agent of the character
+            energy: Character energy
+            mood: Character mood
+            context: Extra context sent to InWorld; replies depending on
+                it are not cached
+        
+        Returns:
+            Cache key, or None (the bypass reason is counted)
+        """
+        if not self.enabled:
+            return None
+        
+        if context:
+            self.bypassed["context"] += 1
+            return None
+        normalized = self.normalize(message)
+        if not normalized:
+            self.bypassed["empty"] += 1
+            return None
+        if len(normalized.split()) > self.max_words:
+            self.bypassed["long_message"] += 1
+            return None
+        
+        return (normalized, agent_id, self.band(energy), self.band(mood))
+    
+    def get(self, key: Optional[CacheKey]) -> Optional[Dict[str, Any]]:
+        """
+        Pick a cached reply for a key.
+        
+        Args:
+            key: Key from ``key_for``
+        
+        Returns:
+            Reply with ``content`` and ``emotion``, or None on a miss
+        """
+        if key is None:
+            return None
+        
+        entry = self._entries.get(key)
+        if entry is not None and time.monotonic() - entry.created_at > self.ttl:
+            del self._entries[key]
+            self.expired += 1
+            entry = None
+        
+        if entry is None or len(entry.replies) < self.variants:
+            self.misses += 1
+            return None
+        
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return random.choice(entry.replies)
+    
+    def put(self, key: Optional[CacheKey], reply: Dict[str, Any]) -> None:
+        """
+        Store an upstream reply for a key until enough variants are collected.
+        
+        Args:
+            key: Key from ``key_for``
+            reply: Upstream reply with ``content`` and ``emotion``; mock
+                replies must not be stored
+        """
+        if key is None or not reply.get("content"):
+            return
+        
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = self._entries[key] = CachedReplies()
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evicted += 1
+        
+        if len(entry.replies) >= self.variants:
+            return
+        if any(r["content"] == reply["content"] for r in entry.replies):
+            return
+        
+        entry.replies.append({"content": reply["content"], "emotion": reply.get("emotion")})
+        self.stores += 1
+    
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get cache counters.
+        
+        Returns:
+            Dictionary with entries, hit rate and bypass counts by reason
+        """
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "stores": self.stores,
+            "expired": self.expired,
+            "evicted": self.evicted,
+            "bypassed": dict(self.bypassed),
+        }
+
+
+# Singleton instance
+response_cache = ResponseCache()
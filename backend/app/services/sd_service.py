@@ -1,11 +1,35 @@
 """Stable Diffusion integration service for avatar generation."""
 
 from typing import List, Dict, Any, Optional
-import httpx
 import base64
 import random
 
 from app.core.config import settings
+from app.services.avatar_derivatives import avatar_derivatives
+from app.services.avatar_store import avatar_store
+from app.services.generation_cache import generation_cache
+from app.services.http_client import http_client_pool
+from app.services.resilience import sd_resilience
+from app.services.single_flight import SingleFlight
+
+# Prompt suffix for each visual style
+STYLE_PROMPTS = {
+    "anime": (
+        "anime style, vibrant colors, detailed eyes, "
+        "soft shading, beautiful character art, high quality, "
+        "studio ghibli inspired, cel shaded"
+    ),
+    "cyberpunk": (
+        "cyberpunk style, neon colors, futuristic, "
+        "high tech, chrome accents, holographic elements, "
+        "blade runner aesthetic, digital art"
+    ),
+    "fantasy": (
+        "fantasy art style, magical, ethereal glow, "
+        "detailed illustration, mystical atmosphere, "
+        "enchanted, fairy tale aesthetic, digital painting"
+    ),
+}
 
 
 class StableDiffusionService:
@@ -23,6 +47,8 @@ class StableDiffusionService:
     def __init__(self):
         self.api_key = settings.sd_api_key
         self.api_url = settings.sd_api_url
+        # Portrait generation, one upstream call per cache key at a time
+        self._portrait_flight = SingleFlight()
     
     @property
     def is_configured(self) -> bool:
@@ -39,24 +65,7 @@ class StableDiffusionService:
         Returns:
             Style-specific prompt suffix
         """
-        prompts = {
-            "anime": (
-                "anime style, vibrant colors, detailed eyes, "
-                "soft shading, beautiful character art, high quality, "
-                "studio ghibli inspired, cel shaded"
-            ),
-            "cyberpunk": (
-                "cyberpunk style, neon colors, futuristic, "
-                "high tech, chrome accents, holographic elements, "
-                "blade runner aesthetic, digital art"
-            ),
-            "fantasy": (
-                "fantasy art style, magical, ethereal glow, "
-                "detailed illustration, mystical atmosphere, "
-                "enchanted, fairy tale aesthetic, digital painting"
-            ),
-        }
-        return prompts.get(style, prompts["anime"])
+        return STYLE_PROMPTS.get(style, STYLE_PROMPTS["anime"])
     
     def get_negative_prompt(self) -> str:
         """
@@ -86,7 +95,7 @@ class StableDiffusionService:
             count: Number of images to generate
             
         Returns:
-            List of image URLs or base64 data URIs
+            List of stored avatar URLs (placeholder URLs if generation failed)
         """
         if not self.is_configured:
             return self._get_placeholder_avatars(style, count)
@@ -102,38 +111,38 @@ class StableDiffusionService:
                 f"{style_prompt}, masterpiece, best quality"
             )
             
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    f"{self.api_url}/v1/generation/stable-diffusion-xl-1024-v1-0/text-to-image",
-                    headers={
-                        "Authorization": f"Bearer {self.api_key}",
-                        "Content-Type": "application/json",
-                        "Accept": "application/json",
-                    },
-                    json={
-                        "text_prompts": [
-                            {"text": prompt, "weight": 1},
-                            {"text": self.get_negative_prompt(), "weight": -1},
-                        ],
-                        "cfg_scale": 7,
-                        "height": 1024,
-                        "width": 1024,
-                        "samples": count,
-                        "steps": 30,
-                    },
-                    timeout=60.0,
-                )
+            client = http_client_pool.client("sd")
+            response = await sd_resilience.call(lambda: client.post(
+                f"{self.api_url}/v1/generation/stable-diffusion-xl-1024-v1-0/text-to-image",
+                headers={
+                    "Authorization": f"Bearer {self.api_key}",
+                    "Content-Type": "application/json",
+                    "Accept": "application/json",
+                },
+                json={
+                    "text_prompts": [
+                        {"text": prompt, "weight": 1},
+                        {"text": self.get_negative_prompt(), "weight": -1},
+                    ],
+                    "cfg_scale": 7,
+                    "height": 1024,
+                    "width": 1024,
+                    "samples": count,
+                    "steps": 30,
+                },
+                timeout=60.0,
+            ))
+            
+            if response.status_code == 200:
+                data = response.json()
+                images = await avatar_store.save_artifacts([
+                    artifact["base64"]
+                    for artifact in data.get("artifacts", [])
+                    if artifact.get("finishReason") == "SUCCESS" and artifact.get("base64")
+                ])
+                avatar_derivatives.schedule(images)
+                return images if images else self._get_placeholder_avatars(style, count)
                 
-                if response.status_code == 200:
-                    data = response.json()
-                    images = []
-                    for artifact in data.get("artifacts", []):
-                        if artifact.get("finishReason") == "SUCCESS":
-                            base64_image = artifact.get("base64")
-                            if base64_image:
-                                images.append(f"data:image/png;base64,{base64_image}")
-                    return images if images else self._get_placeholder_avatars(style, count)
-                    
         except Exception as e:
             print(f"Stable Diffusion generation failed: {e}")
         
@@ -186,24 +195,70 @@ class StableDiffusionService:
         style: str,
         prompt: str = "",
         count: int = 4,
+        fresh: bool = False,
+        shared: bool = True,
     ) -> List[str]:
         """
         Generate portrait images for character creation (Avatar Studio).
         
         This is the primary method for the Avatar Studio wizard.
         Generates portrait-focused images optimized for character avatars.
+        Identical requests are served from the generation cache, and
+        concurrent identical requests share one upstream call. Fresh
+        requests do neither, so their images are never given to anyone else.
         
         Args:
             style: Visual style (anime, cyberpunk, fantasy)
             prompt: User's appearance description (e.g., "рыжие волосы, зеленые глаза")
             count: Number of variants to generate (default 4)
+            fresh: Generate new images even if a cached set exists
+            shared: Use the generation cache and coalescing; False generates
+                images no other request gets without counting a cache skip
+                (avatar stock)
             
         Returns:
-            List of image URLs or base64 data URIs
+            List of stored avatar URLs (placeholder URLs if generation failed)
         """
         if not self.is_configured:
             return self._get_placeholder_avatars(style, count)
         
+        prompt = generation_cache.canonical_prompt(prompt)
+        
+        if fresh or not shared:
+            # Images for this caller only: no coalescing, and the cached set
+            # non-fresh requests are served from is left as it is
+            if fresh:
+                generation_cache.skip(style)
+            images = await self._generate_portraits(None, style, prompt, count)
+            return images if images else self._get_placeholder_avatars(style, count)
+        
+        key = generation_cache.key_for(style, prompt, count)
+        cached = generation_cache.get(key, style)
+        if cached:
+            return cached
+        
+        images = await self._portrait_flight.do(
+            key,
+            lambda: self._generate_portraits(key, style, prompt, count),
+        )
+        return images if images else self._get_placeholder_avatars(style, count)
+    
+    async def _generate_portraits(
+        self,
+        key: Optional[str],
+        style: str,
+        prompt: str,
+        count: int,
+    ) -> Optional[List[str]]:
+        """
+        Call Stable Diffusion for portraits and cache the stored result.
+        
+        Args:
+            key: Generation cache key, or None to not cache the result
+        
+        Returns:
+            List of stored avatar URLs, or None if generation failed
+        """
         try:
             # Build enhanced prompt for portraits
             style_prompt = self.get_style_prompt(style)
@@ -224,42 +279,47 @@ class StableDiffusionService:
                     f"portrait composition, centered face"
                 )
             
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    f"{self.api_url}/v1/generation/stable-diffusion-xl-1024-v1-0/text-to-image",
-                    headers={
-                        "Authorization": f"Bearer {self.api_key}",
-                        "Content-Type": "application/json",
-                        "Accept": "application/json",
-                    },
-                    json={
-                        "text_prompts": [
-                            {"text": full_prompt, "weight": 1},
-                            {"text": self.get_negative_prompt(), "weight": -1},
-                        ],
-                        "cfg_scale": 7,
-                        "height": 1024,
-                        "width": 1024,
-                        "samples": count,
-                        "steps": 30,
-                    },
-                    timeout=90.0,
-                )
+            client = http_client_pool.client("sd")
+            response = await sd_resilience.call(lambda: client.post(
+                f"{self.api_url}/v1/generation/stable-diffusion-xl-1024-v1-0/text-to-image",
+                headers={
+                    "Authorization": f"Bearer {self.api_key}",
+                    "Content-Type": "application/json",
+                    "Accept": "application/json",
+                },
+                json={
+                    "text_prompts": [
+                        {"text": full_prompt, "weight": 1},
+                        {"text": self.get_negative_prompt(), "weight": -1},
+                    ],
+                    "cfg_scale": 7,
+                    "height": 1024,
+                    "width": 1024,
+                    "samples": count,
+                    "steps": 30,
+                },
+                timeout=90.0,
+            ))
+            
+            if response.status_code == 200:
+                data = response.json()
+                encoded = [
+                    artifact["base64"]
+                    for artifact in data.get("artifacts", [])
+                    if artifact.get("finishReason") == "SUCCESS" and artifact.get("base64")
+                ]
+                images = await avatar_store.save_artifacts(encoded)
+                if images:
+                    avatar_derivatives.schedule(images)
+                    if key is not None:
+                        # Decoded size of the base64 images
+                        generation_cache.put(key, style, images, sum(len(e) * 3 // 4 for e in encoded))
+                    return images
                 
-                if response.status_code == 200:
-                    data = response.json()
-                    images = []
-                    for artifact in data.get("artifacts", []):
-                        if artifact.get("finishReason") == "SUCCESS":
-                            base64_image = artifact.get("base64")
-                            if base64_image:
-                                images.append(f"data:image/png;base64,{base64_image}")
-                    return images if images else self._get_placeholder_avatars(style, count)
-                    
         except Exception as e:
             print(f"Portrait generation failed: {e}")
         
-        return self._get_placeholder_avatars(style, count)
+        return None
     
     async def upscale_image(
         self,
@@ -280,25 +340,25 @@ class StableDiffusionService:
             return image_data  # Return original if not configured
         
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    f"{self.api_url}/v1/generation/esrgan-v1-x2plus/image-to-image/upscale",
-                    headers={
-                        "Authorization": f"Bearer {self.api_key}",
-                        "Accept": "application/json",
-                    },
-                    files={
-                        "image": base64.b64decode(image_data.split(",")[1] if "," in image_data else image_data),
-                    },
-                    timeout=60.0,
-                )
-                
-                if response.status_code == 200:
-                    data = response.json()
-                    for artifact in data.get("artifacts", []):
-                        if artifact.get("finishReason") == "SUCCESS":
-                            return f"data:image/png;base64,{artifact.get('base64')}"
-                            
+            client = http_client_pool.client("sd")
+            response = await sd_resilience.call(lambda: client.post(
+                f"{self.api_url}/v1/generation/esrgan-v1-x2plus/image-to-image/upscale",
+                headers={
+                    "Authorization": f"Bearer {self.api_key}",
+                    "Accept": "application/json",
+                },
+                files={
+                    "image": base64.b64decode(image_data.split(",")[1] if "," in image_data else image_data),
+                },
+                timeout=60.0,
+            ))
+            
+            if response.status_code == 200:
+                data = response.json()
+                for artifact in data.get("artifacts", []):
+                    if artifact.get("finishReason") == "SUCCESS":
+                        return f"data:image/png;base64,{artifact.get('base64')}"
+                        
         except Exception as e:
             print(f"Image upscale failed: {e}")
         
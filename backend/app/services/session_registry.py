@@ -0,0 +1,186 @@
+"""Bounded registry of InWorld conversation sessions."""
+
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional
+
+from app.core.config import settings
+
+Session = Dict[str, Any]
+
+
+class SessionRegistry:
+    """
+    Session dictionary with idle expiry and least-recently-used eviction.
+    
+    Behaves like the plain dict it replaces (``in``, ``get``, item access,
+    ``pop``), but every read marks the session as used. Adding a session
+    beyond ``max_sessions`` evicts the least recently used one, and a
+    background sweeper removes sessions idle for longer than ``idle_ttl``
+    seconds.
+    
+    Removed sessions are handed to ``on_close`` in batches of
+    ``sweep_batch_size`` so the upstream sessions can be ended. Closing
+    only happens while the sweeper runs (between ``start`` and ``stop`` in
+    the app lifespan); otherwise removed sessions are simply dropped.
+    """
+    
+    def __init__(
+        self,
+        on_close: Optional[Callable[[List[Session]], Awaitable[None]]] = None,
+        max_sessions: int = settings.inworld_max_sessions,
+        idle_ttl: float = settings.inworld_session_idle_ttl,
+        sweep_interval: float = settings.inworld_session_sweep_interval,
+        sweep_batch_size: int = settings.inworld_session_sweep_batch,
+    ):
+        self.on_close = on_close
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self.sweep_interval = sweep_interval
+        self.sweep_batch_size = sweep_batch_size
+        # Least recently used first; values are (session, last used)
+        self._sessions: "OrderedDict[str, tuple]" = OrderedDict()
+        # Evicted or expired sessions waiting to be ended upstream
+        self._closing: List[Session] = []
+        self._task: Optional[asyncio.Task] = None
+        self.evicted = 0
+        self.expired = 0
+        self.closed = 0
+        self.close_errors = 0
+    
+    @property
+    def is_running(self) -> bool:
+        """Whether expired sessions are being swept."""
+        return self._task is not None and not self._task.done()
+    
+    def __len__(self) -> int:
+        return len(self._sessions)
+    
+    def __iter__(self) -> Iterator[str]:
+        return iter(list(self._sessions))
+    
+    def __contains__(self, key: object) -> bool:
+        return key in self._sessions
+    
+    def __getitem__(self, key: str) -> Session:
+        session, _ = self._sessions[key]
+        self._sessions[key] = (session, time.monotonic())
+        self._sessions.move_to_end(key)
+        return session
+    
+    def get(self, key: str, default: Any = None) -> Any:
+        """Get a session and mark it as used."""
+        if key not in self._sessions:
+            return default
+        return self[key]
+    
+    def __setitem__(self, key: str, session: Session) -> None:
+        self._sessions[key] = (session, time.monotonic())
+        self._sessions.move_to_end(key)
+        
+        while len(self._sessions) > self.max_sessions:
+            _, (evicted, _) = self._sessions.popitem(last=False)
+            self.evicted += 1
+            self._retire(evicted)
+    
+    def pop(self, key: str, default: Any = None) -> Any:
+        """Remove a session without ending it upstream."""
+        entry = self._sessions.pop(key, None)
+        return entry[0] if entry is not None else default
+    
+    def __delitem__(self, key: str) -> None:
+        del self._sessions[key]
+    
+    def _retire(self, session: Session) -> None:
+        """Queue a removed session for closing upstream."""
+        if self.is_running and self.on_close is not None:
+            self._closing.append(session)
+    
+    def expire(self, now: Optional[float] = None) -> int:
+        """
+        Remove sessions idle for longer than the TTL.
+        
+        Args:
+            now: Current monotonic time (defaults to time.monotonic())
+        
+        Returns:
+            Number of sessions removed
+        """
+        cutoff = (now if now is not None else time.monotonic()) - self.idle_ttl
+        removed = 0
+        
+        # Oldest first, so stop at the first session still in use
+        while self._sessions:
+            key, (session, last_used) = next(iter(self._sessions.items()))
+            if last_used > cutoff:
+                break
+            del self._sessions[key]
+            self._retire(session)
+            removed += 1
+        
+        self.expired += removed
+        return removed
+    
+    async def close_retired(self) -> None:
+        """
+        End queued sessions upstream in batches.
+        
+        A batch stays queued until ``on_close`` returns, so one interrupted
+        by ``stop`` cancelling the sweeper is closed by ``stop`` itself.
+        """
+        while self._closing:
+            batch = self._closing[:self.sweep_batch_size]
+            try:
+                await self.on_close(batch)
+                self.closed += len(batch)
+            except Exception as e:
+                print(f"Closing expired sessions failed: {e}")
+                self.close_errors += len(batch)
+            # Sessions retired meanwhile were appended after the batch
+            del self._closing[:len(batch)]
+    
+    async def _run(self) -> None:
+        """Expire idle sessions on the interval and close them upstream."""
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            self.expire()
+            await self.close_retired()
+    
+    def start(self) -> None:
+        """Start the background sweeper."""
+        if not self.is_running:
+            self._task = asyncio.create_task(self._run())
+    
+    async def stop(self) -> None:
+        """Stop the sweeper and close sessions already removed."""
+        if self._task is None:
+            return
+        
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        
+        await self.close_retired()
+    
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get registry counters.
+        
+        Returns:
+            Dictionary with live, evicted, expired and closed sessions
+        """
+        return {
+            "running": self.is_running,
+            "live": len(self._sessions),
+            "max_sessions": self.max_sessions,
+            "idle_ttl": self.idle_ttl,
+            "evicted": self.evicted,
+            "expired": self.expired,
+            "closing": len(self._closing),
+            "closed": self.closed,
+            "close_errors": self.close_errors,
+        }
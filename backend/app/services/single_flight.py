@@ -0,0 +1,67 @@
+"""Coalescing of concurrent identical async calls."""
+
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, TypeVar
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """
+    Runs at most one call per key at a time.
+    
+    Callers that ask for a key while a call for it is in flight await that
+    call's result (or exception) instead of starting their own. The call
+    runs as its own task, so a caller that is cancelled does not cancel it
+    for the others. Once it finishes the key is free again; results are
+    not cached.
+    """
+    
+    def __init__(self):
+        self._calls: Dict[Hashable, asyncio.Task] = {}
+        self.executed = 0
+        self.coalesced = 0
+    
+    def in_flight(self, key: Hashable) -> bool:
+        """Check whether a call for a key is running."""
+        return key in self._calls
+    
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        """
+        Run fn for a key, or join the call already running for it.
+        
+        Args:
+            key: Identity of the call
+            fn: Coroutine function to run if no call is in flight
+        
+        Returns:
+            Result of the shared call
+        """
+        task = self._calls.get(key)
+        if task is not None:
+            self.coalesced += 1
+            return await asyncio.shield(task)
+        
+        task = asyncio.ensure_future(fn())
+        self._calls[key] = task
+        self.executed += 1
+        
+        def forget(done: asyncio.Task) -> None:
+            if self._calls.get(key) is done:
+                del self._calls[key]
+        
+        task.add_done_callback(forget)
+        return await asyncio.shield(task)
+    
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get coalescing counters.
+        
+        Returns:
+            Dictionary with calls in flight, executed and coalesced
+        """
+        return {
+            "in_flight": len(self._calls),
+            "executed": self.executed,
+            "coalesced": self.coalesced,
+        }
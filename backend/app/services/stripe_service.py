@@ -25,6 +25,7 @@ class StripeService:
         
         if self.api_key:
             stripe.api_key = self.api_key
+            stripe.api_base = settings.stripe_api_base
     
     @property
     def is_configured(self) -> bool:
@@ -0,0 +1,202 @@
+"""
+Replace mock InWorld agents with real ones.
+
+Characters created while InWorld was unconfigured or unavailable got a
+local fallback agent (``inworld_agent_is_mock``). This job walks those
+characters in primary key order through the partial index, creates a real
+agent for each with bounded concurrency and a request rate limit, and
+writes the new IDs back one batch at a time.
+
+The job is resumable: converted characters drop out of the scan, so running
+it again continues where it stopped and retries failures. ``--after`` skips
+to the cursor printed with each batch. The job stops early when a whole
+batch fails, which usually means InWorld is down.
+
+Usage:
+    python scripts/backfill_inworld_agents.py [--batch-size 100] \\
+        [--concurrency 4] [--rate 5] [--limit N] [--after UUID] [--dry-run]
+"""
+
+import argparse
+import asyncio
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+from uuid import UUID
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from sqlalchemy import bindparam, func, update  # noqa: E402
+
+from app.core.database import SessionLocal  # noqa: E402
+from app.models.character import Character  # noqa: E402
+from app.services.http_client import http_client_pool  # noqa: E402
+from app.services.inworld_service import inworld_service  # noqa: E402
+
+MockCharacter = Tuple[UUID, str, str]
+
+
+class RateLimiter:
+    """Spaces calls out to at most ``rate`` per second (0 for no limit)."""
+
+    def __init__(self, rate: float):
+        self.interval = 1 / rate if rate > 0 else 0.0
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self) -> None:
+        async with self._lock:
+            now = time.monotonic()
+            delay = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+# ============================================================================
+# Database
+# ============================================================================
+
+def count_mock(after: Optional[UUID]) -> int:
+    """Count characters still on a mock agent."""
+    db = SessionLocal()
+    try:
+        query = db.query(func.count(Character.id)).filter(Character.inworld_agent_is_mock.is_(True))
+        if after is not None:
+            query = query.filter(Character.id > after)
+        return query.scalar()
+    finally:
+        db.close()
+
+
+def load_batch(after: Optional[UUID], size: int) -> List[MockCharacter]:
+    """Load the next characters on a mock agent, by primary key."""
+    db = SessionLocal()
+    try:
+        query = db.query(Character.id, Character.name, Character.style).filter(
+            Character.inworld_agent_is_mock.is_(True),
+        )
+        if after is not None:
+            query = query.filter(Character.id > after)
+        return [tuple(row) for row in query.order_by(Character.id).limit(size).all()]
+    finally:
+        db.close()
+
+
+def save_batch(rows: List[Dict[str, Any]]) -> None:
+    """Store new agents, skipping characters converted in the meantime."""
+    table = Character.__table__
+    statement = update(table).where(
+        table.c.id == bindparam("b_id"),
+        table.c.inworld_agent_is_mock.is_(True),
+    ).values(
+        inworld_agent_id=bindparam("b_agent_id"),
+        inworld_scene_id=bindparam("b_scene_id"),
+        inworld_agent_is_mock=False,
+    )
+
+    db = SessionLocal()
+    try:
+        db.execute(statement, rows)
+        db.commit()
+    finally:
+        db.close()
+
+
+# ============================================================================
+# Backfill
+# ============================================================================
+
+async def provision(
+    character: MockCharacter,
+    semaphore: asyncio.Semaphore,
+    limiter: RateLimiter,
+) -> Optional[Dict[str, Any]]:
+    """Create a real agent for a character; None if InWorld failed."""
+    character_id, name, style = character
+    async with semaphore:
+        await limiter.wait()
+        agent = await inworld_service.create_agent(name=name, style=style)
+
+    if agent.get("mock"):
+        return None
+    return {
+        "b_id": character_id,
+        "b_agent_id": agent["agent_id"],
+        "b_scene_id": agent.get("scene_id"),
+    }
+
+
+async def backfill(args: argparse.Namespace) -> int:
+    if not inworld_service.is_configured:
+        print("InWorld is not configured (INWORLD_API_KEY, INWORLD_WORKSPACE_ID)")
+        return 1
+
+    total = await asyncio.to_thread(count_mock, args.after)
+    if args.limit is not None:
+        total = min(total, args.limit)
+    print(f"{total} characters to convert")
+    if args.dry_run or total == 0:
+        return 0
+
+    semaphore = asyncio.Semaphore(args.concurrency)
+    limiter = RateLimiter(args.rate)
+    cursor = args.after
+    converted = failed = 0
+    started = time.monotonic()
+
+    try:
+        while converted + failed < total:
+            size = min(args.batch_size, total - converted - failed)
+            batch = await asyncio.to_thread(load_batch, cursor, size)
+            if not batch:
+                break
+
+            results = await asyncio.gather(*(provision(c, semaphore, limiter) for c in batch))
+            rows = [row for row in results if row is not None]
+            if rows:
+                await asyncio.to_thread(save_batch, rows)
+
+            converted += len(rows)
+            failed += len(batch) - len(rows)
+            cursor = batch[-1][0]
+
+            done = converted + failed
+            elapsed = time.monotonic() - started
+            rate = done / elapsed if elapsed > 0 else 0.0
+            eta = (total - done) / rate if rate > 0 else 0.0
+            print(f"{done}/{total} processed, {converted} converted, {failed} failed, "
+                  f"{rate:.1f}/s, ETA {eta:.0f}s, cursor {cursor}")
+
+            if not rows:
+                print("Whole batch failed; stopping. Run again to resume.")
+                break
+    finally:
+        await http_client_pool.stop()
+
+    elapsed = time.monotonic() - started
+    print(f"Converted {converted} characters in {elapsed:.1f}s ({failed} failed)")
+    return 0 if failed == 0 else 1
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=4,
+                        help="agent creations in flight at once")
+    parser.add_argument("--rate", type=float, default=5.0,
+                        help="agent creations per second (0 for no limit)")
+    parser.add_argument("--limit", type=int, default=None,
+                        help="convert at most this many characters")
+    parser.add_argument("--after", type=UUID, default=None,
+                        help="resume after this character ID")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="only count characters with mock agents")
+    args = parser.parse_args()
+
+    sys.exit(asyncio.run(backfill(args)))
+
+
+if __name__ == "__main__":
+    main()
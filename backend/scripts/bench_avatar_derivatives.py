@@ -0,0 +1,124 @@
+"""
+Benchmark avatar derivative rendering (resize + AVIF/WebP/PNG encoding).
+
+Renders every configured size and format of 1024x1024 avatars, first in
+this process to break down time and output size per variant, then through
+process pools of increasing size like the server does, reporting source
+images per second overall and per worker process.
+
+Pass ``--source`` with real avatars (a directory of PNGs) for realistic
+numbers; by default a synthetic portrait-like image is used.
+
+Usage:
+    python scripts/bench_avatar_derivatives.py [--images 24] [--workers 1,2,4] \\
+        [--sizes 64,128,256,512] [--formats avif,webp,png] [--quality 80] [--source DIR]
+"""
+
+import argparse
+import importlib.util
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import List
+
+# Load the module directly so the benchmark needs no configured app settings
+MODULE_PATH = Path(__file__).resolve().parents[1] / "app" / "imaging" / "render.py"
+spec = importlib.util.spec_from_file_location("image_render", MODULE_PATH)
+image_render = importlib.util.module_from_spec(spec)
+sys.modules["image_render"] = image_render
+spec.loader.exec_module(image_render)
+
+
+def make_source(directory: str) -> str:
+    """Write a synthetic 1024x1024 avatar: gradients, shapes and noise."""
+    from PIL import Image, ImageDraw, ImageFilter
+
+    size = 1024
+    image = Image.radial_gradient("L").resize((size, size))
+    image = Image.merge("RGB", (
+        image,
+        Image.linear_gradient("L").resize((size, size)),
+        Image.effect_noise((size, size), 40),
+    ))
+    draw = ImageDraw.Draw(image)
+    draw.ellipse((262, 180, 762, 760), fill=(240, 200, 180))
+    draw.ellipse((372, 380, 452, 440), fill=(40, 120, 90))
+    draw.ellipse((572, 380, 652, 440), fill=(40, 120, 90))
+    draw.arc((412, 520, 612, 640), 20, 160, fill=(180, 60, 80), width=12)
+    image = image.filter(ImageFilter.GaussianBlur(1.5))
+
+    path = os.path.join(directory, "synthetic.png")
+    image.save(path, "PNG")
+    return path
+
+
+def breakdown(source: str, sizes: List[int], formats: List[str], quality: int) -> None:
+    """Time each format separately in this process."""
+    print(f"{'format':<8}{'ms/image':>10}  bytes per size")
+    for fmt in formats:
+        start = time.perf_counter()
+        derivatives = image_render.render(source, sizes, [fmt], quality)
+        elapsed = (time.perf_counter() - start) * 1000
+        sizes_text = ", ".join(f"{s}: {len(derivatives[f'{s}.{fmt}']):,}" for s in sizes)
+        print(f"{fmt:<8}{elapsed:>10.1f}  {sizes_text}")
+
+
+def throughput(sources: List[str], workers: int, sizes: List[int], formats: List[str], quality: int) -> float:
+    """Render all sources through a pool; return source images per second."""
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # Start the workers before timing
+        list(pool.map(image_render.supported_formats, [formats] * workers))
+        start = time.perf_counter()
+        list(pool.map(
+            image_render.render,
+            sources,
+            [sizes] * len(sources),
+            [formats] * len(sources),
+            [quality] * len(sources),
+        ))
+        return len(sources) / (time.perf_counter() - start)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--images", type=int, default=24)
+    parser.add_argument("--workers", default="1,2,4")
+    parser.add_argument("--sizes", default="64,128,256,512")
+    parser.add_argument("--formats", default="avif,webp,png")
+    parser.add_argument("--quality", type=int, default=80)
+    parser.add_argument("--source", default=None, help="directory of PNG avatars")
+    args = parser.parse_args()
+
+    if not image_render.PIL_AVAILABLE:
+        print("Pillow is not installed (pip install -r requirements.txt)")
+        sys.exit(1)
+
+    sizes = sorted(int(s) for s in args.sizes.split(","))
+    formats = image_render.supported_formats(args.formats.split(","))
+    skipped = sorted(set(args.formats.split(",")) - set(formats))
+    workers = [int(w) for w in args.workers.split(",")]
+
+    with tempfile.TemporaryDirectory() as directory:
+        if args.source:
+            originals = sorted(str(p) for p in Path(args.source).glob("*.png"))
+        else:
+            originals = [make_source(directory)]
+        sources = [originals[i % len(originals)] for i in range(args.images)]
+
+        print(f"{len(originals)} source image(s), sizes {sizes}, formats {formats}"
+              + (f" (not supported here: {skipped})" if skipped else "")
+              + f", {os.cpu_count()} CPUs")
+        print()
+        breakdown(originals[0], sizes, formats, args.quality)
+        print()
+        print(f"{'workers':<10}{'images/s':>10}{'per worker':>12}")
+        for count in workers:
+            rate = throughput(sources, count, sizes, formats, args.quality)
+            print(f"{count:<10}{rate:>10.2f}{rate / count:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
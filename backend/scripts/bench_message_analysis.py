@@ -0,0 +1,153 @@
+"""
+Benchmark single-pass message analysis against the legacy keyword loops.
+
+The legacy helpers lowercased the message and ran ``word in message_lower``
+over each keyword table separately, several times per request. This script
+times the classification work one chat request did before (sentiment,
+emotion, both mock intents and emotions) against one ``analyze_message``
+call, on 2,000-character messages.
+
+Usage:
+    python scripts/bench_message_analysis.py [--iterations 2000] [--length 2000]
+"""
+
+import argparse
+import importlib.util
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+# Load the module directly so the benchmark needs no configured app settings
+MODULE_PATH = Path(__file__).resolve().parents[1] / "app" / "services" / "message_analysis.py"
+spec = importlib.util.spec_from_file_location("message_analysis", MODULE_PATH)
+ma = importlib.util.module_from_spec(spec)
+sys.modules["message_analysis"] = ma
+spec.loader.exec_module(ma)
+
+
+# ============================================================================
+# Legacy implementation (as it was in chat.py and inworld_service.py)
+# ============================================================================
+
+# InWorldService._get_mock_response tables, since replaced by the shared
+# fallback engine and removed from message_analysis
+INWORLD_EMOTION_RULES = [
+    ("happy", ["люблю", "love", "happy", "хорошо", "отлично", "great", "awesome"]),
+    ("sad", ["грустно", "sad", "upset", "angry", "плохо"]),
+    ("excited", ["привет", "hello", "hi", "hey", "здравствуй"]),
+    ("tired", ["устал", "tired", "спать"]),
+    ("excited", ["круто", "супер", "ура", "wow", "amazing"]),
+    ("neutral", ["?"]),
+]
+
+INWORLD_INTENT_RULES = [
+    ("greeting_ru", ["привет", "здравствуй", "приветик"]),
+    ("greeting_en", ["hello", "hi", "hey"]),
+    ("feed", ["покорми", "еда", "кушать", "голодный"]),
+    ("play", ["поиграй", "играть", "игра"]),
+    ("tired", ["устал", "спать", "отдых", "tired"]),
+    ("question", ["?"]),
+    ("emotional_ru", ["люблю", "грустно", "печально"]),
+    ("emotional_en", ["love", "feel", "sad", "happy"]),
+]
+
+
+def _first(message_lower, rules, default):
+    for label, words in rules:
+        if any(word in message_lower for word in words):
+            return label
+    return default
+
+
+def legacy_request(message: str) -> tuple:
+    """Classification work done per request by the legacy helpers."""
+    # analyze_sentiment
+    message_lower = message.lower()
+    positive = sum(1 for word in ma.POSITIVE_KEYWORDS if word in message_lower)
+    negative = sum(1 for word in ma.NEGATIVE_KEYWORDS if word in message_lower)
+    # determine_emotion
+    message_lower = message.lower()
+    emotion = _first(message_lower, ma.EMOTION_RULES, "neutral")
+    # InWorldService._get_mock_response
+    message_lower = message.lower()
+    _first(message_lower, INWORLD_EMOTION_RULES, None)
+    _first(message_lower, INWORLD_INTENT_RULES, "default")
+    # get_mock_response / get_mock_emotion
+    message_lower = message.lower()
+    intent = _first(message_lower, ma.MOCK_INTENT_RULES, "default")
+    message_lower = message.lower()
+    mock_emotion = _first(message_lower, ma.MOCK_EMOTION_RULES, "neutral")
+    return positive, negative, emotion, intent, mock_emotion
+
+
+def new_request(message: str) -> tuple:
+    """Same classification from a single scan (the InWorld mock tables are gone)."""
+    a = ma.analyze_message.__wrapped__(message)
+    return (
+        a.positive_count,
+        a.negative_count,
+        a.emotion or "neutral",
+        a.intent,
+        a.mock_emotion,
+    )
+
+
+# ============================================================================
+# Workload
+# ============================================================================
+
+FILLER = (
+    "сегодня была погода и мы пошли гулять в парк где много деревьев "
+    "и людей мне кажется что завтра будет дождь а потом снова солнце "
+    "the weather today was quite pleasant and we went for a walk along "
+    "the river then we talked about work plans and music"
+).split()
+
+
+def make_message(length: int, keyword_ratio: float, rng: random.Random) -> str:
+    """Build a message of roughly ``length`` characters."""
+    keywords = sorted(ma.automaton.keywords - {"?"})
+    words = []
+    size = 0
+    while size < length:
+        word = rng.choice(keywords) if rng.random() < keyword_ratio else rng.choice(FILLER)
+        words.append(word.capitalize() if rng.random() < 0.1 else word)
+        size += len(word) + 1
+    return " ".join(words)[:length]
+
+
+def bench(func, messages, iterations: int) -> float:
+    """Return median microseconds per call."""
+    samples = []
+    for i in range(iterations):
+        message = messages[i % len(messages)]
+        start = time.perf_counter()
+        func(message)
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples) * 1e6
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--length", type=int, default=2000)
+    args = parser.parse_args()
+    
+    rng = random.Random(42)
+    print(f"{len(ma.automaton.keywords)} keywords, {args.length}-char messages, "
+          f"{args.iterations} iterations (median per request)")
+    print(f"{'keyword density':<18}{'legacy us':>12}{'single-pass us':>16}{'speedup':>10}")
+    
+    for ratio in (0.0, 0.05, 0.3):
+        messages = [make_message(args.length, ratio, rng) for _ in range(50)]
+        for message in messages:
+            assert legacy_request(message) == new_request(message), message
+        legacy = bench(legacy_request, messages, args.iterations)
+        single = bench(new_request, messages, args.iterations)
+        print(f"{ratio:<18.2f}{legacy:>12.1f}{single:>16.1f}{legacy / single:>9.2f}x")
+
+
+if __name__ == "__main__":
+    main()
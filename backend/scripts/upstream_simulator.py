@@ -0,0 +1,586 @@
+"""
+Local stand-in for the InWorld, Stability AI and Stripe APIs.
+
+The services fall back to mocks when API keys are missing, so load tests
+never exercise the real HTTP code paths (connection pools, timeouts,
+retries, circuit breakers, large image payloads). This simulator serves the
+endpoints the services actually call, with configurable latency, error
+rates, hangs and payload sizes.
+
+All three upstreams share one port under path prefixes. Point the backend
+at it with the environment printed on startup, e.g.:
+
+    INWORLD_API_URL=http://127.0.0.1:8100/inworld/v1
+    SD_API_URL=http://127.0.0.1:8100/sd
+    STRIPE_API_BASE=http://127.0.0.1:8100/stripe
+
+Latency specs are ``fixed:S``, ``uniform:LOW:HIGH``, ``lognormal:MEDIAN:SIGMA``
+or ``exp:MEAN`` (seconds). Faults: ``--*-error-rate`` answers with a random
+429/500/502/503, ``--*-hang-rate`` sleeps ``--hang`` seconds before answering.
+Settings can be changed while running with ``PATCH /_sim/config``, and
+request counters are at ``GET /_sim/stats``.
+
+InWorld sessions also accept a WebSocket at ``/sessions/{id}/connect`` (see
+app/services/inworld_stream.py for the frames). ``--ws-drop-rate`` closes
+the socket after a fraction of events to exercise reconnect and resume.
+
+Usage:
+    python scripts/upstream_simulator.py [--port 8100] \\
+        [--inworld-latency lognormal:0.4:0.5] [--sd-latency uniform:8:15] \\
+        [--inworld-error-rate 0.02] [--image-size 1024]
+
+In-process (benchmarks, load tests):
+    from upstream_simulator import SimulatorConfig, run_in_thread
+    simulator = run_in_thread(SimulatorConfig(port=8100))
+    ...
+    simulator.stop()
+"""
+
+import argparse
+import asyncio
+import base64
+import json
+import math
+import random
+import struct
+import threading
+import time
+import uuid
+import zlib
+from collections import Counter, deque
+from dataclasses import asdict, dataclass, field
+from typing import Any, AsyncIterator, Callable, Deque, Dict, Optional, Set
+
+import uvicorn
+from fastapi import FastAPI, Request, Response, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, StreamingResponse
+
+FAULT_STATUSES = (429, 500, 502, 503)
+
+
+# ============================================================================
+# Configuration
+# ============================================================================
+
+def parse_latency(spec: str) -> Callable[[], float]:
+    """
+    Build a latency sampler from a spec string.
+
+    Args:
+        spec: ``fixed:S``, ``uniform:LOW:HIGH``, ``lognormal:MEDIAN:SIGMA``
+            or ``exp:MEAN``, in seconds
+
+    Returns:
+        Function returning one latency sample in seconds
+    """
+    kind, *params = spec.split(":")
+    values = [float(p) for p in params]
+
+    if kind == "fixed" and len(values) == 1:
+        return lambda: values[0]
+    if kind == "uniform" and len(values) == 2:
+        return lambda: random.uniform(values[0], values[1])
+    if kind == "lognormal" and len(values) == 2:
+        mu = math.log(values[0])
+        return lambda: random.lognormvariate(mu, values[1])
+    if kind == "exp" and len(values) == 1:
+        return lambda: random.expovariate(1 / values[0])
+    raise ValueError(f"Invalid latency spec: {spec}")
+
+
+@dataclass
+class UpstreamConfig:
+    """
+    Behaviour of one simulated upstream.
+
+    Attributes:
+        latency: Latency spec (see parse_latency)
+        error_rate: Fraction of requests answered with a server error
+        hang_rate: Fraction of requests that hang before answering
+    """
+
+    latency: str
+    error_rate: float = 0.0
+    hang_rate: float = 0.0
+
+    def __post_init__(self) -> None:
+        self.sample_latency = parse_latency(self.latency)
+
+
+@dataclass
+class SimulatorConfig:
+    """
+    Simulator settings.
+
+    Attributes:
+        host: Interface to bind
+        port: Port to listen on
+        inworld: InWorld behaviour (sessions, messages)
+        sd: Stability AI behaviour (generation, upscale)
+        stripe: Stripe behaviour
+        hang: Seconds a hanging request sleeps (beyond client timeouts)
+        image_size: Width and height of generated PNG artifacts
+        stream_chunk_delay: Seconds between streamed InWorld chunks
+        ws_drop_rate: Fraction of InWorld WebSocket events after which the
+            connection is dropped
+    """
+
+    host: str = "127.0.0.1"
+    port: int = 8100
+    inworld: UpstreamConfig = field(default_factory=lambda: UpstreamConfig("lognormal:0.4:0.5"))
+    sd: UpstreamConfig = field(default_factory=lambda: UpstreamConfig("uniform:8:15"))
+    stripe: UpstreamConfig = field(default_factory=lambda: UpstreamConfig("lognormal:0.25:0.3"))
+    hang: float = 120.0
+    image_size: int = 1024
+    stream_chunk_delay: float = 0.05
+    ws_drop_rate: float = 0.0
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    def env(self) -> Dict[str, str]:
+        """Backend environment variables pointing at this simulator."""
+        return {
+            "INWORLD_API_URL": f"{self.url}/inworld/v1",
+            "INWORLD_API_KEY": "sim",
+            "INWORLD_WORKSPACE_ID": "sim",
+            "SD_API_URL": f"{self.url}/sd",
+            "SD_API_KEY": "sim",
+            "STRIPE_API_BASE": f"{self.url}/stripe",
+            "STRIPE_SECRET_KEY": "sk_test_sim",
+        }
+
+
+@dataclass
+class StreamState:
+    """
+    Server side of one InWorld session stream, kept across reconnects.
+
+    Attributes:
+        seq: Sequence number of the last event
+        events: Recent events, replayed to a resuming client
+        seen: Message IDs already received
+        websocket: Current connection, if any
+    """
+
+    seq: int = 0
+    events: Deque[Dict[str, Any]] = field(default_factory=lambda: deque(maxlen=1000))
+    seen: Set[str] = field(default_factory=set)
+    websocket: Optional[WebSocket] = None
+
+
+# ============================================================================
+# Payloads
+# ============================================================================
+
+def make_png(size: int, seed: int) -> bytes:
+    """
+    Build a size x size RGB PNG with roughly the entropy of a generated image.
+
+    Half of each row is noise and half a gradient, so the file compresses to
+    about the size of a real Stable Diffusion artifact (1.5-2 MB at 1024 px).
+    """
+    rng = random.Random(seed)
+    half = size // 2
+    rows = []
+    for y in range(size):
+        noise = rng.randbytes(half * 3)
+        gradient = bytes((x + y) % 256 for x in range((size - half) * 3))
+        rows.append(b"\x00" + noise + gradient)
+
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return (
+            struct.pack(">I", len(data)) + kind + data
+            + struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF)
+        )
+
+    header = struct.pack(">IIBBBBB", size, size, 8, 2, 0, 0, 0)
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + chunk(b"IHDR", header)
+        + chunk(b"IDAT", zlib.compress(b"".join(rows), 6))
+        + chunk(b"IEND", b"")
+    )
+
+
+REPLIES = [
+    "Привет! Как твои дела? Рад тебя видеть!",
+    "That's really interesting! Tell me more about it.",
+    "Ммм, я проголодался! Спасибо, что заботишься!",
+    "I love hearing from you! What should we do today?",
+]
+
+EMOTIONS = ["happy", "neutral", "excited", "sad", "tired"]
+
+
+# ============================================================================
+# Application
+# ============================================================================
+
+def create_app(config: SimulatorConfig) -> FastAPI:
+    """
+    Build the simulator application.
+
+    Args:
+        config: Simulator settings; mutated by PATCH /_sim/config
+
+    Returns:
+        FastAPI application
+    """
+    app = FastAPI(title="Upstream simulator")
+    counters: Counter = Counter()
+    streams: Dict[str, StreamState] = {}
+    background: Set[asyncio.Task] = set()
+    # A few distinct artifacts, encoded once
+    artifacts = [
+        base64.b64encode(make_png(config.image_size, seed)).decode("ascii")
+        for seed in range(4)
+    ]
+
+    async def behave(name: str, upstream: UpstreamConfig) -> Optional[Response]:
+        """Apply latency and faults; returns a response to short-circuit with."""
+        counters[f"{name}.requests"] += 1
+        if random.random() < upstream.hang_rate:
+            counters[f"{name}.hangs"] += 1
+            await asyncio.sleep(config.hang)
+        await asyncio.sleep(max(0.0, upstream.sample_latency()))
+        if random.random() < upstream.error_rate:
+            counters[f"{name}.errors"] += 1
+            return JSONResponse(
+                status_code=random.choice(FAULT_STATUSES),
+                content={"error": "simulated upstream failure"},
+            )
+        return None
+
+    # ------------------------------------------------------------------------
+    # InWorld
+    # ------------------------------------------------------------------------
+
+    @app.post("/inworld/v1/workspaces/{workspace_id}/characters")
+    async def inworld_create_character(workspace_id: str, request: Request) -> Response:
+        if (fault := await behave("inworld", config.inworld)) is not None:
+            return fault
+        body = await request.json()
+        character_id = uuid.uuid4().hex[:12]
+        return JSONResponse(status_code=201, content={
+            "name": f"workspaces/{workspace_id}/characters/{character_id}",
+            "defaultSceneName": f"workspaces/{workspace_id}/scenes/{character_id}",
+            "displayName": body.get("displayName", "Companion"),
+        })
+
+    @app.patch("/inworld/v1/workspaces/{workspace_id}/characters/{character_id}")
+    async def inworld_update_character(workspace_id: str, character_id: str, request: Request) -> Response:
+        if (fault := await behave("inworld", config.inworld)) is not None:
+            return fault
+        body = await request.json()
+        return JSONResponse({
+            "name": f"workspaces/{workspace_id}/characters/{character_id}",
+            "displayName": body.get("displayName", "Companion"),
+        })
+
+    @app.post("/inworld/v1/sessions")
+    async def inworld_create_session(request: Request) -> Response:
+        if (fault := await behave("inworld", config.inworld)) is not None:
+            return fault
+        return JSONResponse({"sessionId": uuid.uuid4().hex})
+
+    @app.delete("/inworld/v1/sessions/{session_id}")
+    async def inworld_end_session(session_id: str) -> Response:
+        counters["inworld.sessions_ended"] += 1
+        return Response(status_code=204)
+
+    @app.post("/inworld/v1/sessions/{session_id}/messages")
+    async def inworld_message(session_id: str) -> Response:
+        if (fault := await behave("inworld", config.inworld)) is not None:
+            return fault
+        return JSONResponse({
+            "text": random.choice(REPLIES),
+            "emotion": random.choice(EMOTIONS),
+            "action": None,
+        })
+
+    @app.post("/inworld/v1/sessions/{session_id}/messages:stream")
+    async def inworld_message_stream(session_id: str) -> Response:
+        if (fault := await behave("inworld", config.inworld)) is not None:
+            return fault
+
+        async def events() -> AsyncIterator[bytes]:
+            for word in random.choice(REPLIES).split(" "):
+                yield (json.dumps({"text": word + " "}) + "\n").encode("utf-8")
+                await asyncio.sleep(config.stream_chunk_delay)
+            yield (json.dumps({"emotion": random.choice(EMOTIONS), "action": None}) + "\n").encode("utf-8")
+
+        return StreamingResponse(events(), media_type="application/x-ndjson")
+
+    @app.websocket("/inworld/v1/sessions/{session_id}/connect")
+    async def inworld_connect(websocket: WebSocket, session_id: str, resume: int = 0) -> None:
+        await websocket.accept()
+        counters["inworld.stream_connects"] += 1
+
+        state = streams.get(session_id)
+        if resume and state is not None and (not state.events or state.events[0]["seq"] <= resume + 1):
+            counters["inworld.stream_resumes"] += 1
+            await websocket.send_json({"type": "resumed"})
+            # Replay until caught up; events emitted meanwhile are only buffered
+            sent = resume
+            while missed := [e for e in state.events if e["seq"] > sent]:
+                for event in missed:
+                    await websocket.send_json(event)
+                    sent = event["seq"]
+        else:
+            if resume:
+                counters["inworld.stream_resets"] += 1
+                await websocket.send_json({"type": "reset"})
+            state = streams[session_id] = StreamState()
+        state.websocket = websocket
+
+        async def emit(event: Dict[str, Any]) -> None:
+            state.seq += 1
+            event["seq"] = state.seq
+            state.events.append(event)
+            current = state.websocket
+            if current is None:
+                return
+            try:
+                await current.send_json(event)
+            except Exception:
+                return
+            if random.random() < config.ws_drop_rate:
+                counters["inworld.stream_drops"] += 1
+                state.websocket = None
+                await current.close(code=1011)
+
+        async def reply(request_id: str) -> None:
+            upstream = config.inworld
+            if random.random() < upstream.hang_rate:
+                counters["inworld.hangs"] += 1
+                await asyncio.sleep(config.hang)
+            await asyncio.sleep(max(0.0, upstream.sample_latency()))
+            if random.random() < upstream.error_rate:
+                counters["inworld.errors"] += 1
+                await emit({"type": "error", "id": request_id, "detail": "simulated upstream failure"})
+                return
+            for word in random.choice(REPLIES).split(" "):
+                await emit({"type": "text", "id": request_id, "text": word + " "})
+                await asyncio.sleep(config.stream_chunk_delay)
+            await emit({"type": "done", "id": request_id, "emotion": random.choice(EMOTIONS), "action": None})
+
+        try:
+            while True:
+                frame = await websocket.receive_json()
+                if frame.get("type") != "message":
+                    continue
+                request_id = str(frame.get("id"))
+                await emit({"type": "ack", "id": request_id})
+                if request_id in state.seen:
+                    continue
+                state.seen.add(request_id)
+                counters["inworld.stream_messages"] += 1
+                task = asyncio.create_task(reply(request_id))
+                background.add(task)
+                task.add_done_callback(background.discard)
+        except (WebSocketDisconnect, RuntimeError):
+            pass
+        finally:
+            if state.websocket is websocket:
+                state.websocket = None
+
+    # ------------------------------------------------------------------------
+    # Stability AI
+    # ------------------------------------------------------------------------
+
+    @app.post("/sd/v1/generation/{engine}/text-to-image")
+    async def sd_text_to_image(engine: str, request: Request) -> Response:
+        if (fault := await behave("sd", config.sd)) is not None:
+            return fault
+        body = await request.json()
+        samples = int(body.get("samples", 1))
+        return JSONResponse({"artifacts": [
+            {
+                "base64": artifacts[i % len(artifacts)],
+                "seed": random.randrange(2 ** 32),
+                "finishReason": "SUCCESS",
+            }
+            for i in range(samples)
+        ]})
+
+    @app.post("/sd/v1/generation/{engine}/image-to-image/upscale")
+    async def sd_upscale(engine: str) -> Response:
+        if (fault := await behave("sd", config.sd)) is not None:
+            return fault
+        return JSONResponse({"artifacts": [
+            {"base64": artifacts[0], "seed": 0, "finishReason": "SUCCESS"},
+        ]})
+
+    # ------------------------------------------------------------------------
+    # Stripe (form-encoded requests, as sent by the stripe SDK)
+    # ------------------------------------------------------------------------
+
+    @app.post("/stripe/v1/checkout/sessions")
+    async def stripe_checkout(request: Request) -> Response:
+        if (fault := await behave("stripe", config.stripe)) is not None:
+            return fault
+        form = await request.form()
+        session_id = f"cs_sim_{uuid.uuid4().hex}"
+        return JSONResponse({
+            "id": session_id,
+            "object": "checkout.session",
+            "url": f"{form.get('success_url', config.url)}&session_id={session_id}",
+            "payment_status": "unpaid",
+        })
+
+    @app.post("/stripe/v1/payment_intents")
+    async def stripe_create_intent(request: Request) -> Response:
+        if (fault := await behave("stripe", config.stripe)) is not None:
+            return fault
+        form = await request.form()
+        intent_id = f"pi_sim_{uuid.uuid4().hex}"
+        return JSONResponse({
+            "id": intent_id,
+            "object": "payment_intent",
+            "amount": int(form.get("amount", 0)),
+            "currency": form.get("currency", "usd"),
+            "client_secret": f"{intent_id}_secret_sim",
+            "status": "requires_payment_method",
+            "metadata": {},
+        })
+
+    @app.get("/stripe/v1/payment_intents/{intent_id}")
+    async def stripe_get_intent(intent_id: str) -> Response:
+        if (fault := await behave("stripe", config.stripe)) is not None:
+            return fault
+        return JSONResponse({
+            "id": intent_id,
+            "object": "payment_intent",
+            "amount": 0,
+            "status": "succeeded",
+            "metadata": {},
+        })
+
+    @app.post("/stripe/v1/refunds")
+    async def stripe_refund(request: Request) -> Response:
+        if (fault := await behave("stripe", config.stripe)) is not None:
+            return fault
+        form = await request.form()
+        return JSONResponse({
+            "id": f"re_sim_{uuid.uuid4().hex}",
+            "object": "refund",
+            "payment_intent": form.get("payment_intent"),
+            "status": "succeeded",
+        })
+
+    # ------------------------------------------------------------------------
+    # Control
+    # ------------------------------------------------------------------------
+
+    @app.get("/_sim/stats")
+    async def sim_stats() -> Dict[str, Any]:
+        return dict(counters)
+
+    @app.patch("/_sim/config")
+    async def sim_config(request: Request) -> Dict[str, Any]:
+        """Update upstream behaviour, e.g. {"inworld": {"error_rate": 0.5}}."""
+        changes = await request.json()
+        for name in ("inworld", "sd", "stripe"):
+            if name in changes:
+                current = asdict(getattr(config, name))
+                current.update(changes[name])
+                setattr(config, name, UpstreamConfig(**current))
+        for name in ("hang", "stream_chunk_delay", "ws_drop_rate"):
+            if name in changes:
+                setattr(config, name, float(changes[name]))
+        return {name: asdict(getattr(config, name)) for name in ("inworld", "sd", "stripe")}
+
+    return app
+
+
+# ============================================================================
+# Running
+# ============================================================================
+
+class SimulatorThread:
+    """Simulator served by uvicorn in a background thread."""
+
+    def __init__(self, config: SimulatorConfig):
+        self.config = config
+        self.server = uvicorn.Server(uvicorn.Config(
+            create_app(config),
+            host=config.host,
+            port=config.port,
+            log_level="warning",
+        ))
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+
+    def start(self, timeout: float = 30.0) -> "SimulatorThread":
+        self.thread.start()
+        deadline = time.monotonic() + timeout
+        while not self.server.started:
+            if time.monotonic() > deadline or not self.thread.is_alive():
+                raise RuntimeError("Upstream simulator failed to start")
+            time.sleep(0.05)
+        return self
+
+    def stop(self) -> None:
+        self.server.should_exit = True
+        self.thread.join()
+
+
+def run_in_thread(config: Optional[SimulatorConfig] = None) -> SimulatorThread:
+    """
+    Start the simulator in this process.
+
+    Args:
+        config: Simulator settings (defaults to SimulatorConfig())
+
+    Returns:
+        Running simulator; call ``stop()`` when done
+    """
+    return SimulatorThread(config or SimulatorConfig()).start()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    defaults = SimulatorConfig()
+    for name in ("inworld", "sd", "stripe"):
+        upstream = getattr(defaults, name)
+        parser.add_argument(f"--{name}-latency", default=upstream.latency)
+        parser.add_argument(f"--{name}-error-rate", type=float, default=0.0)
+        parser.add_argument(f"--{name}-hang-rate", type=float, default=0.0)
+    parser.add_argument("--hang", type=float, default=defaults.hang,
+                        help="seconds a hanging request sleeps")
+    parser.add_argument("--image-size", type=int, default=defaults.image_size,
+                        help="width and height of generated PNG artifacts")
+    parser.add_argument("--stream-chunk-delay", type=float, default=defaults.stream_chunk_delay)
+    parser.add_argument("--ws-drop-rate", type=float, default=defaults.ws_drop_rate,
+                        help="fraction of InWorld WebSocket events followed by a dropped connection")
+    args = parser.parse_args()
+
+    config = SimulatorConfig(
+        host=args.host,
+        port=args.port,
+        hang=args.hang,
+        image_size=args.image_size,
+        stream_chunk_delay=args.stream_chunk_delay,
+        ws_drop_rate=args.ws_drop_rate,
+        **{
+            name: UpstreamConfig(
+                latency=getattr(args, f"{name}_latency"),
+                error_rate=getattr(args, f"{name}_error_rate"),
+                hang_rate=getattr(args, f"{name}_hang_rate"),
+            )
+            for name in ("inworld", "sd", "stripe")
+        },
+    )
+
+    print("Point the backend at the simulator with:")
+    for key, value in config.env().items():
+        print(f"  {key}={value}")
+
+    uvicorn.run(create_app(config), host=config.host, port=config.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()